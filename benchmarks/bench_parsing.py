@@ -0,0 +1,103 @@
+"""
+Micro-benchmark of the HTML extraction backends on saved page fixtures.
+
+Every installed backend (selectolax, lxml, bs4) parses the Douban comment
+and movie page fixtures and must return exactly what bs4 returns; the
+Maoyan board page compares the old DOTALL regex against the bounded
+AppData scan.
+
+    python benchmarks/bench_parsing.py [--repeat 200]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, '豆瓣'))
+sys.path.insert(0, os.path.join(ROOT, '猫眼'))
+
+from common.extract import Page, available_backends, embedded_json, get_backend
+import pages
+from boards import APP_DATA_MARKER
+
+
+def load(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def timed(func, repeat):
+    """Best-of-three mean seconds per call."""
+    func()
+    best = None
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        elapsed = (time.perf_counter() - started) / repeat
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def comment_page(html, backend):
+    page = Page(html, backend)
+    return pages.parse_comments(page), pages.parse_total_comments(page)
+
+
+def movie_page(html, backend):
+    page = Page(html, backend)
+    info = page.fields(pages.MOVIE_FIELDS)
+    return info, pages.parse_hot_comments(page)
+
+
+def report(title, rows):
+    print(f"\n{title}")
+    baseline = rows[-1][1]
+    for name, seconds in rows:
+        print(f"  {name:<12} {seconds * 1000:8.3f} ms/page {1 / seconds:10.0f} pages/s {baseline / seconds:6.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=200, help='calls per timing round')
+    args = parser.parse_args()
+
+    backends = [name for name in ('selectolax', 'lxml', 'bs4') if name in available_backends()]
+    if 'bs4' not in backends:
+        sys.exit('beautifulsoup4 is required as the reference backend')
+    print(f"backends: {', '.join(backends)}; repeat={args.repeat}")
+
+    for fixture, extract in (('douban_comments.html', comment_page), ('douban_subject.html', movie_page)):
+        html = load(fixture)
+        expected = extract(html, get_backend('bs4'))
+        rows = []
+        for name in backends:
+            backend = get_backend(name)
+            if extract(html, backend) != expected:
+                sys.exit(f"{name} disagrees with bs4 on {fixture}")
+            rows.append((name, timed(lambda: extract(html, backend), args.repeat)))
+        report(f"{fixture} ({len(html) // 1024} KiB)", rows)
+
+    html = load('maoyan_board.html')
+
+    def legacy_regex():
+        return json.loads(re.search(r'var AppData = ({.*?});', html, re.DOTALL).group(1))
+
+    def bounded_scan():
+        return embedded_json(html, APP_DATA_MARKER)
+
+    if legacy_regex() != bounded_scan():
+        sys.exit("AppData scan disagrees with the regex")
+    report(f"maoyan_board.html ({len(html) // 1024} KiB) AppData", [
+        ('raw_decode', timed(bounded_scan, args.repeat)),
+        ('regex', timed(legacy_regex, args.repeat)),
+    ])
+
+
+if __name__ == '__main__':
+    main()
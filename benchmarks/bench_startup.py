@@ -0,0 +1,111 @@
+"""
+Cold-start benchmark: app import time and first-request latency of fresh processes.
+
+Each run starts a new interpreter, imports the app, waits --idle-ms (a
+worker rarely gets its first request the instant it boots), then times the
+first request that needs jieba: a comment search on Douban, the word cloud
+on Maoyan (after an untimed board scrape from the local stub server). Three
+modes are compared:
+
+    eager   jieba, wordcloud and matplotlib.pyplot imported up front and the
+            dictionary built on first use, as the apps used to do
+    lazy    heavy modules imported on first use, no warm-up (JIEBA_WARMUP=0)
+    warm    lazy imports plus the background dictionary warm-up (default)
+
+    python benchmarks/bench_startup.py [--runs 5] [--idle-ms 1000]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_server import StubServer
+
+MODES = ('eager', 'lazy', 'warm')
+
+# (app directory, module, untimed setup request or '', first request)
+APPS = {
+    'douban': ('豆瓣', 'douban', '', '/api/search?q=剧情精彩'),
+    'maoyan': ('猫眼', 'maoyan', '/api/scrape', '/api/wordcloud'),
+}
+
+CHILD = r'''
+import importlib, json, sys, time
+started = time.perf_counter()
+app_dir, module, mode, idle, setup, url = sys.argv[1:]
+sys.path.insert(0, app_dir)
+if mode == 'eager':
+    import jieba, wordcloud, matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot
+app = importlib.import_module(module).app
+imported = time.perf_counter()
+client = app.test_client()
+if setup:
+    client.post(setup, json={})
+time.sleep(float(idle))
+requested = time.perf_counter()
+response = client.get(url)
+response.get_data()
+finished = time.perf_counter()
+print(json.dumps({'status': response.status_code, 'import_ms': (imported - started) * 1000,
+                  'first_ms': (finished - requested) * 1000}))
+'''
+
+
+def run_once(app, mode, idle, env):
+    app_dir, module, setup, url = APPS[app]
+    env = dict(env, JIEBA_WARMUP='0' if mode != 'warm' else '1')
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD, os.path.join(ROOT, app_dir), module, mode, str(idle), setup, url],
+        env=env, capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(f"{app} ({mode}) failed:\n{result.stderr}")
+    # The apps print progress to stdout as well
+    measurement = json.loads(next(line for line in result.stdout.splitlines() if line.startswith('{"status"')))
+    if measurement['status'] >= 400:
+        raise RuntimeError(f"{app} ({mode}) first request answered {measurement['status']}")
+    return measurement
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes per app and mode')
+    parser.add_argument('--idle-ms', type=float, default=1000, help='wait between import and the first request')
+    parser.add_argument('--only', choices=sorted(APPS))
+    args = parser.parse_args()
+
+    stub = StubServer().start()
+    scratch = tempfile.mkdtemp(prefix='bench-startup-')
+    env = dict(os.environ,
+               DOUBAN_DB_PATH=os.path.join(scratch, 'douban.db'),
+               DOUBAN_POLITENESS_DB=os.path.join(scratch, 'politeness.db'),
+               DOUBAN_HTTP_CACHE=os.path.join(scratch, 'http.db'),
+               MAOYAN_CACHE_DIR=os.path.join(scratch, 'maoyan'),
+               MAOYAN_BOARD_URL=stub.maoyan_board_url,
+               MAOYAN_DETAIL_URL=stub.maoyan_detail_url,
+               MAOYAN_DETAIL_CONCURRENCY='0')
+
+    print(f"{'app':<8}{'mode':<8}{'import ms':>12}{'first ms':>12}{'total ms':>12}   (medians of {args.runs} runs)")
+    try:
+        for app in [args.only] if args.only else APPS:
+            # An untimed run leaves the pickled dictionary on disk, as after a worker's first boot
+            run_once(app, 'warm', 0, env)
+            for mode in MODES:
+                runs = [run_once(app, mode, args.idle_ms / 1000, env) for _ in range(args.runs)]
+                import_ms = statistics.median(r['import_ms'] for r in runs)
+                first_ms = statistics.median(r['first_ms'] for r in runs)
+                total_ms = statistics.median(r['import_ms'] + r['first_ms'] for r in runs)
+                print(f"{app:<8}{mode:<8}{import_ms:12.0f}{first_ms:12.0f}{total_ms:12.0f}")
+    finally:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Record real Douban and Maoyan responses as fixtures for the stub server.
+
+    python benchmarks/record.py --douban https://movie.douban.com/subject/1292052/ --pages 5 --maoyan --details 30
+
+Responses are written to benchmarks/fixtures/recorded/ with a manifest keyed
+like the stub server's routes; recording again replaces matching entries and
+keeps the others. Douban may require a logged-in cookie (--cookie) beyond the
+first comment pages.
+"""
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, '猫眼'))
+
+from common.fetcher import AsyncFetcher
+from stub_server import MANIFEST, RECORDED_DIR, route_key
+import boards
+import details
+
+DOUBAN_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Referer': 'https://movie.douban.com/',
+}
+
+
+class Recorder:
+    def __init__(self, directory=RECORDED_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = {}
+
+    def add(self, url, response):
+        key = route_key(url)
+        name = key.replace(':', '_') + ('.json' if key.startswith('maoyan_detail') else '.html')
+        with open(os.path.join(self.directory, name), 'wb') as f:
+            f.write(response.content)
+        self.manifest[key] = {
+            'file': name,
+            'url': url,
+            'status': response.status_code,
+            'content_type': response.headers.get('Content-Type', 'text/html; charset=utf-8'),
+        }
+        print(f"{response.status_code} {len(response.content):>8} B  {key}")
+
+    def save(self):
+        path = os.path.join(self.directory, MANIFEST)
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(f"{path}.tmp", path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--douban', metavar='URL', help='Douban movie page to record with its comment pages')
+    parser.add_argument('--pages', type=int, default=3, help='Douban comment pages (20 comments each)')
+    parser.add_argument('--cookie', help='Cookie header for Douban')
+    parser.add_argument('--maoyan', action='store_true', help='record every Maoyan board')
+    parser.add_argument('--details', type=int, default=0, help='Maoyan film details to record')
+    args = parser.parse_args()
+    if not args.douban and not args.maoyan:
+        parser.error('nothing to record, pass --douban and/or --maoyan')
+
+    recorder = Recorder()
+    # Politely sequential, recording is a one-off
+    fetcher = AsyncFetcher(pool_size=2, per_host=1, timeout=15, retries=2)
+    try:
+        if args.douban:
+            headers = dict(DOUBAN_HEADERS, Cookie=args.cookie) if args.cookie else DOUBAN_HEADERS
+            base_url = args.douban.split('?')[0].rstrip('/') + '/'
+            recorder.add(base_url, fetcher.get(base_url, headers=headers))
+            for page in range(args.pages):
+                url = f"{base_url}comments?status=P&start={page * 20}"
+                recorder.add(url, fetcher.get(url, headers=headers, delay=1.0))
+
+        if args.maoyan:
+            movie_ids = []
+            for board_id in boards.BOARDS:
+                url = boards.board_url(board_id)
+                response = fetcher.get(url, headers=boards.board_headers(board_id), delay=1.0)
+                recorder.add(url, response)
+                try:
+                    movie_ids += [m['猫眼ID'] for m in boards.parse_board(response, board_id)]
+                except boards.ScrapeError as e:
+                    print(f"  {e}")
+            for movie_id in list(dict.fromkeys(movie_ids))[:args.details]:
+                url = details.DETAIL_URL.format(movie_id=movie_id)
+                recorder.add(url, fetcher.get(url, headers=details.DETAIL_HEADERS, delay=0.5))
+    finally:
+        fetcher.close()
+        recorder.save()
+    print(f"{len(recorder.manifest)} recorded responses in {recorder.directory}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""
+Offline benchmarks of the Douban and Maoyan crawlers, analysis and endpoints.
+
+Both apps are pointed at a local stub server (recorded fixtures, or
+synthetic pages where nothing was recorded) and at a scratch database and
+cache directory, so runs are reproducible and never touch the real sites or
+the apps' own data. For every benchmark the report gives throughput,
+p50/p95/p99 latency and the tracemalloc peak of one extra traced run (kept
+out of the timings, tracing slows Python down several times).
+
+    python benchmarks/run.py
+    python benchmarks/run.py --latency-ms 40 --jitter-ms 20 --error-rate 0.05 --only douban_crawl
+    python benchmarks/run.py --json after.json --baseline before.json --tolerance 0.2
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stub_server import StubServer
+
+
+def percentile(samples, q):
+    """Linearly interpolated q-th percentile of a sorted list."""
+    if len(samples) == 1:
+        return samples[0]
+    pos = (len(samples) - 1) * q / 100
+    lo, hi = math.floor(pos), math.ceil(pos)
+    return samples[lo] + (samples[hi] - samples[lo]) * (pos - lo)
+
+
+def measure(name, func, iterations, warmup=1):
+    """
+    Time iterations calls of func (after warmup untimed ones), then one
+    traced call for peak memory. func may return the number of items it
+    processed (comments, films...) to also report items per second.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(warmup):
+            func()
+        samples = []
+        items = 0
+        for _ in range(iterations):
+            started = time.perf_counter()
+            count = func()
+            samples.append(time.perf_counter() - started)
+            items += count or 0
+
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    samples.sort()
+    total = sum(samples)
+    return {
+        'name': name,
+        'iterations': iterations,
+        'ops_per_s': iterations / total if total else None,
+        'items_per_s': items / total if items and total else None,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+        'peak_kib': peak / 1024,
+    }
+
+
+def douban_benchmarks(stub, args):
+    import douban
+    from analysis import DoubanAnalysis
+    from common.render_cache import WordCloudCache
+
+    subject_ids = iter(range(1000000, 2000000))
+
+    def crawl():
+        # A new movie each time, so every run inserts rather than merges
+        ok, message = douban.crawl_douban(stub.douban_url(next(subject_ids)), target_count=args.target)
+        if not ok:
+            raise RuntimeError(message)
+        return args.target
+
+    yield 'douban_crawl', crawl, args.iterations
+
+    # The remaining benchmarks read one crawled movie
+    subject_id = str(next(subject_ids))
+    douban.crawl_douban(stub.douban_url(subject_id), target_count=args.target)
+    scratch = tempfile.mkdtemp(prefix='bench-wordcloud-')
+
+    def analysis():
+        # A cold analysis cache; tokens are already stored with the comments
+        analyzer = DoubanAnalysis(douban.storage, tokenizer=douban.analyzer.tokenizer,
+                                  wordcloud_cache=WordCloudCache(scratch))
+        analyzer.get_rating_statistics(subject_id)
+        analyzer.get_word_frequency(subject_id=subject_id)
+        return args.target
+
+    def wordcloud():
+        analyzer = DoubanAnalysis(douban.storage, tokenizer=douban.analyzer.tokenizer,
+                                  wordcloud_cache=WordCloudCache(tempfile.mkdtemp(dir=scratch)))
+        analyzer.get_wordcloud_png(subject_id)
+
+    yield 'douban_analysis', analysis, args.iterations
+    yield 'douban_wordcloud', wordcloud, args.iterations
+
+    client = douban.app.test_client()
+    for name, url in (
+        ('douban_api_comments', f'/api/comments?subject_id={subject_id}&limit=50'),
+        ('douban_api_comments_filtered', f'/api/comments?subject_id={subject_id}&limit=50&sort=rating_desc&star=力荐,推荐'),
+        ('douban_api_search', f'/api/search?q=剧情精彩&subject_id={subject_id}'),
+        ('douban_api_movies', '/api/movies'),
+        ('douban_wordcloud_png', f'/wordcloud.png?subject_id={subject_id}'),
+    ):
+        yield name, endpoint(client, url), args.requests
+
+
+def maoyan_benchmarks(stub, args):
+    import maoyan
+
+    def scrape():
+        # Details are fetched on the warmup run and then served from the detail cache
+        result = maoyan.scrape_maoyan_movies(maoyan.ALL_BOARDS)
+        return len(result['movies'])
+
+    yield 'maoyan_scrape', scrape, args.iterations
+
+    client = maoyan.app.test_client()
+    client.post('/api/scrape', json={'force': True})
+    for name, url in (
+        ('maoyan_api_data', '/api/data'),
+        ('maoyan_api_movies', '/api/movies'),
+        ('maoyan_api_boards', '/api/boards'),
+        ('maoyan_api_stats', '/api/stats?board=all'),
+        ('maoyan_api_history_movement', '/api/history/movement?board=4'),
+        ('maoyan_api_wordcloud', '/api/wordcloud'),
+    ):
+        yield name, endpoint(client, url), args.requests
+
+
+def endpoint(client, url):
+    def request():
+        response = client.get(url)
+        response.get_data()
+        if response.status_code >= 400:
+            raise RuntimeError(f"{url} answered {response.status_code}")
+    return request
+
+
+def print_report(results, stub):
+    print(f"\n{'benchmark':<32}{'ops/s':>10}{'items/s':>11}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KiB':>11}")
+    for r in results:
+        if 'error' in r:
+            print(f"{r['name']:<32}  failed: {r['error']}")
+            continue
+        items = f"{r['items_per_s']:11.0f}" if r['items_per_s'] else f"{'-':>11}"
+        print(f"{r['name']:<32}{r['ops_per_s']:10.1f}{items}{r['p50_ms']:10.2f}{r['p95_ms']:10.2f}"
+              f"{r['p99_ms']:10.2f}{r['peak_kib']:11.0f}")
+    print(f"\nstub server: {stub.stats}")
+
+
+def compare(results, baseline_path, tolerance):
+    """Names of benchmarks whose p50 or peak memory grew beyond tolerance against a baseline run."""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {r['name']: r for r in json.load(f)['results'] if 'error' not in r}
+    regressions = []
+    for r in results:
+        before = baseline.get(r['name'])
+        if before is None or 'error' in r:
+            continue
+        for metric in ('p50_ms', 'peak_kib'):
+            if before[metric] and r[metric] > before[metric] * (1 + tolerance):
+                regressions.append(f"{r['name']} {metric}: {before[metric]:.2f} -> {r[metric]:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=5, help='timed runs of the crawl and analysis benchmarks')
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per endpoint')
+    parser.add_argument('--target', type=int, default=500, help='comments per Douban crawl')
+    parser.add_argument('--latency-ms', type=float, default=0, help='stub server latency per request')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='extra random latency, up to this much')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of requests answered with --error-status')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--only', help='comma separated benchmark name prefixes')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000, error_rate=args.error_rate,
+                      error_status=args.error_status, total_comments=max(args.target * 2, 200)).start()
+    scratch = tempfile.mkdtemp(prefix='bench-')
+    # Read by the apps at import time
+    os.environ['DOUBAN_DB_PATH'] = os.path.join(scratch, 'douban.db')
+    os.environ['DOUBAN_POLITENESS_DB'] = os.path.join(scratch, 'politeness.db')
+    os.environ['DOUBAN_HTTP_CACHE'] = os.path.join(scratch, 'http.db')
+    os.environ['MAOYAN_CACHE_DIR'] = os.path.join(scratch, 'maoyan')
+    os.environ['MAOYAN_BOARD_URL'] = stub.maoyan_board_url
+    os.environ['MAOYAN_DETAIL_URL'] = stub.maoyan_detail_url
+    sys.path.insert(0, os.path.join(ROOT, '豆瓣'))
+    sys.path.insert(0, os.path.join(ROOT, '猫眼'))
+    print(f"stub server {stub.url} ({len(stub.recorded)} recorded responses), scratch data in {scratch}")
+
+    prefixes = args.only.split(',') if args.only else None
+    results = []
+    for suite in (douban_benchmarks, maoyan_benchmarks):
+        if prefixes and not any(p.split('_')[0] == suite.__name__.split('_')[0] for p in prefixes):
+            continue
+        for name, func, iterations in suite(stub, args):
+            if prefixes and not any(name.startswith(p) for p in prefixes):
+                continue
+            print(f"running {name}...", flush=True)
+            try:
+                results.append(measure(name, func, iterations))
+            except Exception as e:
+                results.append({'name': name, 'error': f"{type(e).__name__}: {e}"})
+
+    print_report(results, stub)
+    stub.stop()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
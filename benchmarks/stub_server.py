@@ -0,0 +1,210 @@
+"""
+Local stand-in for Douban and Maoyan, for benchmarks that must not touch
+the real sites.
+
+Routes mirror the upstream paths the crawlers request. A route is answered
+with its recorded response (see record.py) when there is one, otherwise with
+a synthetic page. Latency, jitter and error injection are configurable.
+Pages carry an ETag, and conditional requests for unchanged pages get 304.
+
+    python benchmarks/stub_server.py --port 8765 --latency-ms 30 --error-rate 0.05
+"""
+import argparse
+import hashlib
+import http.server
+import json
+import os
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import synthetic
+
+RECORDED_DIR = os.path.join(synthetic.FIXTURES, 'recorded')
+MANIFEST = 'manifest.json'
+
+
+def route_key(url):
+    """
+    Key of the upstream resource behind a URL, shared by the recorder and the
+    stub, or None for paths the crawlers never request.
+    """
+    parts = urlsplit(url)
+    query = parse_qs(parts.query)
+    if re.search(r'/subject/\d+/comments$', parts.path):
+        return f"douban_comments:{query.get('start', ['0'])[0]}"
+    if re.search(r'/subject/\d+/?$', parts.path):
+        return 'douban_subject'
+    match = re.search(r'/asgard/board/(\d+)$', parts.path)
+    if match:
+        return f"maoyan_board:{match.group(1)}"
+    if parts.path.endswith('/ajax/detailmovie') and 'movieId' in query:
+        return f"maoyan_detail:{query['movieId'][0]}"
+    return None
+
+
+def load_recorded(directory=RECORDED_DIR):
+    """{route key: (status, content type, body)} of recorded responses."""
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    recorded = {}
+    for key, entry in manifest.items():
+        with open(os.path.join(directory, entry['file']), 'rb') as f:
+            recorded[key] = (entry['status'], entry['content_type'], f.read())
+    return recorded
+
+
+class StubServer:
+    """
+    Threaded HTTP server answering the crawler routes.
+
+    Each request waits latency plus up to jitter seconds; with probability
+    error_rate it is answered with error_status instead. Synthetic Douban
+    movies announce total_comments comments.
+    """
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503,
+                 total_comments=2000, recorded=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.total_comments = total_comments
+        self.recorded = load_recorded() if recorded is None else recorded
+        self.stats = {'requests': 0, 'errors': 0, 'recorded': 0, 'synthetic': 0, 'not_found': 0, 'not_modified': 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def douban_url(self, subject_id=1292052):
+        return f"{self.url}/subject/{subject_id}/"
+
+    @property
+    def maoyan_board_url(self):
+        return f"{self.url}/asgard/board/{{board_id}}"
+
+    @property
+    def maoyan_detail_url(self):
+        return f"{self.url}/ajax/detailmovie?movieId={{movie_id}}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='stub-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _delay_and_fail(self):
+        """Seconds to wait before answering, and whether to inject an error."""
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.error_rate
+        return delay, fail
+
+    def respond(self, path):
+        """(status, content type, body) for a request path."""
+        key = route_key(path)
+        if key in self.recorded:
+            self._count('recorded')
+            return self.recorded[key]
+        if key is None:
+            self._count('not_found')
+            return 404, 'text/plain', b'not found'
+
+        self._count('synthetic')
+        kind, _, arg = key.partition(':')
+        if kind == 'douban_subject':
+            body, content_type = synthetic.douban_subject(), 'text/html; charset=utf-8'
+        elif kind == 'douban_comments':
+            body, content_type = synthetic.douban_comments(int(arg), self.total_comments), 'text/html; charset=utf-8'
+        elif kind == 'maoyan_board':
+            body, content_type = synthetic.maoyan_board(int(arg)), 'text/html; charset=utf-8'
+        else:
+            body, content_type = synthetic.maoyan_detail(int(arg)), 'application/json; charset=utf-8'
+        return 200, content_type, body.encode('utf-8')
+
+    def _handler(self):
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            # Keep-alive, so the crawlers' connection pools behave as against the real sites
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub._count('requests')
+                delay, fail = stub._delay_and_fail()
+                if delay:
+                    time.sleep(delay)
+                if fail:
+                    stub._count('errors')
+                    status, content_type, body = stub.error_status, 'text/plain', b'injected error'
+                else:
+                    status, content_type, body = stub.respond(self.path)
+                etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+                if status == 200 and self.headers.get('If-None-Match') == etag:
+                    stub._count('not_modified')
+                    status, body = 304, b''
+                self.send_response(status)
+                if status in (200, 304):
+                    self.send_header('ETag', etag)
+                if status != 304:
+                    self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recorded or synthetic Douban/Maoyan pages locally.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--total-comments', type=int, default=2000)
+    args = parser.parse_args()
+
+    stub = StubServer(args.port, args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate,
+                      args.error_status, args.total_comments).start()
+    print(f"Douban movie:  {stub.douban_url()}")
+    print(f"Maoyan boards: MAOYAN_BOARD_URL={stub.maoyan_board_url}")
+    print(f"Maoyan detail: MAOYAN_DETAIL_URL={stub.maoyan_detail_url}")
+    print(f"{len(stub.recorded)} recorded responses, everything else is synthetic; Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Synthetic Douban and Maoyan responses for offline benchmarks.
+
+Pages are built from the saved fixtures, so they keep the size and markup of
+the real pages, with deterministic generated comments and films in place of
+the recorded ones. The stub server falls back to these for every route that
+has no recorded response.
+"""
+import json
+import os
+import random
+import re
+import time
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+PAGE_SIZE = 20
+STARS = (('allstar50', '力荐'), ('allstar40', '推荐'), ('allstar30', '还行'), ('allstar20', '较差'), ('allstar10', '很差'))
+WORDS = ('这部 电影 真的 非常 好看 演员 表演 精彩 剧情 紧凑 节奏 拖沓 画面 配乐 导演 故事 结局 感动 '
+         '失望 一般 值得 推荐 二刷 台词 特效 人物 塑造 立体 逻辑 硬伤').split()
+# Comment n of a movie was posted n hours after this, so higher ids are newer
+EPOCH = 1600000000
+
+COMMENT_ITEM = '''
+<div class="comment-item " data-cid="{cid}">
+    <div class="avatar"><a title="用户{cid}" href="https://www.douban.com/people/u{cid}/"><img src="https://img1.doubanio.com/icon/u{cid}-1.jpg" class="" /></a></div>
+    <div class="comment">
+        <h3>
+            <span class="comment-vote"><span class="votes vote-count">{votes}</span><input value="{cid}" type="hidden"/><a href="javascript:;" data-id="{cid}" class="j a_show_login" onclick="">有用</a></span>
+            <span class="comment-info">
+                <a href="https://www.douban.com/people/u{cid}/" class="">用户{cid}</a>
+                <span>看过</span>
+                <span class="{star_class} rating" title="{star}"></span>
+                <span class="comment-time " title="{date}">{date}</span>
+                <span class="comment-location">北京</span>
+            </span>
+        </h3>
+        <p class=" comment-content"><span class="short">{text}</span></p>
+    </div>
+</div>'''
+
+_templates = {}
+
+
+def _load(name):
+    if name not in _templates:
+        with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+            _templates[name] = f.read()
+    return _templates[name]
+
+
+def douban_subject():
+    """A movie page (title, rating, summary and five hot comments)."""
+    return _load('douban_subject.html')
+
+
+def douban_comment(number):
+    rng = random.Random(number)
+    star_class, star = rng.choice(STARS)
+    return COMMENT_ITEM.format(
+        cid=number,
+        votes=rng.randint(0, 9999),
+        star_class=star_class,
+        star=star,
+        date=time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(EPOCH + number * 3600)),
+        text=''.join(rng.choice(WORDS) for _ in range(rng.randint(6, 40))),
+    )
+
+
+def douban_comments(start, total):
+    """
+    Comment page starting at offset start of a movie with total comments,
+    newest first; pages past the end are empty like on Douban.
+    """
+    html = _load('douban_comments.html')
+    head, rest = html.split('<div class="mod-bd" id="comments">', 1)
+    _, tail = rest.split('\n</div><div id="paginator"', 1)
+    head = re.sub(r'看过\(\d+\)', f'看过({total})', head)
+    items = ''.join(douban_comment(total - k) for k in range(start, min(start + PAGE_SIZE, total)))
+    return f'{head}<div class="mod-bd" id="comments">{items}\n</div><div id="paginator"{tail}'
+
+
+def board_movie_ids(board_id, count=100):
+    """Films of a board; boards overlap partly, as the real ones do."""
+    rng = random.Random(board_id)
+    return rng.sample(range(1200000, 1200000 + count * 3), count)
+
+
+def maoyan_board(board_id, count=100):
+    """A board page with its films embedded as var AppData = {...};"""
+    movies = []
+    for movie_id in board_movie_ids(board_id, count):
+        rng = random.Random(movie_id)
+        movies.append({
+            'id': movie_id,
+            'nm': f'电影{movie_id}',
+            'sc': round(rng.uniform(6.0, 9.8), 1) if board_id != 6 else 0,
+            'rt': f'{rng.randint(1950, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            'img': f'https://p0.pipi.cn/mmdb/{movie_id:08x}.jpg?imageMogr2/thumbnail/w.h',
+            'star': ','.join(f'演员{rng.randint(1, 500)}' for _ in range(3)),
+        })
+    html = _load('maoyan_board.html')
+    head, rest = html.split('var AppData = ', 1)
+    _, tail = rest.split(';\nvar AppTracking', 1)
+    data = {'data': {'title': f'榜单{board_id}', 'movies': movies}, 'pageName': 'board', 'query': {'id': str(board_id)}}
+    return f"{head}var AppData = {json.dumps(data, ensure_ascii=False)};\nvar AppTracking{tail}"
+
+
+def maoyan_detail(movie_id):
+    """Detail JSON of a film as served by /ajax/detailmovie."""
+    rng = random.Random(movie_id)
+    return json.dumps({'detailMovie': {
+        'id': movie_id,
+        'nm': f'电影{movie_id}',
+        'cat': rng.choice(('剧情', '剧情,爱情', '动作,冒险', '喜剧', '动画,家庭')),
+        'dur': rng.randint(80, 180),
+        'dir': f'导演{rng.randint(1, 200)}',
+        'star': ','.join(f'演员{rng.randint(1, 500)}' for _ in range(4)),
+        'sumBox': f'{rng.randint(100, 500000)}万',
+    }}, ensure_ascii=False)
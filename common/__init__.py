@@ -0,0 +1 @@
+"""Infrastructure shared by the Douban and Maoyan crawlers."""
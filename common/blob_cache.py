@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import threading
+
+
+class BlobWriter:
+    """Receives a body chunk by chunk, hashing it while it is spooled to disk."""
+
+    def __init__(self, cache, key, content_type):
+        self.cache = cache
+        self.key = key
+        self.content_type = content_type
+        self._hash = hashlib.sha256()
+        self._tmp_path = os.path.join(cache.directory, f"{threading.get_ident()}.{id(self)}.tmp")
+        self._file = open(self._tmp_path, 'wb')
+
+    def write(self, chunk):
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self):
+        """Publish the blob and point key at it; returns its digest."""
+        self._file.close()
+        digest = self._hash.hexdigest()
+        path = self.cache._blob_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Content stored before under another key takes no extra space
+        added = 0 if os.path.exists(path) else os.path.getsize(self._tmp_path)
+        os.replace(self._tmp_path, path)
+        self.cache._write_ref(self.key, digest, self.content_type)
+        self.cache._grow(added)
+        return digest
+
+    def abort(self):
+        """Drop a partial body, e.g. when the upstream or the client went away."""
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+
+class BlobCache:
+    """
+    Content-addressed files on disk.
+
+    Bodies are stored once under the sha256 of their content (which doubles
+    as the HTTP ETag); keys such as URLs map to a digest through small ref
+    files, so identical content fetched under several keys is kept once.
+    Blobs are evicted least recently used first beyond max_bytes, together
+    with the refs pointing at them. The stored size is kept as a running
+    total, so the directory is only scanned once it goes over budget; eviction
+    then frees a tenth of max_bytes of headroom.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(directory, 'blobs'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'refs'), exist_ok=True)
+        self._lock = threading.Lock()
+        # Bytes in blobs/, counted on first write (other processes may add to it,
+        # the scan on eviction corrects the total)
+        self._total = None
+
+    def _blob_path(self, digest):
+        return os.path.join(self.directory, 'blobs', digest[:2], digest)
+
+    def _ref_path(self, key):
+        name = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, 'refs', f"{name}.json")
+
+    def _write_ref(self, key, digest, content_type):
+        path = self._ref_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'key': key, 'digest': digest, 'content_type': content_type}, f)
+        os.replace(tmp_path, path)
+
+    def lookup(self, key):
+        """(digest, content_type, path) of the blob stored for key, or None."""
+        try:
+            with open(self._ref_path(key), encoding='utf-8') as f:
+                ref = json.load(f)
+        except (OSError, ValueError):
+            return None
+        path = self._blob_path(ref['digest'])
+        try:
+            # Reads refresh the LRU position
+            os.utime(path)
+        except OSError:
+            return None
+        return ref['digest'], ref['content_type'], path
+
+    def read(self, key):
+        """(digest, content_type, bytes) stored for key, or None."""
+        entry = self.lookup(key)
+        if entry is None:
+            return None
+        digest, content_type, path = entry
+        try:
+            with open(path, 'rb') as f:
+                return digest, content_type, f.read()
+        except OSError:
+            return None
+
+    def writer(self, key, content_type):
+        return BlobWriter(self, key, content_type)
+
+    def put(self, key, data, content_type):
+        """Store a complete body for key; returns its digest."""
+        writer = self.writer(key, content_type)
+        writer.write(data)
+        return writer.commit()
+
+    def _blobs(self):
+        """(mtime, size, path) of every blob on disk."""
+        entries = []
+        blobs = os.path.join(self.directory, 'blobs')
+        for shard in os.listdir(blobs):
+            shard_path = os.path.join(blobs, shard)
+            for name in os.listdir(shard_path):
+                path = os.path.join(shard_path, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _grow(self, size):
+        with self._lock:
+            if self._total is None:
+                self._total = sum(size for _, size, _ in self._blobs())
+            else:
+                self._total += size
+            over = self._total > self.max_bytes
+        if over:
+            self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = self._blobs()
+            total = sum(size for _, size, _ in entries)
+            evicted = set()
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    evicted.add(os.path.basename(path))
+                except OSError:
+                    pass
+            self._total = total
+            if evicted:
+                self._drop_refs(evicted)
+
+    def _drop_refs(self, digests):
+        """Remove the refs pointing at any of these digests."""
+        refs = os.path.join(self.directory, 'refs')
+        for name in os.listdir(refs):
+            path = os.path.join(refs, name)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    digest = json.load(f)['digest']
+            except (OSError, ValueError, KeyError):
+                continue
+            if digest in digests:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,208 @@
+import json
+import os
+from collections import namedtuple
+
+# Backends in order of preference when HTML_PARSER is unset or "auto"
+BACKEND_ORDER = ('selectolax', 'lxml', 'bs4')
+
+_decoder = json.JSONDecoder()
+
+
+def has_class(name):
+    """XPath predicate equivalent to the CSS class selector .name"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+class Selector:
+    """
+    A CSS selector together with the equivalent XPath (relative to the node
+    it is applied to), so every backend gets a form it can run natively.
+    The XPath is compiled once, on first use with lxml.
+    """
+
+    def __init__(self, css, xpath):
+        self.css = css
+        self.xpath = xpath
+        self._all = None
+        self._first = None
+
+    def compiled(self):
+        if self._all is None:
+            from lxml import etree
+            self._first = etree.XPath(f"({self.xpath})[1]")
+            self._all = etree.XPath(self.xpath)
+        return self._all, self._first
+
+    def __repr__(self):
+        return f"Selector({self.css!r})"
+
+
+# A value to extract: the stripped text of the first match, or one of its attributes
+Field = namedtuple('Field', 'selector attr', defaults=(None,))
+
+
+class SelectolaxBackend:
+    name = 'selectolax'
+
+    def __init__(self):
+        try:
+            from selectolax.lexbor import LexborHTMLParser as parser
+        except ImportError:
+            from selectolax.parser import HTMLParser as parser
+        self._parser = parser
+
+    def parse(self, html):
+        return self._parser(html)
+
+    def select(self, node, selector):
+        return node.css(selector.css)
+
+    def first(self, node, selector):
+        return node.css_first(selector.css)
+
+    def text(self, node):
+        return node.text(deep=True)
+
+    def attr(self, node, name):
+        return node.attributes.get(name)
+
+
+class LxmlBackend:
+    name = 'lxml'
+
+    def __init__(self):
+        import lxml.html
+        self._html = lxml.html
+
+    def parse(self, html):
+        if not html.strip():
+            html = '<html></html>'
+        return self._html.document_fromstring(html)
+
+    def select(self, node, selector):
+        return selector.compiled()[0](node)
+
+    def first(self, node, selector):
+        matches = selector.compiled()[1](node)
+        return matches[0] if matches else None
+
+    def text(self, node):
+        return node.text_content()
+
+    def attr(self, node, name):
+        return node.get(name)
+
+
+class SoupBackend:
+    name = 'bs4'
+
+    def __init__(self):
+        from bs4 import BeautifulSoup
+        self._soup = BeautifulSoup
+
+    def parse(self, html):
+        return self._soup(html, 'html.parser')
+
+    def select(self, node, selector):
+        return node.select(selector.css)
+
+    def first(self, node, selector):
+        return node.select_one(selector.css)
+
+    def text(self, node):
+        return node.get_text()
+
+    def attr(self, node, name):
+        return node.get(name)
+
+
+BACKENDS = {
+    'selectolax': SelectolaxBackend,
+    'lxml': LxmlBackend,
+    'bs4': SoupBackend,
+}
+_instances = {}
+
+
+def get_backend(name=None):
+    """
+    The named parser backend, or the configured one (HTML_PARSER environment
+    variable, default "auto": the fastest installed of selectolax, lxml, bs4).
+    """
+    name = name or os.environ.get('HTML_PARSER', 'auto')
+    if name in _instances:
+        return _instances[name]
+    if name == 'auto':
+        for candidate in BACKEND_ORDER:
+            try:
+                backend = get_backend(candidate)
+            except ImportError:
+                continue
+            _instances['auto'] = backend
+            return backend
+        raise ImportError("No HTML parser installed (selectolax, lxml or beautifulsoup4)")
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown HTML parser {name!r}, expected one of {', '.join(BACKENDS)}")
+    backend = _instances[name] = BACKENDS[name]()
+    return backend
+
+
+def available_backends():
+    """Names of the backends whose parser library is installed."""
+    names = []
+    for name in BACKENDS:
+        try:
+            get_backend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+class Page:
+    """A parsed HTML document with field extraction on top of one backend."""
+
+    def __init__(self, html, backend=None):
+        self.backend = backend or get_backend()
+        self.root = self.backend.parse(html)
+
+    def _value(self, node, field):
+        match = self.backend.first(node, field.selector)
+        if match is None:
+            return None
+        if field.attr:
+            return self.backend.attr(match, field.attr)
+        return self.backend.text(match).strip()
+
+    def text(self, selector):
+        """Stripped text of the first node matching selector, or None."""
+        return self._value(self.root, Field(selector))
+
+    def fields(self, fields):
+        """{name: value} for a {name: Field} mapping; missing values are None."""
+        return {name: self._value(self.root, field) for name, field in fields.items()}
+
+    def records(self, item, fields):
+        """One {name: value} dict per node matching the item selector."""
+        return [
+            {name: self._value(node, field) for name, field in fields.items()}
+            for node in self.backend.select(self.root, item)
+        ]
+
+
+def embedded_json(text, marker):
+    """
+    Decode the JSON value assigned after marker in a page, e.g. the object
+    in "var AppData = {...};". The value is decoded straight from the marker
+    position, so the scan ends with the value instead of backtracking over
+    the rest of the page. Returns None when the marker is missing and
+    raises json.JSONDecodeError when what follows is not valid JSON.
+    """
+    start = text.find(marker)
+    if start < 0:
+        return None
+    idx = start + len(marker)
+    while idx < len(text) and text[idx] in ' \t\r\n':
+        idx += 1
+    value, _ = _decoder.raw_decode(text, idx)
+    return value
@@ -0,0 +1,339 @@
+import asyncio
+import atexit
+import contextlib
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from . import metrics
+
+
+class FetchError(Exception):
+    """Raised when a URL could not be fetched after all retries."""
+
+    def __init__(self, url, error):
+        super().__init__(f"{url}: {error!r}")
+        self.url = url
+        self.error = error
+
+
+class FetchResult:
+    """A fully read HTTP response, shaped like the parts of requests.Response we use."""
+
+    # Set when the fetcher's Politeness recognized the response as a block
+    blocked = False
+    # 'hit', 'revalidated' or 'offline' when the body came from the fetcher's HttpCache
+    from_cache = None
+
+    def __init__(self, url, status_code, headers, content, elapsed, encoding=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        # Seconds spent on the final attempt
+        self.elapsed = elapsed
+        self.encoding = encoding
+
+    @property
+    def ok(self):
+        return 200 <= self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+
+class StreamedResponse:
+    """
+    An HTTP response whose body is read chunk by chunk on demand, so large
+    bodies pass through without being buffered. Iterate it or close() it,
+    otherwise the pooled connection is not released.
+    """
+
+    def __init__(self, loop, response, elapsed):
+        self.url = str(response.url)
+        self.status_code = response.status
+        self.headers = response.headers.copy()
+        # Seconds until the response headers arrived
+        self.elapsed = elapsed
+        self._host = urlsplit(self.url).hostname or ''
+        self._loop = loop
+        self._response = response
+
+    @property
+    def ok(self):
+        return 200 <= self.status_code < 400
+
+    def iter_content(self, chunk_size=64 * 1024):
+        """Yield the body in chunks of at most chunk_size bytes."""
+        try:
+            while self._response is not None:
+                chunk = asyncio.run_coroutine_threadsafe(
+                    self._response.content.read(chunk_size), self._loop
+                ).result()
+                if not chunk:
+                    break
+                metrics.HTTP_BYTES.inc(len(chunk), host=self._host)
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        response, self._response = self._response, None
+        if response is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(response.release)
+
+
+class RequestBudget:
+    """
+    Cap on the requests in flight and on the request rate, shared by every
+    fetch given budget=..., e.g. all movies of a batch crawl. rate is in
+    requests per second (None for no cap); up to burst requests may start
+    at once after an idle period. Only used on the fetcher's loop thread.
+    """
+
+    def __init__(self, concurrency=16, rate=None, burst=None):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst or max(1, min(concurrency, int(rate or 1)))
+        self._semaphore = None
+        self._next_slot = 0.0
+
+    async def __aenter__(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        await self._semaphore.acquire()
+        if self.rate:
+            # Requests are spaced 1/rate apart, a burst may reach back into the idle time
+            now = asyncio.get_running_loop().time()
+            slot = max(self._next_slot, now - (self.burst - 1) / self.rate)
+            self._next_slot = slot + 1 / self.rate
+            if slot > now:
+                await asyncio.sleep(slot - now)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._semaphore.release()
+
+
+class AsyncFetcher:
+    """
+    Asyncio HTTP client running on its own event loop thread.
+
+    All requests share one keep-alive connection pool (bounded in total and
+    per host), so a process can keep hundreds of fetches in flight without a
+    thread per request. Synchronous code uses submit()/get()/map().
+
+    With a Politeness, fetches wait for their host's rate limit, go out
+    under one of its browser identities (a session of its own on the same
+    connection pool) and blocks are retried under another identity.
+
+    With an HttpCache, fresh stored responses are answered from disk without
+    a request, stale ones are revalidated with a conditional request, and
+    in offline mode nothing goes to the network at all.
+    """
+
+    # Statuses worth retrying: throttling and transient server errors
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, pool_size=100, per_host=8, timeout=10, retries=2, backoff=0.5, max_backoff=8.0,
+                 politeness=None, cache=None):
+        self.pool_size = pool_size
+        self.politeness = politeness
+        self.cache = cache
+        self.per_host = per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._loop = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        """Start the event loop thread and the pooled session on first use."""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='async-fetcher', daemon=True)
+                thread.start()
+                self._session = asyncio.run_coroutine_threadsafe(self._create_session(), loop).result()
+                self._loop = loop
+                atexit.register(self.close)
+            return self._loop
+
+    async def _create_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_size,
+            limit_per_host=self.per_host,
+            ttl_dns_cache=300,
+            keepalive_timeout=30
+        )
+        if self.politeness is not None:
+            # Each identity keeps its own headers and cookies; the connections are shared
+            for identity in self.politeness.identities:
+                identity.session = aiohttp.ClientSession(
+                    connector=connector, connector_owner=False, headers=identity.headers,
+                    cookie_jar=aiohttp.CookieJar(unsafe=True))
+        return aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.CookieJar(unsafe=True))
+
+    @staticmethod
+    def _request_headers(identity, headers):
+        """Headers the request goes out with, as far as the cache's Vary keys are concerned."""
+        return dict(identity.headers if identity else {}, **(headers or {}))
+
+    def _cached_result(self, entry, source, elapsed=0.0):
+        result = FetchResult(entry.url, entry.status, entry.headers, entry.content, elapsed, entry.encoding)
+        result.from_cache = source
+        return result
+
+    def _backoff_delay(self, attempt):
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    async def fetch(self, url, headers=None, timeout=None, retries=None, delay=0, timings=None, budget=None,
+                    identity_key=None, use_cache=True):
+        """
+        Fetch url on the loop thread, retrying transient failures.
+        Each attempt is timed as a fetch stage, also into timings if given,
+        and waits for a slot of the RequestBudget if one is given. Requests
+        with the same identity_key keep the same Politeness identity.
+        use_cache=False bypasses the HttpCache for this request.
+        """
+        loop = asyncio.get_running_loop()
+        cache = self.cache if use_cache else None
+        identity = self.politeness.identities.choose(identity_key) if self.politeness else None
+        entry = None
+        if cache is not None:
+            entry = await loop.run_in_executor(None, cache.lookup, url, self._request_headers(identity, headers))
+            if entry is not None and (entry.fresh or cache.offline):
+                metrics.cache_result('http', 'hit')
+                return self._cached_result(entry, 'offline' if cache.offline else 'hit')
+            if cache.offline:
+                metrics.cache_result('http', 'miss')
+                return FetchResult(url, 504, {}, b'', 0.0)
+
+        if delay:
+            await asyncio.sleep(delay)
+        retries = self.retries if retries is None else retries
+        host = urlsplit(url).hostname or ''
+        client_timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+        conditions = entry.conditional_headers() if entry is not None else {}
+        result, error = None, None
+        for attempt in range(retries + 1):
+            if attempt and self.politeness:
+                identity = self.politeness.identities.choose(identity_key)
+            session = identity.session if identity else self._session
+            # Time spent waiting for the budget or the host's rate limit is not part of the response time
+            async with budget or contextlib.nullcontext():
+                if self.politeness:
+                    await self.politeness.wait(host, timings)
+                started = time.perf_counter()
+                try:
+                    async with session.get(url, headers=dict(headers or {}, **conditions),
+                                           timeout=client_timeout) as resp:
+                        content = await resp.read()
+                        result = FetchResult(
+                            str(resp.url), resp.status, resp.headers.copy(), content,
+                            time.perf_counter() - started, resp.charset
+                        )
+                    error = None
+                    metrics.HTTP_RESPONSES.inc(host=host, status=result.status_code)
+                    metrics.HTTP_BYTES.inc(len(content), host=host)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    result, error = None, e
+                    metrics.HTTP_RESPONSES.inc(host=host, status='error')
+                metrics.record('fetch', time.perf_counter() - started, timings)
+
+            if result is not None and self.politeness:
+                result.blocked = await self.politeness.observe(
+                    host, identity, result, urlsplit(result.url).hostname or '')
+            if result is not None and result.status_code not in self.RETRY_STATUSES and not result.blocked:
+                if cache is not None:
+                    return await self._cache_response(cache, url, identity, headers, entry, result)
+                return result
+            if attempt < retries:
+                metrics.HTTP_RETRIES.inc(host=host)
+                await asyncio.sleep(self._backoff_delay(attempt))
+
+        if result is not None:
+            return result
+        raise FetchError(url, error)
+
+    async def _cache_response(self, cache, url, identity, headers, entry, result):
+        """Store a fresh response, or serve the cached body of one the server reports unchanged."""
+        loop = asyncio.get_running_loop()
+        if result.status_code == 304 and entry is not None:
+            metrics.cache_result('http', 'stale')
+            entry = await loop.run_in_executor(None, cache.refresh, entry, result.headers)
+            return self._cached_result(entry, 'revalidated', result.elapsed)
+        metrics.cache_result('http', 'miss')
+        if result.status_code == 200:
+            await loop.run_in_executor(None, cache.store, url, self._request_headers(identity, headers), result)
+        return result
+
+    async def _open(self, url, headers=None, timeout=None, retries=None, timings=None):
+        retries = self.retries if retries is None else retries
+        host = urlsplit(url).hostname or ''
+        # No total deadline: the body may take long, but each read must make progress
+        timeout = timeout or self.timeout
+        client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+        error = None
+        for attempt in range(retries + 1):
+            started = time.perf_counter()
+            try:
+                resp = await self._session.get(url, headers=headers, timeout=client_timeout)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+                metrics.HTTP_RESPONSES.inc(host=host, status='error')
+            else:
+                metrics.HTTP_RESPONSES.inc(host=host, status=resp.status)
+                metrics.record('fetch', time.perf_counter() - started, timings)
+                if resp.status not in self.RETRY_STATUSES or attempt == retries:
+                    return StreamedResponse(asyncio.get_running_loop(), resp, time.perf_counter() - started)
+                resp.release()
+            if attempt < retries:
+                metrics.HTTP_RETRIES.inc(host=host)
+                await asyncio.sleep(self._backoff_delay(attempt))
+        raise FetchError(url, error)
+
+    def stream(self, url, **kwargs):
+        """Blocking request returning once headers arrived; the body is streamed (StreamedResponse)."""
+        kwargs.setdefault('timings', metrics.current_timings())
+        return asyncio.run_coroutine_threadsafe(self._open(url, **kwargs), self._ensure_loop()).result()
+
+    def submit(self, url, **kwargs):
+        """Schedule a fetch from any thread, returns a concurrent.futures.Future."""
+        # The loop thread cannot see the caller's thread-local timings, so pass them along
+        kwargs.setdefault('timings', metrics.current_timings())
+        return asyncio.run_coroutine_threadsafe(self.fetch(url, **kwargs), self._ensure_loop())
+
+    def get(self, url, **kwargs):
+        """Blocking fetch."""
+        return self.submit(url, **kwargs).result()
+
+    def map(self, urls, **kwargs):
+        """Fetch many URLs concurrently; failed entries are FetchError instances."""
+        futures = [self.submit(url, **kwargs) for url in urls]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except FetchError as e:
+                results.append(e)
+        return results
+
+    def close(self):
+        """Close the pooled session and stop the loop thread."""
+        with self._lock:
+            if self._loop is None:
+                return
+            loop, self._loop = self._loop, None
+            if self.politeness is not None:
+                for identity in self.politeness.identities:
+                    asyncio.run_coroutine_threadsafe(identity.session.close(), loop).result()
+            asyncio.run_coroutine_threadsafe(self._session.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
@@ -0,0 +1,242 @@
+import email.utils
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit
+
+from multidict import CIMultiDict
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT NOT NULL,
+    -- Values of the request headers named by the response's Vary header
+    vary_key TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    encoding TEXT,
+    -- zlib-compressed body and its compressed size
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (url, vary_key)
+);
+CREATE INDEX IF NOT EXISTS idx_responses_used ON responses(used_at);
+'''
+
+# Last-Modified heuristic (RFC 9111 4.2.2): a tenth of the document's age, at most a day
+HEURISTIC_FRACTION = 0.1
+MAX_HEURISTIC_TTL = 24 * 3600
+# Used-at stamps are refreshed at most this often, so hits rarely write
+TOUCH_INTERVAL = 60
+EVICT_EVERY = 50
+
+
+def _cache_control(headers):
+    directives = {}
+    for part in headers.get('Cache-Control', '').split(','):
+        name, _, value = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"')
+    return directives
+
+
+def _http_date(value):
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp() if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _vary_names(headers):
+    """Lowercased request header names the response varies on, or None for Vary: *."""
+    names = sorted({name.strip().lower() for name in headers.get('Vary', '').split(',') if name.strip()})
+    return None if '*' in names else names
+
+
+def _vary_key(names, request_headers):
+    values = {name.lower(): value for name, value in request_headers.items()}
+    return json.dumps([[name, values.get(name, '')] for name in names], ensure_ascii=False)
+
+
+class CacheEntry:
+    """A stored response, decompressed."""
+
+    def __init__(self, url, vary_key, status, headers, encoding, content, stored_at, expires_at):
+        self.url = url
+        self.vary_key = vary_key
+        self.status = status
+        self.headers = headers
+        self.encoding = encoding
+        self.content = content
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+
+    @property
+    def fresh(self):
+        return time.time() < self.expires_at
+
+    def conditional_headers(self):
+        """If-None-Match / If-Modified-Since for revalidating this entry."""
+        conditions = {}
+        if self.headers.get('ETag'):
+            conditions['If-None-Match'] = self.headers['ETag']
+        if self.headers.get('Last-Modified'):
+            conditions['If-Modified-Since'] = self.headers['Last-Modified']
+        return conditions
+
+
+class HttpCache:
+    """
+    GET responses on disk in SQLite, bodies zlib-compressed, keyed by URL
+    and the request headers named by the response's Vary header.
+
+    An entry stays fresh as long as the response's Cache-Control max-age or
+    Expires allow. Without either, it is a tenth of the Last-Modified age,
+    or else ttls[host] (default_ttl for other hosts). Stale entries are
+    revalidated with If-None-Match / If-Modified-Since. In offline mode
+    (offline=True or HTTP_CACHE_OFFLINE=1), the fetcher serves every entry
+    whatever its age and answers misses with 504, without touching the
+    network. Least recently used entries go once the bodies exceed
+    max_bytes.
+    """
+
+    def __init__(self, db_path, default_ttl=0, ttls=None, max_bytes=512 * 1024 * 1024, offline=None):
+        self.db_path = db_path
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.max_bytes = max_bytes
+        if offline is None:
+            offline = os.environ.get('HTTP_CACHE_OFFLINE', '0') not in ('', '0')
+        self.offline = offline
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stores = 0
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def lifetime(self, url, headers, now=None):
+        """Seconds a response stays fresh, or None when it must not be stored."""
+        now = now or time.time()
+        directives = _cache_control(headers)
+        if 'no-store' in directives:
+            return None
+        if 'no-cache' in directives:
+            return 0
+        date = _http_date(headers.get('Date')) or now
+        if 'max-age' in directives:
+            try:
+                age = float(headers.get('Age', 0))
+                return max(0.0, float(directives['max-age']) - age)
+            except ValueError:
+                return 0
+        if 'Expires' in headers:
+            expires = _http_date(headers['Expires'])
+            return max(0.0, expires - date) if expires else 0
+        last_modified = _http_date(headers.get('Last-Modified'))
+        if last_modified and last_modified < date:
+            return min(MAX_HEURISTIC_TTL, (date - last_modified) * HEURISTIC_FRACTION)
+        return self.ttls.get(urlsplit(url).hostname or '', self.default_ttl)
+
+    def lookup(self, url, request_headers):
+        """The stored response to url for these request headers, fresh or not, or None."""
+        conn = self._connect()
+        rows = conn.execute(
+            'SELECT url, vary_key, status, headers, encoding, body, stored_at, expires_at, used_at '
+            'FROM responses WHERE url = ?', (url,)
+        ).fetchall()
+        for row in rows:
+            names = [name for name, _ in json.loads(row['vary_key'])]
+            if _vary_key(names, request_headers) != row['vary_key']:
+                continue
+            now = time.time()
+            if now - row['used_at'] > TOUCH_INTERVAL:
+                with conn:
+                    conn.execute('UPDATE responses SET used_at = ? WHERE url = ? AND vary_key = ?',
+                                 (now, url, row['vary_key']))
+            return CacheEntry(url, row['vary_key'], row['status'], CIMultiDict(json.loads(row['headers'])),
+                              row['encoding'], zlib.decompress(row['body']), row['stored_at'], row['expires_at'])
+        return None
+
+    def store(self, url, request_headers, result):
+        """Store a 200 FetchResult unless its headers forbid it; returns whether it was stored."""
+        if result.status_code != 200:
+            return False
+        names = _vary_names(result.headers)
+        now = time.time()
+        lifetime = self.lifetime(url, result.headers, now)
+        if names is None or lifetime is None:
+            return False
+        body = zlib.compress(result.content)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO responses '
+                '(url, vary_key, status, headers, encoding, body, size, stored_at, expires_at, used_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, _vary_key(names, request_headers), result.status_code,
+                 json.dumps(list(result.headers.items()), ensure_ascii=False), result.encoding,
+                 body, len(body), now, now + lifetime, now)
+            )
+        with self._lock:
+            self._stores += 1
+            evict = self._stores % EVICT_EVERY == 0
+        if evict:
+            self._evict()
+        return True
+
+    def refresh(self, entry, headers):
+        """
+        Apply the headers of a 304 answer to a revalidated entry: they replace
+        the stored ones they name and restart its freshness lifetime.
+        """
+        merged = CIMultiDict(entry.headers)
+        for name in set(headers.keys()):
+            if name.lower() not in ('content-length', 'content-encoding', 'transfer-encoding'):
+                merged[name] = headers[name]
+        now = time.time()
+        lifetime = self.lifetime(entry.url, merged, now) or 0
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE responses SET headers = ?, stored_at = ?, expires_at = ?, used_at = ? '
+                'WHERE url = ? AND vary_key = ?',
+                (json.dumps(list(merged.items()), ensure_ascii=False), now, now + lifetime, now,
+                 entry.url, entry.vary_key)
+            )
+        entry.headers, entry.stored_at, entry.expires_at = merged, now, now + lifetime
+        return entry
+
+    def _evict(self):
+        """Drop least recently used entries until the bodies fit in max_bytes again."""
+        conn = self._connect()
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes * 0.9
+        doomed = []
+        for row in conn.execute('SELECT rowid, size FROM responses ORDER BY used_at'):
+            if excess <= 0:
+                break
+            doomed.append((row['rowid'],))
+            excess -= row['size']
+        with conn:
+            conn.executemany('DELETE FROM responses WHERE rowid = ?', doomed)
+
+    def stats(self):
+        """Entry count and stored (compressed) bytes."""
+        row = self._connect().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        return {'entries': row[0], 'bytes': row[1]}
@@ -0,0 +1,326 @@
+import bisect
+import contextlib
+import os
+import threading
+import time
+
+# Seconds; covers a cached lookup up to a slow multi-page crawl
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """The metrics of a process, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    """A monotonically increasing count, one series per label combination."""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def series(self):
+        """{label values: count} snapshot."""
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self):
+        for key, value in sorted(self.series().items()):
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Gauge(_Metric):
+    """A value computed on each scrape by function(), which returns {label values: value}."""
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.function = function
+
+    def samples(self):
+        for key, value in sorted(self.function().items()):
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count."""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                yield f"{self.name}_bucket", labels, cumulative
+            yield f"{self.name}_sum", _format_labels(self.labelnames, key), total
+            yield f"{self.name}_count", _format_labels(self.labelnames, key), count
+
+
+# Metrics shared by both apps
+STAGE_SECONDS = Histogram(
+    'crawler_stage_seconds', 'Duration of hot-path stages (fetch, parse, tokenize, wordcloud_render, export).',
+    ['stage'])
+HTTP_RESPONSES = Counter(
+    'crawler_http_responses_total', 'Upstream HTTP attempts by host and status ("error" when no response).',
+    ['host', 'status'])
+HTTP_RETRIES = Counter('crawler_http_retries_total', 'Upstream HTTP attempts that were retried.', ['host'])
+HTTP_BYTES = Counter('crawler_http_received_bytes_total', 'Upstream response body bytes received.', ['host'])
+PAGE_RETRIES = Counter('crawler_page_retries_total', 'Comment pages scheduled again after a failed fetch.')
+PAGES_FETCHED = Counter(
+    'crawler_pages_total', 'Comment page fetches by listing crawl (full, incremental, backfill).', ['crawl'])
+PAGE_BACKOFFS = Counter(
+    'crawler_page_backoffs_total', 'Times a listing crawl halved its concurrency on errors or slow pages.',
+    ['crawl'])
+CACHE_REQUESTS = Counter(
+    'crawler_cache_requests_total', 'Cache lookups by cache and result (hit, stale or miss).',
+    ['cache', 'result'])
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Duration of requests served by the app.',
+    ['endpoint', 'method', 'status'])
+
+
+def _cache_hit_ratios():
+    totals = {}
+    for (cache, result), count in CACHE_REQUESTS.series().items():
+        hits, lookups = totals.get(cache, (0, 0))
+        totals[cache] = (hits + (count if result in ('hit', 'stale') else 0), lookups + count)
+    return {(cache,): hits / lookups for cache, (hits, lookups) in totals.items() if lookups}
+
+
+CACHE_HIT_RATIO = Gauge('crawler_cache_hit_ratio', 'Share of cache lookups answered from the cache.', ['cache'],
+                        function=_cache_hit_ratios)
+
+
+def cache_result(cache, result):
+    """Count one lookup of cache; result is 'hit', 'stale' or 'miss'."""
+    CACHE_REQUESTS.inc(cache=cache, result=result)
+
+
+class Timings:
+    """
+    Per-stage totals of one unit of work (a request, a crawl job), for
+    Server-Timing headers. Stages that ran concurrently add up, so a stage
+    can exceed the wall time of the work.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, count=1):
+        with self._lock:
+            total, n = self.stages.get(stage, (0.0, 0))
+            self.stages[stage] = (total + seconds, n + count)
+
+    def merge(self, other):
+        """Add the stages of another Timings (or its to_dict() form)."""
+        stages = other.to_dict() if isinstance(other, Timings) else other
+        for stage, entry in stages.items():
+            self.add(stage, entry['ms'] / 1000, entry['count'])
+
+    def to_dict(self):
+        with self._lock:
+            return {stage: {'ms': round(total * 1000, 2), 'count': n} for stage, (total, n) in self.stages.items()}
+
+    def header(self, total=True):
+        """Server-Timing header value, e.g. 'fetch;dur=120.5;desc="6x", total;dur=131.2'."""
+        parts = [f'{stage};dur={entry["ms"]};desc="{entry["count"]}x"' for stage, entry in self.to_dict().items()]
+        if total:
+            parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ', '.join(parts)
+
+
+_local = threading.local()
+
+
+def current_timings():
+    """The Timings being collected on this thread, or None."""
+    return getattr(_local, 'timings', None)
+
+
+@contextlib.contextmanager
+def collect(timings=None):
+    """Collect the stages timed on this thread into timings (a new Timings by default)."""
+    timings = timings or Timings()
+    previous = current_timings()
+    _local.timings = timings
+    try:
+        yield timings
+    finally:
+        _local.timings = previous
+
+
+def record(stage, seconds, timings=None):
+    """Record a stage duration measured elsewhere, e.g. on the fetcher's loop thread."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = timings or current_timings()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextlib.contextmanager
+def timed(stage):
+    """Time the enclosed block as one run of stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def timed_iter(stage, iterable):
+    """
+    Yield from iterable, e.g. a streamed export, recording the time spent
+    producing the items (not the time the consumer takes) as one run of stage.
+    """
+    iterator = iter(iterable)
+    total = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                total += time.perf_counter() - started
+            yield item
+    finally:
+        record(stage, total)
+
+
+def instrument_app(app, server_timing=None):
+    """
+    Time every request of a Flask app, add a Server-Timing header with the
+    stages it ran (unless disabled by server_timing=False or SERVER_TIMING=0)
+    and serve all metrics on /metrics.
+    """
+    from flask import Response, g, request
+
+    if server_timing is None:
+        server_timing = os.environ.get('SERVER_TIMING', '1') != '0'
+
+    @app.before_request
+    def _start_timings():
+        g.metrics_timings = Timings()
+        g.metrics_previous = current_timings()
+        _local.timings = g.metrics_timings
+
+    @app.after_request
+    def _finish_timings(response):
+        timings = g.pop('metrics_timings', None)
+        if timings is None:
+            return response
+        REQUEST_SECONDS.observe(time.perf_counter() - timings.started, endpoint=request.endpoint or 'unknown',
+                                method=request.method, status=response.status_code)
+        if server_timing:
+            response.headers['Server-Timing'] = timings.header()
+        return response
+
+    @app.teardown_request
+    def _stop_timings(exc):
+        _local.timings = g.pop('metrics_previous', None)
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+    return app
@@ -0,0 +1,276 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from . import metrics
+
+# Statuses sites answer a crawler they have blocked with
+BLOCK_STATUSES = {403, 418}
+
+# Each profile's headers belong together, e.g. only Chrome sends client hints
+BROWSER_PROFILES = (
+    {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+        'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+        'sec-ch-ua': '"Chromium";v="124", "Google Chrome";v="124", "Not-A.Brand";v="99"',
+        'sec-ch-ua-mobile': '?0',
+        'sec-ch-ua-platform': '"Windows"',
+    },
+    {
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+        'Accept-Language': 'zh-CN,zh;q=0.9',
+        'sec-ch-ua': '"Chromium";v="124", "Google Chrome";v="124", "Not-A.Brand";v="99"',
+        'sec-ch-ua-mobile': '?0',
+        'sec-ch-ua-platform': '"macOS"',
+    },
+    {
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Safari/605.1.15',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'Accept-Language': 'zh-CN,zh-Hans;q=0.9',
+    },
+    {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+        'Accept-Language': 'zh-CN,zh;q=0.8,zh-TW;q=0.7,zh-HK;q=0.5,en-US;q=0.3,en;q=0.2',
+    },
+)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS host_limits (
+    host TEXT PRIMARY KEY,
+    -- Earliest time (epoch seconds) the next request may start at the current rate
+    next_slot REAL NOT NULL,
+    rate REAL NOT NULL,
+    blocked_until REAL NOT NULL DEFAULT 0,
+    strikes INTEGER NOT NULL DEFAULT 0,
+    successes INTEGER NOT NULL DEFAULT 0
+)
+'''
+
+BLOCKED = metrics.Counter(
+    'crawler_blocked_total', 'Responses recognized as blocks (403/418 or a block page).', ['host'])
+
+# Last rate seen per host by this process, for the gauge and to skip needless writes
+_host_rates = {}
+
+HOST_RATE = metrics.Gauge(
+    'crawler_host_rate', 'Requests per second currently allowed per host.', ['host'],
+    function=lambda: {(host,): rate for host, rate in dict(_host_rates).items()})
+
+
+class HostLimits:
+    """
+    Per-host token buckets kept in SQLite, so every thread and process
+    using the same db_path shares one request rate per host.
+
+    Hosts listed in rates get that many requests per second, in bursts of
+    up to `burst` after an idle period; other hosts are not limited. A block
+    halves the host's rate (down to min_rate) and pauses it for a cooldown
+    that doubles with each consecutive block, up to max_cooldown. After
+    recover_after unblocked responses the rate climbs back by a quarter of
+    the configured rate.
+    """
+
+    def __init__(self, db_path, rates, burst=4, min_rate=0.2, cooldown=30.0, max_cooldown=600.0,
+                 recover_after=20):
+        self.db_path = db_path
+        self.rates = dict(rates)
+        self.burst = burst
+        self.min_rate = min_rate
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.recover_after = recover_after
+        self._local = threading.local()
+        if self.rates:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._connect().execute(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit, transactions are opened explicitly with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def limited(self, host):
+        return host in self.rates
+
+    def recovering(self, host):
+        """Whether host runs below its configured rate, as far as this process knows."""
+        return host in self.rates and _host_rates.get(host, self.rates[host]) < self.rates[host]
+
+    def _update(self, host, change):
+        """Run change(state, now, base_rate) on the host's row in one write transaction."""
+        base = self.rates[host]
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = conn.execute('SELECT * FROM host_limits WHERE host = ?', (host,)).fetchone()
+            state = dict(row) if row else {
+                'host': host, 'next_slot': 0.0, 'rate': base, 'blocked_until': 0.0, 'strikes': 0, 'successes': 0
+            }
+            # The configured rate may have been lowered since the row was written
+            state['rate'] = min(state['rate'], base)
+            result = change(state, now, base)
+            conn.execute(
+                'INSERT OR REPLACE INTO host_limits (host, next_slot, rate, blocked_until, strikes, successes) '
+                'VALUES (:host, :next_slot, :rate, :blocked_until, :strikes, :successes)', state)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        _host_rates[host] = state['rate']
+        return result
+
+    def reserve(self, host):
+        """Reserve the host's next request slot; returns the seconds to wait for it."""
+        if host not in self.rates:
+            return 0.0
+
+        def take(state, now, base):
+            rate = state['rate']
+            slot = max(state['next_slot'], now - (self.burst - 1) / rate, state['blocked_until'])
+            state['next_slot'] = slot + 1 / rate
+            return slot - now
+
+        return max(0.0, self._update(host, take))
+
+    def report(self, host, blocked):
+        """Feed back whether a response from host was a block."""
+        if host not in self.rates:
+            return
+        # Healthy responses at the full rate change nothing, skip the write
+        if not blocked and not self.recovering(host):
+            return
+
+        def observe(state, now, base):
+            if blocked:
+                # Requests already in flight when the host blocked us report the same block
+                if now < state['blocked_until']:
+                    return
+                state['strikes'] += 1
+                state['successes'] = 0
+                state['rate'] = max(self.min_rate, state['rate'] / 2)
+                cooldown = min(self.max_cooldown, self.cooldown * 2 ** (state['strikes'] - 1))
+                state['blocked_until'] = max(state['blocked_until'], now + cooldown)
+                return
+            state['successes'] += 1
+            if state['successes'] >= self.recover_after:
+                state['successes'] = 0
+                state['rate'] = min(base, state['rate'] + base / 4)
+                if state['rate'] >= base:
+                    state['strikes'] = 0
+
+        self._update(host, observe)
+
+    def status(self):
+        """{host: row} of every limited host, for diagnostics."""
+        if not self.rates:
+            return {}
+        rows = self._connect().execute('SELECT * FROM host_limits')
+        return {row['host']: dict(row) for row in rows if row['host'] in self.rates}
+
+
+class Identity:
+    """One browser persona: headers and cookies that are always sent together."""
+
+    def __init__(self, name, headers):
+        self.name = name
+        self.headers = dict(headers)
+        # aiohttp session with its own cookie jar, created by the fetcher on its loop
+        self.session = None
+        self.benched_until = 0.0
+        self.blocks = 0
+
+
+class IdentityPool:
+    """
+    A fixed set of identities, `size` of them cycling through the profiles.
+
+    Requests with the same key (e.g. one movie's pages) keep the same
+    identity, like one visitor browsing. A blocked identity is benched for
+    `bench` seconds and its cookies dropped, and its keys move on to the
+    next identity meanwhile.
+    """
+
+    def __init__(self, profiles=BROWSER_PROFILES, size=None, bench=600.0):
+        self.identities = [Identity(f"identity-{i}", profiles[i % len(profiles)])
+                           for i in range(size or len(profiles))]
+        self.bench_seconds = bench
+        self._next = 0
+
+    def __iter__(self):
+        return iter(self.identities)
+
+    def choose(self, key=None):
+        """The identity for key (round robin without one), skipping benched ones while possible."""
+        count = len(self.identities)
+        if key is None:
+            start, self._next = self._next, (self._next + 1) % count
+        else:
+            start = zlib.crc32(str(key).encode('utf-8')) % count
+        now = time.monotonic()
+        for i in range(count):
+            identity = self.identities[(start + i) % count]
+            if identity.benched_until <= now:
+                return identity
+        return min(self.identities, key=lambda identity: identity.benched_until)
+
+    def bench(self, identity):
+        identity.blocks += 1
+        identity.benched_until = time.monotonic() + self.bench_seconds
+        if identity.session is not None:
+            identity.session.cookie_jar.clear()
+
+
+class Politeness:
+    """
+    Host rate limits, browser identities and block detection for an
+    AsyncFetcher (politeness=...). A response is a block when its status is
+    in BLOCK_STATUSES, it was redirected to one of block_hosts, or its body
+    contains one of block_markers (bytes).
+    """
+
+    def __init__(self, limits, identities=None, block_markers=(), block_hosts=()):
+        self.limits = limits
+        self.identities = identities or IdentityPool()
+        self.block_markers = tuple(block_markers)
+        self.block_hosts = tuple(block_hosts)
+
+    def is_blocked(self, result, host):
+        if result.status_code in BLOCK_STATUSES:
+            return True
+        if host in self.block_hosts:
+            return True
+        return any(marker in result.content for marker in self.block_markers)
+
+    async def wait(self, host, timings=None):
+        """Wait for the host's next request slot, on the fetcher's loop."""
+        if not self.limits.limited(host):
+            return
+        # SQLite may wait on other processes, keep that off the event loop
+        delay = await asyncio.get_running_loop().run_in_executor(None, self.limits.reserve, host)
+        if delay > 0:
+            metrics.record('throttle', delay, timings)
+            await asyncio.sleep(delay)
+
+    async def observe(self, host, identity, result, final_host):
+        """Check a response for a block, throttle the host and bench the identity if so."""
+        blocked = self.is_blocked(result, final_host)
+        if blocked:
+            BLOCKED.inc(host=host)
+            if identity is not None:
+                self.identities.bench(identity)
+        if blocked or self.limits.recovering(host):
+            await asyncio.get_running_loop().run_in_executor(None, self.limits.report, host, blocked)
+        return blocked
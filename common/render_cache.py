@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from . import metrics
+
+
+def render_wordcloud(frequencies, options):
+    """Rasterize a word cloud from a {word: count} table into PNG bytes."""
+    from wordcloud import WordCloud
+
+    wc = WordCloud(**options).generate_from_frequencies(frequencies)
+    img_io = BytesIO()
+    wc.to_image().save(img_io, 'PNG')
+    return img_io.getvalue()
+
+
+class WordCloudCache:
+    """
+    Rendered word clouds on disk, keyed by a hash of the frequency table and
+    render options. The key doubles as the HTTP ETag. Files are evicted least
+    recently used first once the directory grows past max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, render=render_wordcloud, name='wordcloud'):
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.render = render
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix='wordcloud-render')
+
+    @staticmethod
+    def make_key(frequencies, options):
+        payload = json.dumps(
+            [sorted(frequencies.items()), sorted(options.items())],
+            ensure_ascii=False, separators=(',', ':')
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def get(self, key):
+        """Cached PNG bytes for key, or None."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        # Reads refresh the LRU position
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data):
+        """Store PNG bytes atomically, then enforce the size bound."""
+        tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith('.png'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                    total -= size
+                except OSError:
+                    pass
+
+    def get_or_render(self, frequencies, options):
+        """Return (key, png_bytes), rendering at most once per key at a time."""
+        key = self.make_key(frequencies, options)
+        data = self.get(key)
+        if data is not None:
+            metrics.cache_result(self.name, 'hit')
+            return key, data
+        metrics.cache_result(self.name, 'miss')
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                # Another thread may have rendered it while we waited
+                data = self.get(key)
+                if data is None:
+                    with metrics.timed('wordcloud_render'):
+                        data = self.render(frequencies, options)
+                    self.put(key, data)
+        finally:
+            # Also after a failed render, or every failing key would keep its lock
+            with self._lock:
+                self._key_locks.pop(key, None)
+        return key, data
+
+    def prerender(self, frequencies, options):
+        """Render in the background so the first request is a cache hit."""
+        if not frequencies:
+            return None
+        return self._background.submit(self.get_or_render, frequencies, options)
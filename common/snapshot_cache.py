@@ -0,0 +1,98 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# value must be treated as read-only: it is shared by every reader of the snapshot
+Snapshot = namedtuple('Snapshot', ['key', 'value', 'version', 'loaded_at', 'fetched_at'])
+
+
+class SnapshotCache:
+    """
+    Keyed cache of loaded values with a TTL and stale-while-revalidate.
+
+    loader(key) produces a complete value; it is published as a new Snapshot
+    in a single assignment, so readers see either the old or the new value,
+    never a partial one. Within ttl seconds a snapshot is served as is, for
+    stale_ttl seconds after that it is still served while one background
+    reload runs. Concurrent loads of the same key share one loader call.
+    """
+
+    def __init__(self, loader, ttl=600, stale_ttl=3600, on_update=None, max_workers=4, name='snapshot'):
+        self.loader = loader
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.on_update = on_update
+        self._snapshots = {}
+        self._inflight = {}
+        self._version = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='snapshot-load')
+
+    def peek(self, key):
+        """Current snapshot of key (possibly stale) or None, never loads."""
+        return self._snapshots.get(key)
+
+    def get(self, key, force=False):
+        """
+        Snapshot of key, loading it first when missing, expired past the stale
+        window or when force is set. Raises the loader's exception if a load
+        had to be waited for and failed.
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot and not force:
+                age = time.monotonic() - snapshot.loaded_at
+                if age < self.ttl:
+                    metrics.cache_result(self.name, 'hit')
+                    return snapshot
+                if age < self.ttl + self.stale_ttl:
+                    metrics.cache_result(self.name, 'stale')
+                    self._start(key)
+                    return snapshot
+            metrics.cache_result(self.name, 'miss')
+            future = self._start(key)
+        return future.result()
+
+    def refresh(self, key):
+        """Reload key in the background; returns the Future of the (shared) load."""
+        with self._lock:
+            return self._start(key)
+
+    def _start(self, key):
+        # Caller holds self._lock
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._inflight[key] = self._executor.submit(self._load, key)
+            future.add_done_callback(lambda f: self._report(key, f))
+        return future
+
+    def _load(self, key):
+        try:
+            value = self.loader(key)
+            with self._lock:
+                self._version += 1
+                snapshot = Snapshot(key, value, self._version, time.monotonic(), time.time())
+                self._snapshots[key] = snapshot
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return snapshot
+
+    def _report(self, key, future):
+        # Runs once waiters have been released, so the hook does not delay them
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logger.error("Loading %r failed", key, exc_info=future.exception())
+        elif self.on_update:
+            try:
+                self.on_update(future.result())
+            except Exception:
+                logger.exception("Update hook for %r failed", key)
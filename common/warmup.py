@@ -0,0 +1,79 @@
+import os
+import pickle
+import threading
+
+from . import metrics
+
+JIEBA_CACHE = 'jieba.dict.pickle'
+
+
+def _jieba_signature(jieba):
+    """Identifies the default dictionary a cache was built from."""
+    path = os.path.join(os.path.dirname(os.path.abspath(jieba.__file__)), jieba.DEFAULT_DICT_NAME)
+    stat = os.stat(path)
+    return jieba.__version__, path, stat.st_size, stat.st_mtime
+
+
+def load_jieba(cache_dir):
+    """
+    Initialize jieba's default tokenizer from a pickled prefix dictionary in
+    cache_dir, building it with jieba and saving it there when it is missing
+    or stale. Unpickling is several times faster than jieba's own marshal
+    cache. Returns True when the dictionary came from the cache.
+    """
+    import jieba
+
+    tokenizer = jieba.dt
+    # jieba.cut() initializes under the same lock, so callers wait for us rather than build a second copy
+    with tokenizer.lock:
+        if tokenizer.initialized:
+            return False
+        if tokenizer.dictionary is not None:
+            # A custom dictionary, jieba caches those itself
+            tokenizer.initialize()
+            return False
+
+        path = os.path.join(cache_dir, JIEBA_CACHE)
+        signature = _jieba_signature(jieba)
+        try:
+            with open(path, 'rb') as f:
+                cached = pickle.load(f)
+            if cached['signature'] == signature:
+                tokenizer.FREQ, tokenizer.total = cached['freq'], cached['total']
+                tokenizer.initialized = True
+                return True
+        except (OSError, EOFError, pickle.UnpicklingError, KeyError, TypeError):
+            pass
+
+        tokenizer.initialize()
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({'signature': signature, 'freq': tokenizer.FREQ, 'total': tokenizer.total}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+        return False
+
+
+def warm_jieba(cache_dir, background=True):
+    """
+    Load jieba's dictionary ahead of the first request that needs it, on a
+    daemon thread unless background=False. Disabled by JIEBA_WARMUP=0, in
+    which case jieba initializes lazily on first use. Returns the thread.
+    """
+    if os.environ.get('JIEBA_WARMUP', '1') == '0':
+        return None
+
+    def run():
+        with metrics.timed('jieba_warmup'):
+            load_jieba(cache_dir)
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name='jieba-warmup', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,34 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The apps import their modules by bare name, as when run from their own directory
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, '豆瓣'))
+
+# Read by douban.py at import time: keep its databases out of the source tree
+SCRATCH = tempfile.mkdtemp(prefix='crawler-tests-')
+os.environ.setdefault('DOUBAN_DB_PATH', os.path.join(SCRATCH, 'douban.db'))
+os.environ.setdefault('DOUBAN_POLITENESS_DB', os.path.join(SCRATCH, 'politeness.db'))
+os.environ.setdefault('DOUBAN_HTTP_CACHE', os.path.join(SCRATCH, 'http.db'))
+os.environ.setdefault('JIEBA_WARMUP', '0')
+
+
+def make_comment(user, date, star='推荐', content=None):
+    return {
+        'user': user,
+        'link': f"https://www.douban.com/people/{user}/",
+        'content': content or f"{user} 的短评",
+        'date': date,
+        'star': star,
+    }
+
+
+@pytest.fixture
+def storage(tmp_path):
+    from storage import DoubanStorage
+
+    return DoubanStorage(str(tmp_path / 'douban.db'))
@@ -0,0 +1,130 @@
+import sqlite3
+from concurrent.futures import Future
+
+import pytest
+
+from conftest import make_comment
+from storage import DoubanStorage
+
+SUBJECT = '1292052'
+URL = f"https://movie.douban.com/subject/{SUBJECT}/"
+
+
+class Listing:
+    """A fake time-ordered comment listing: pages of 20, newest first."""
+
+    def __init__(self, comments):
+        self.comments = comments
+        self.requested = []
+
+    def fetch(self, base_url, start, delay=0, sort=None, budget=None):
+        assert sort == 'time'
+        self.requested.append(start)
+        future = Future()
+        future.set_result(type('Page', (), {'status_code': 200, 'elapsed': 0.0, 'start': start})())
+        return future
+
+    def parse(self, response, start):
+        return self.comments[start:start + 20], len(self.comments)
+
+
+def listing_of(count, newest_day=28):
+    # One comment per hour going back from the newest
+    return [make_comment(f"u{i}", f"2024-05-{newest_day - i // 24:02d} {23 - i % 24:02d}:00:00") for i in range(count)]
+
+
+@pytest.fixture
+def douban(storage, monkeypatch):
+    douban = pytest.importorskip('douban')
+    monkeypatch.setattr(douban, 'storage', storage)
+    return douban
+
+
+def crawl(douban, monkeypatch, listing, target):
+    monkeypatch.setattr(douban, 'fetch_comment_page', listing.fetch)
+    monkeypatch.setattr(douban, 'parse_comment_page', listing.parse)
+    return douban.crawl_douban_incremental(URL, SUBJECT, douban.storage.get_checkpoint(SUBJECT), target_count=target)
+
+
+def test_checkpoint_tracks_newest_dated_comment(storage):
+    storage.save_data({'subject_id': SUBJECT, 'title': 't'}, [
+        make_comment('a', '2024-05-01 10:00:00'),
+        make_comment('b', '2024-05-03 09:00:00'),
+        make_comment('c', '未知日期'),
+    ])
+    storage.save_checkpoint(SUBJECT)
+    checkpoint = storage.get_checkpoint(SUBJECT)
+    assert checkpoint['newest_date'] == '2024-05-03 09:00:00'
+    # A crawl of the hot listing says nothing about the time-ordered one
+    assert checkpoint['last_offset'] is None
+
+    storage.save_checkpoint(SUBJECT, 60)
+    storage.save_checkpoint(SUBJECT)
+    assert storage.get_checkpoint(SUBJECT)['last_offset'] == 60
+
+
+def test_old_checkpoint_table_is_migrated(tmp_path):
+    path = str(tmp_path / 'old.db')
+    DoubanStorage(path)
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executescript("""
+            DROP TABLE crawl_checkpoints;
+            CREATE TABLE crawl_checkpoints (
+                subject_id TEXT PRIMARY KEY REFERENCES movies(subject_id) ON DELETE CASCADE,
+                newest_date TEXT, newest_user_key TEXT,
+                last_offset INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL);
+            INSERT INTO movies (subject_id, crawled_at) VALUES ('7', 0);
+            INSERT INTO crawl_checkpoints VALUES ('7', '2024-01-01 00:00:00', 'name:a', 40, 0);
+        """)
+    conn.close()
+
+    storage = DoubanStorage(path)
+    assert storage.get_checkpoint('7')['last_offset'] == 40
+    storage.save_data({'subject_id': '8', 'title': 't'}, [])
+    storage.save_checkpoint('8')
+    assert storage.get_checkpoint('8')['last_offset'] is None
+
+
+def test_incremental_stops_at_checkpoint_and_resumes_backfill(douban, monkeypatch):
+    listing = listing_of(200)
+    # Stored: comments 5-44 of the listing, walked from the top down to offset 45
+    douban.storage.save_data({'subject_id': SUBJECT, 'title': 't'}, listing[5:45])
+    douban.storage.save_checkpoint(SUBJECT, 40)
+    # A new comment posted in the same second as the high-water mark
+    listing.insert(5, make_comment('same-second', listing[5]['date']))
+
+    success, message = crawl(douban, monkeypatch, Listing(listing), target=100)
+    assert success
+    assert '新增 6 条' in message
+    stored = douban.storage.get_info(SUBJECT)['comments_count']
+    assert stored == 100
+    comments, _ = douban.storage.query_comments(SUBJECT, limit=200)
+    assert 'same-second' in {c['user'] for c in comments}
+
+
+def test_backfill_skips_pages_already_walked(douban, monkeypatch):
+    listing = Listing(listing_of(200))
+    douban.storage.save_data({'subject_id': SUBJECT, 'title': 't'}, listing.comments[:40])
+    douban.storage.save_checkpoint(SUBJECT, 40)
+    listing.comments[:0] = [make_comment(f"new{i}", '2024-06-01 00:00:00') for i in range(3)]
+
+    crawl(douban, monkeypatch, listing, target=80)
+    # The walk stops on the first page; the stored comments moved down by 3,
+    # so the backfill resumes at the page holding offset 43
+    assert listing.requested[0] == 0
+    assert listing.requested[1:] == [40, 60]
+    assert douban.storage.get_checkpoint(SUBJECT)['last_offset'] == 80
+
+
+def test_backfill_after_a_hot_listing_crawl(douban, monkeypatch):
+    listing = Listing(listing_of(200))
+    # Stored by a full crawl: its checkpoint has no time-listing offset
+    douban.storage.save_data({'subject_id': SUBJECT, 'title': 't'}, listing.comments[:10])
+    douban.storage.save_checkpoint(SUBJECT)
+
+    crawl(douban, monkeypatch, listing, target=50)
+    # Page 0 was fetched by the walk and is not fetched again by the backfill
+    assert listing.requested == [0, 20, 40]
+    assert douban.storage.get_info(SUBJECT)['comments_count'] == 50
+    assert douban.storage.get_checkpoint(SUBJECT)['last_offset'] == 60
@@ -0,0 +1,100 @@
+import email.utils
+import os
+import sys
+import time
+
+import pytest
+from multidict import CIMultiDict
+
+from common.fetcher import AsyncFetcher, FetchResult
+from common.http_cache import HttpCache
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from stub_server import StubServer
+
+
+def response(headers, body=b'<html>' + b'x' * 4096 + b'</html>'):
+    return FetchResult('https://example.com/', 200, CIMultiDict(headers), body, 0.0, 'utf-8')
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return HttpCache(str(tmp_path / 'http.db'), offline=False)
+
+
+@pytest.fixture
+def stub():
+    with StubServer(total_comments=100) as stub:
+        yield stub
+
+
+@pytest.fixture
+def fetcher(cache):
+    fetcher = AsyncFetcher(retries=0, cache=cache)
+    yield fetcher
+    fetcher.close()
+
+
+def test_freshness_lifetime(cache):
+    now = time.time()
+    date = email.utils.formatdate(now, usegmt=True)
+    url = 'https://example.com/'
+    assert cache.lifetime(url, CIMultiDict({'Cache-Control': 'no-store'})) is None
+    assert cache.lifetime(url, CIMultiDict({'Cache-Control': 'no-cache, max-age=60'})) == 0
+    assert cache.lifetime(url, CIMultiDict({'Cache-Control': 'max-age=60', 'Age': '20'})) == 40
+    assert cache.lifetime(url, CIMultiDict({'Date': date, 'Expires': email.utils.formatdate(now + 90, usegmt=True)}),
+                          now) == pytest.approx(90, abs=1)
+    # A tenth of the time since the last modification
+    modified = email.utils.formatdate(now - 1000, usegmt=True)
+    assert cache.lifetime(url, CIMultiDict({'Date': date, 'Last-Modified': modified}), now) == pytest.approx(100, abs=1)
+    assert cache.lifetime(url, CIMultiDict()) == 0
+
+
+def test_vary_keys_and_compression(cache):
+    headers = {'Vary': 'User-Agent', 'Cache-Control': 'max-age=60'}
+    assert cache.store('https://example.com/', {'User-Agent': 'A'}, response(headers))
+    assert cache.stats()['bytes'] < 4096
+
+    entry = cache.lookup('https://example.com/', {'user-agent': 'A'})
+    assert entry.fresh and entry.content.startswith(b'<html>x')
+    assert cache.lookup('https://example.com/', {'User-Agent': 'B'}) is None
+    assert not cache.store('https://example.com/other', {}, response({'Vary': '*'}))
+
+
+def test_stale_entries_are_revalidated(fetcher, stub):
+    url = stub.douban_url()
+    first = fetcher.get(url)
+    assert first.status_code == 200 and first.from_cache is None
+    assert first.headers['ETag']
+
+    # No freshness information: the next request asks the stub whether the page changed
+    second = fetcher.get(url)
+    assert second.from_cache == 'revalidated'
+    assert second.status_code == 200 and second.content == first.content
+    assert stub.stats['not_modified'] == 1
+
+
+def test_fresh_entries_skip_the_network(tmp_path, stub):
+    cache = HttpCache(str(tmp_path / 'http.db'), default_ttl=60, offline=False)
+    fetcher = AsyncFetcher(retries=0, cache=cache)
+    try:
+        url = stub.douban_url()
+        fetcher.get(url)
+        assert fetcher.get(url).from_cache == 'hit'
+        assert fetcher.get(url, use_cache=False).from_cache is None
+    finally:
+        fetcher.close()
+    assert stub.stats['requests'] == 2
+
+
+def test_offline_replay(cache, fetcher, stub):
+    url = stub.douban_url()
+    content = fetcher.get(url).content
+    requests = stub.stats['requests']
+
+    cache.offline = True
+    replayed = fetcher.get(url)
+    assert replayed.from_cache == 'offline' and replayed.content == content
+    missing = fetcher.get(stub.douban_url(1))
+    assert missing.status_code == 504
+    assert stub.stats['requests'] == requests
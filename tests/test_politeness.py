@@ -0,0 +1,106 @@
+import pytest
+
+from common import politeness
+from common.fetcher import FetchResult
+from common.politeness import HostLimits, IdentityPool, Politeness
+
+HOST = 'movie.douban.com'
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(politeness.time, 'time', clock)
+    monkeypatch.setattr(politeness, '_host_rates', {})
+    return clock
+
+
+@pytest.fixture
+def limits(tmp_path, clock):
+    return HostLimits(str(tmp_path / 'politeness.db'), {HOST: 4.0}, burst=2, cooldown=30, max_cooldown=100,
+                      recover_after=3)
+
+
+def test_burst_then_steady_rate(limits, clock):
+    waits = [limits.reserve(HOST) for _ in range(5)]
+    assert waits == pytest.approx([0, 0, 0.25, 0.5, 0.75])
+    # After an idle period the burst is available again, but not more
+    clock.now += 60
+    assert [limits.reserve(HOST) for _ in range(3)] == pytest.approx([0, 0, 0.25])
+
+
+def test_unlisted_hosts_are_not_limited(limits):
+    assert [limits.reserve('example.com') for _ in range(10)] == [0.0] * 10
+    limits.report('example.com', blocked=True)
+    assert limits.status().keys() <= {HOST}
+
+
+def test_processes_share_the_bucket(tmp_path, clock):
+    path = str(tmp_path / 'shared.db')
+    first, second = (HostLimits(path, {HOST: 2.0}, burst=1) for _ in range(2))
+    assert first.reserve(HOST) == 0
+    assert second.reserve(HOST) == pytest.approx(0.5)
+    assert first.reserve(HOST) == pytest.approx(1.0)
+
+
+def test_blocks_slow_down_and_pause(limits, clock):
+    limits.report(HOST, blocked=True)
+    state = limits.status()[HOST]
+    assert state['rate'] == 2.0
+    assert state['blocked_until'] == clock.now + 30
+    assert limits.reserve(HOST) == pytest.approx(30)
+
+    # Requests already in flight report the same block: no second strike
+    limits.report(HOST, blocked=True)
+    assert limits.status()[HOST]['strikes'] == 1
+
+    # Blocked again after the pause: half the rate again, twice the pause
+    clock.now += 31
+    limits.report(HOST, blocked=True)
+    state = limits.status()[HOST]
+    assert (state['rate'], state['strikes']) == (1.0, 2)
+    assert state['blocked_until'] == clock.now + 60
+
+
+def test_rate_recovers_after_healthy_responses(limits, clock):
+    limits.report(HOST, blocked=True)
+    clock.now += 31
+    for _ in range(3):
+        limits.report(HOST, blocked=False)
+    assert limits.status()[HOST]['rate'] == 3.0
+    for _ in range(3):
+        limits.report(HOST, blocked=False)
+    state = limits.status()[HOST]
+    assert (state['rate'], state['strikes']) == (4.0, 0)
+    assert not limits.recovering(HOST)
+
+
+def test_identities_are_sticky_and_benched(clock):
+    pool = IdentityPool(size=3, bench=60)
+    identity = pool.choose('movie-1')
+    assert all(pool.choose('movie-1') is identity for _ in range(5))
+    pool.bench(identity)
+    other = pool.choose('movie-1')
+    assert other is not identity
+    # Without a key the pool rotates, skipping the benched identity
+    assert identity not in {pool.choose() for _ in range(6)}
+
+
+def test_block_detection():
+    checker = Politeness(None, IdentityPool(), block_markers=(b'sec.douban.com/a',), block_hosts=('sec.douban.com',))
+
+    def result(status=200, content=b'<html>ok</html>'):
+        return FetchResult('https://movie.douban.com/', status, {}, content, 0.0)
+
+    assert not checker.is_blocked(result(), HOST)
+    assert checker.is_blocked(result(403), HOST)
+    assert checker.is_blocked(result(content=b'<a href="https://sec.douban.com/a">'), HOST)
+    assert checker.is_blocked(result(), 'sec.douban.com')
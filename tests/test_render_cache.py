@@ -0,0 +1,32 @@
+import pytest
+
+from common.render_cache import WordCloudCache
+
+FREQUENCIES = {'电影': 3, '好看': 1}
+
+
+def test_renders_once_per_key(tmp_path):
+    calls = []
+
+    def render(frequencies, options):
+        calls.append(frequencies)
+        return b'png'
+
+    cache = WordCloudCache(str(tmp_path), render=render)
+    key, data = cache.get_or_render(FREQUENCIES, {'width': 10})
+    assert data == b'png'
+    assert cache.get_or_render(FREQUENCIES, {'width': 10}) == (key, b'png')
+    assert len(calls) == 1
+    assert cache.get_or_render(FREQUENCIES, {'width': 20})[0] != key
+    assert not cache._key_locks
+
+
+def test_failed_render_releases_its_key(tmp_path):
+    def render(frequencies, options):
+        raise OSError('cannot open resource')
+
+    cache = WordCloudCache(str(tmp_path), render=render)
+    with pytest.raises(OSError):
+        cache.get_or_render(FREQUENCIES, {})
+    assert not cache._key_locks
+    assert cache.get(cache.make_key(FREQUENCIES, {})) is None
@@ -0,0 +1,60 @@
+from conftest import make_comment
+from search import highlight, match_expression
+
+
+def ids(storage, *terms, subject_id=None):
+    comments, matched = storage.search_comments(match_expression(terms), subject_id)
+    assert matched == len(comments)
+    return sorted(c['user'] for c in comments)
+
+
+def tokenize_all(storage, subject_id, tokens_by_user):
+    rows = storage.get_changed_comments(subject_id)
+    users = {c['id']: c['user'] for c in storage.query_comments(subject_id, limit=100)[0]}
+    storage.save_tokens({row['id']: tokens_by_user[users[row['id']]] for row in rows
+                         if users[row['id']] in tokens_by_user})
+
+
+def test_index_follows_tokens(storage):
+    storage.save_data({'subject_id': '1', 'title': 't'}, [
+        make_comment('a', '2024-01-01 00:00:00', content='剧情精彩'),
+        make_comment('b', '2024-01-02 00:00:00', content='演员不错'),
+    ])
+    # Comments are indexed once analysis stored their tokens
+    assert ids(storage, '剧情') == []
+    tokenize_all(storage, '1', {'a': ['剧情', '精彩'], 'b': ['演员', '不错']})
+    assert ids(storage, '剧情') == ['a']
+    assert ids(storage, '演员', '不错') == ['b']
+    assert ids(storage, '剧情', '不错') == []
+
+
+def test_changed_content_leaves_the_index(storage):
+    storage.save_data({'subject_id': '1', 'title': 't'}, [make_comment('a', '2024-01-01 00:00:00', content='剧情精彩')])
+    tokenize_all(storage, '1', {'a': ['剧情', '精彩']})
+    storage.save_data({'subject_id': '1', 'title': 't'}, [make_comment('a', '2024-01-01 00:00:00', content='配乐动人')])
+    assert ids(storage, '剧情') == []
+    tokenize_all(storage, '1', {'a': ['配乐', '动人']})
+    assert ids(storage, '配乐') == ['a']
+
+
+def test_deleted_movies_leave_the_index(storage):
+    for subject_id in ('1', '2'):
+        storage.save_data({'subject_id': subject_id, 'title': 't'},
+                          [make_comment(f"u{subject_id}", '2024-01-01 00:00:00', content='剧情精彩')])
+        tokenize_all(storage, subject_id, {f"u{subject_id}": ['剧情', '精彩']})
+    assert ids(storage, '剧情') == ['u1', 'u2']
+    assert ids(storage, '剧情', subject_id='2') == ['u2']
+    storage.clear_data('1')
+    assert ids(storage, '剧情') == ['u2']
+
+
+def test_query_syntax_is_quoted(storage):
+    storage.save_data({'subject_id': '1', 'title': 't'}, [make_comment('a', '2024-01-01 00:00:00')])
+    tokenize_all(storage, '1', {'a': ['OR', 'NEAR']})
+    assert match_expression(['a"b', 'OR']) == '"a""b" "OR"'
+    assert ids(storage, 'OR', 'NEAR') == ['a']
+
+
+def test_highlight_escapes_html():
+    assert highlight('<b>剧情</b>精彩', ['剧情']) == '&lt;b&gt;<mark>剧情</mark>&lt;/b&gt;精彩'
+    assert highlight('剧情精彩', ['剧情', '剧情精彩']) == '<mark>剧情精彩</mark>'
@@ -0,0 +1,84 @@
+import pytest
+
+from conftest import make_comment
+from storage import COMMENT_SORTS, decode_cursor, encode_cursor
+
+STARS = ['力荐', '推荐', '还行', '较差', '很差']
+
+
+@pytest.fixture
+def movie(storage):
+    # Dates and stars repeat, so every sort has ties for the id to break
+    comments = [
+        make_comment(f"u{i}", f"2024-0{1 + i % 3}-1{i % 2} 12:00:00", STARS[i % len(STARS)])
+        for i in range(23)
+    ]
+    storage.save_data({'subject_id': '1', 'title': '测试电影'}, comments)
+    return '1'
+
+
+def walk(storage, subject_id, limit, sort, **filters):
+    pages, cursor = [], None
+    while True:
+        comments, cursor = storage.query_comments(subject_id, limit=limit, cursor=cursor, sort=sort, **filters)
+        pages.append(comments)
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize('value', [5, 'rating', '2024-01-10 12:00:00', None, '未知日期'])
+def test_cursor_round_trip(value):
+    cursor = encode_cursor(value, 42)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == (value, 42)
+
+
+@pytest.mark.parametrize('cursor', ['', 'not a cursor', encode_cursor(1, 'x'), 'WzEsMiwzXQ'])
+def test_malformed_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize('sort', sorted(COMMENT_SORTS))
+@pytest.mark.parametrize('limit', [1, 5, 23, 50])
+def test_keyset_pages_match_full_order(storage, movie, sort, limit):
+    expected, _ = storage.query_comments(movie, limit=100, sort=sort)
+    pages = walk(storage, movie, limit, sort)
+    assert all(len(page) <= limit for page in pages)
+    assert [c['id'] for page in pages for c in page] == [c['id'] for c in expected]
+    assert len(expected) == 23
+
+
+def test_sorts_order_by_key_then_id(storage, movie):
+    newest, _ = storage.query_comments(movie, limit=100, sort='newest')
+    keys = [(c['date'], c['id']) for c in newest]
+    assert keys == sorted(keys, reverse=True)
+
+    best, _ = storage.query_comments(movie, limit=100, sort='rating_desc')
+    ranks = [STARS[::-1].index(c['star']) for c in best]
+    assert ranks == sorted(ranks, reverse=True)
+
+
+def test_cursor_pages_respect_filters(storage, movie):
+    filters = {'stars': ['力荐'], 'date_from': '2024-02-01'}
+    pages = walk(storage, movie, 2, 'newest', **filters)
+    comments = [c for page in pages for c in page]
+    assert comments and all(c['star'] == '力荐' and c['date'] >= '2024-02-01' for c in comments)
+    assert len(comments) == storage.count_comments(movie, **filters)
+
+
+def test_date_filters_skip_undated_comments(storage):
+    storage.save_data({'subject_id': '2', 'title': 't'}, [
+        make_comment('a', '2024-01-01 08:00:00'),
+        make_comment('b', '未知日期'),
+    ])
+    assert storage.count_comments('2', date_from='2023-01-01') == 1
+    assert storage.count_comments('2', date_to='2030-01-01') == 1
+    assert storage.count_comments('2') == 2
+
+
+def test_comments_are_deduplicated_by_user(storage):
+    storage.save_data({'subject_id': '3', 'title': 't'}, [make_comment('a', '2024-01-01 08:00:00', content='旧')])
+    storage.save_data({'subject_id': '3', 'title': 't'}, [make_comment('a', '2024-01-01 08:00:00', content='新')])
+    comments, _ = storage.query_comments('3')
+    assert [c['content'] for c in comments] == ['新']
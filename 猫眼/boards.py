@@ -0,0 +1,183 @@
+import concurrent.futures
+import json
+import os
+import time
+
+from common import metrics
+from common.extract import embedded_json
+
+# 猫眼移动端榜单：榜单 ID -> 名称（顺序即展示与去重时的优先级）
+BOARDS = {
+    4: 'TOP100榜',
+    7: '热映口碑榜',
+    6: '最受期待榜',
+    1: '国内票房榜',
+    2: '北美票房榜',
+}
+
+# 可用环境变量指向本地桩服务器（离线基准测试）
+BOARD_URL = os.environ.get('MAOYAN_BOARD_URL', "https://m.maoyan.com/asgard/board/{board_id}")
+APP_DATA_MARKER = 'var AppData ='
+
+# 模拟移动端 User-Agent
+MOBILE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Connection': 'keep-alive'
+}
+
+
+class ScrapeError(Exception):
+    """
+    榜单抓取或解析失败
+    """
+
+
+def board_url(board_id):
+    return BOARD_URL.format(board_id=board_id)
+
+
+def board_headers(board_id):
+    return dict(MOBILE_HEADERS, Referer=board_url(board_id))
+
+
+def parse_app_data(html_content):
+    """
+    提取嵌入在页面中的 JSON 数据（var AppData = {...};）
+    从标记处直接解码一个 JSON 值，解码到对象结尾即停止，不再用正则回溯扫描整页
+    """
+    try:
+        data = embedded_json(html_content, APP_DATA_MARKER)
+    except json.JSONDecodeError as e:
+        raise ScrapeError(f"JSON解析失败: {e}")
+    if not isinstance(data, dict):
+        raise ScrapeError("未找到电影数据 (AppData)")
+    return data
+
+
+def normalize_movie(movie, rank, board_id):
+    """
+    将榜单条目转换为统一的字段（各榜单缺少的字段使用默认值）
+    """
+    movie_id = movie.get('id')
+    # 图片链接：替换尺寸占位符，获取更高清的图
+    image_url = movie.get('img', '')
+    if image_url:
+        image_url = image_url.replace('w.h', '128.180')
+    normalized = {
+        '排名': str(rank),
+        '电影名称': movie.get('nm', '未知'),
+        # 期待榜等尚未上映的影片没有评分
+        '评分': str(movie['sc']) if movie.get('sc') else '暂无评分',
+        '上映时间': movie.get('rt', '未知'),
+        '链接': f"https://maoyan.com/films/{movie_id}" if movie_id else "#",
+        '图片': image_url,
+        '猫眼ID': movie_id,
+        '榜单': BOARDS.get(board_id, str(board_id)),
+    }
+    if movie.get('star'):
+        normalized['主演'] = movie['star']
+    return normalized
+
+
+def parse_board(response, board_id):
+    """
+    解析一个榜单页面，返回电影元组（只读）；失败时抛出 ScrapeError
+    """
+    if response.status_code != 200:
+        raise ScrapeError(f"请求失败，状态码: {response.status_code}")
+    response.encoding = 'utf-8'
+    with metrics.timed('parse'):
+        data = parse_app_data(response.text)
+        movies_list = data.get('data', {}).get('movies', [])
+        if not movies_list:
+            raise ScrapeError("未找到电影数据 (AppData)")
+        return tuple(normalize_movie(movie, idx, board_id) for idx, movie in enumerate(movies_list, 1))
+
+
+def fetch_board(fetcher, board_id):
+    """
+    抓取并解析单个榜单
+    """
+    try:
+        response = fetcher.get(board_url(board_id), headers=board_headers(board_id), timeout=10)
+    except Exception as e:
+        raise ScrapeError(f"爬取过程中出错: {e}")
+    return parse_board(response, board_id)
+
+
+def merge_movies(boards):
+    """
+    合并各榜单的电影并按猫眼 ID 去重，记录每部电影出现在哪些榜单及名次
+    """
+    merged = {}
+    for board in boards.values():
+        for movie in board['movies']:
+            key = movie['猫眼ID'] or movie['电影名称']
+            entry = merged.get(key)
+            if entry is None:
+                entry = merged[key] = {k: v for k, v in movie.items() if k not in ('排名', '榜单')}
+                entry['榜单'] = {}
+            entry['榜单'][board['name']] = int(movie['排名'])
+            # 其他榜单可能带有更完整的信息
+            for field, value in movie.items():
+                if field in ('排名', '榜单'):
+                    continue
+                if entry.get(field) in (None, '', '暂无评分', '未知') and value not in (None, ''):
+                    entry[field] = value
+    return tuple(merged.values())
+
+
+def crawl_boards(fetcher, board_ids=None, previous=None):
+    """
+    通过共享连接池并发抓取多个榜单，返回
+    {'boards': {榜单ID: {...}}, 'movies': 去重后的电影元组, 'elapsed_ms': 总耗时}
+    单个榜单失败时沿用 previous（上一次的结果）中的数据并标记 stale；全部失败时抛出 ScrapeError
+    """
+    board_ids = list(board_ids or BOARDS)
+    started = time.perf_counter()
+    futures = {
+        fetcher.submit(board_url(board_id), headers=board_headers(board_id), timeout=10): board_id
+        for board_id in board_ids
+    }
+
+    results = {}
+    errors = []
+    for future in concurrent.futures.as_completed(futures):
+        board_id = futures[future]
+        board = {
+            'id': board_id,
+            'name': BOARDS.get(board_id, str(board_id)),
+            'movies': (),
+            'fetch_ms': None,
+            'parse_ms': None,
+            'done_ms': None,
+            'error': None,
+            'stale': False,
+        }
+        try:
+            response = future.result()
+            board['fetch_ms'] = round(response.elapsed * 1000, 1)
+            parse_started = time.perf_counter()
+            board['movies'] = parse_board(response, board_id)
+            board['parse_ms'] = round((time.perf_counter() - parse_started) * 1000, 1)
+        except Exception as e:
+            board['error'] = str(e) if isinstance(e, ScrapeError) else f"爬取过程中出错: {e}"
+            errors.append(f"{board['name']}: {board['error']}")
+            old = (previous or {}).get('boards', {}).get(board_id)
+            if old and old['movies']:
+                board['movies'] = old['movies']
+                board['stale'] = True
+        board['done_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        results[board_id] = board
+
+    if len(errors) == len(board_ids):
+        raise ScrapeError("; ".join(errors))
+
+    boards = {board_id: results[board_id] for board_id in board_ids}
+    return {
+        'boards': boards,
+        'movies': merge_movies(boards),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
@@ -0,0 +1,159 @@
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+import time
+
+from common import metrics
+
+logger = logging.getLogger(__name__)
+
+# 可用环境变量指向本地桩服务器（离线基准测试）
+DETAIL_URL = os.environ.get('MAOYAN_DETAIL_URL', "https://m.maoyan.com/ajax/detailmovie?movieId={movie_id}")
+
+# 详情接口字段 -> 统一后的中文字段
+DETAIL_FIELDS = {
+    'cat': '类型',
+    'dur': '片长',
+    'dir': '导演',
+    'star': '主演',
+}
+# 票房字段在不同影片上的名称不一致，按顺序取第一个非空值
+BOX_OFFICE_FIELDS = ('sumBox', 'boxInfo', 'box')
+
+DETAIL_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
+    'Accept': 'application/json, text/plain, */*',
+    'Referer': 'https://m.maoyan.com/',
+}
+
+
+def parse_detail(response):
+    """
+    解析详情接口返回的 JSON，返回统一字段的字典；数据缺失时返回 None
+    """
+    if response.status_code != 200:
+        return None
+    try:
+        movie = json.loads(response.text).get('detailMovie') or {}
+    except (ValueError, AttributeError):
+        return None
+    if not movie:
+        return None
+
+    details = {}
+    for source, field in DETAIL_FIELDS.items():
+        value = movie.get(source)
+        if value not in (None, ''):
+            details[field] = value
+    if '片长' in details:
+        details['片长'] = f"{details['片长']}分钟"
+    for source in BOX_OFFICE_FIELDS:
+        if movie.get(source):
+            details['票房'] = movie[source]
+            break
+    return details
+
+
+class DetailCache:
+    """
+    按猫眼 ID 缓存影片详情，条目超过 ttl 秒后视为过期
+    可选保存到 JSON 文件，重启后仍然有效
+    """
+
+    def __init__(self, ttl=24 * 3600, path=None):
+        self.ttl = ttl
+        self.path = path
+        self._entries = {}
+        self._lock = threading.Lock()
+        if path:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self._entries = {int(k): v for k, v in json.load(f).items()}
+            except (OSError, ValueError):
+                pass
+
+    def get(self, movie_id):
+        """
+        未过期的详情，或 None
+        """
+        entry = self._entries.get(movie_id)
+        if entry and time.time() - entry['fetched_at'] < self.ttl:
+            metrics.cache_result('maoyan_details', 'hit')
+            return entry['details']
+        metrics.cache_result('maoyan_details', 'miss')
+        return None
+
+    def put_many(self, details_by_id):
+        now = time.time()
+        with self._lock:
+            for movie_id, details in details_by_id.items():
+                self._entries[movie_id] = {'details': details, 'fetched_at': now}
+            # 顺便清理早已过期的条目，避免文件无限增长
+            self._entries = {k: v for k, v in self._entries.items() if now - v['fetched_at'] < self.ttl * 2}
+            if self.path:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self._entries, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+
+
+def fetch_details(fetcher, movie_ids, cache, concurrency=8, retries=2):
+    """
+    并发获取影片详情（同时最多 concurrency 个请求），只请求缓存中缺失或过期的影片
+    返回 ({猫眼ID: 详情}, 统计信息)
+    """
+    started = time.perf_counter()
+    results = {}
+    pending = []
+    for movie_id in dict.fromkeys(movie_ids):
+        if movie_id is None:
+            continue
+        cached = cache.get(movie_id)
+        if cached is not None:
+            results[movie_id] = cached
+        else:
+            pending.append(movie_id)
+
+    stats = {'cached': len(results), 'fetched': 0, 'failed': 0}
+    fetched = {}
+    in_flight = {}
+    while pending or in_flight:
+        while pending and len(in_flight) < concurrency:
+            movie_id = pending.pop(0)
+            future = fetcher.submit(DETAIL_URL.format(movie_id=movie_id), headers=DETAIL_HEADERS,
+                                    timeout=10, retries=retries)
+            in_flight[future] = movie_id
+
+        done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            movie_id = in_flight.pop(future)
+            try:
+                response = future.result()
+                with metrics.timed('parse'):
+                    details = parse_detail(response)
+            except Exception as e:
+                logger.warning("获取影片 %s 详情失败: %s", movie_id, e)
+                details = None
+            if details is None:
+                stats['failed'] += 1
+                continue
+            fetched[movie_id] = results[movie_id] = details
+            stats['fetched'] += 1
+
+    if fetched:
+        cache.put_many(fetched)
+    stats['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return results, stats
+
+
+def apply_details(movies, details_by_id):
+    """
+    将详情字段合并进电影记录，返回新的元组（原记录不修改）
+    """
+    return tuple(
+        dict(movie, **details_by_id[movie['猫眼ID']]) if movie.get('猫眼ID') in details_by_id else movie
+        for movie in movies
+    )
@@ -0,0 +1,214 @@
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+# 列名 -> 数据类型；每列是一个只追加的二进制文件，按行号对齐
+COLUMNS = {
+    'ts': np.float64,      # 快照时间（Unix 秒），按追加顺序单调不减
+    'board': np.int16,     # 榜单 ID
+    'movie': np.int64,     # 猫眼 ID
+    'rank': np.int16,      # 榜单名次
+    'score': np.float32,   # 评分，没有评分时为 NaN
+    'year': np.int16,      # 上映年份，未知时为 0
+}
+
+
+def parse_score(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def parse_year(value):
+    match = re.search(r'\d{4}', value or '')
+    return int(match.group(0)) if match else 0
+
+
+class RankingHistory:
+    """
+    榜单历史快照的列式存储
+
+    每次爬取追加一批行（每个榜单的每部电影一行），各列分别存为定长二进制文件，
+    查询时以 numpy.memmap 映射，时间范围通过二分查找定位，过滤与聚合都是向量化的，
+    不会把历史数据读成 Python 字典。电影名称单独保存在 names.json 中。
+    写入只在本进程内加锁，多进程部署时应只由一个进程追加。
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._names_path = os.path.join(directory, 'names.json')
+        try:
+            with open(self._names_path, encoding='utf-8') as f:
+                self.names = {int(k): v for k, v in json.load(f).items()}
+        except (OSError, ValueError):
+            self.names = {}
+        self._maps = {}
+
+    def _path(self, column):
+        return os.path.join(self.directory, f"{column}.bin")
+
+    def _rows(self):
+        """
+        完整写入的行数（各列长度的最小值，避免读到只写了一半的追加）
+        """
+        rows = None
+        for column, dtype in COLUMNS.items():
+            try:
+                size = os.path.getsize(self._path(column)) // np.dtype(dtype).itemsize
+            except OSError:
+                size = 0
+            rows = size if rows is None else min(rows, size)
+        return rows
+
+    def columns(self):
+        """
+        各列的只读 memmap（行数一致）；文件增长后自动重新映射
+        """
+        rows = self._rows()
+        if rows == 0:
+            return {column: np.empty(0, dtype) for column, dtype in COLUMNS.items()}
+        cached = self._maps.get(rows)
+        if cached is None:
+            cached = {
+                column: np.memmap(self._path(column), dtype=dtype, mode='r', shape=(rows,))
+                for column, dtype in COLUMNS.items()
+            }
+            self._maps = {rows: cached}
+        return cached
+
+    def append(self, ts, boards):
+        """
+        追加一次爬取的快照；boards 为 {榜单ID: 电影列表}，返回追加的行数
+        """
+        batch = {column: [] for column in COLUMNS}
+        new_names = {}
+        for board_id, movies in boards.items():
+            for movie in movies:
+                movie_id = movie.get('猫眼ID')
+                if movie_id is None:
+                    continue
+                batch['ts'].append(ts)
+                batch['board'].append(board_id)
+                batch['movie'].append(movie_id)
+                batch['rank'].append(int(movie['排名']))
+                batch['score'].append(parse_score(movie.get('评分')))
+                batch['year'].append(parse_year(movie.get('上映时间')))
+                if self.names.get(movie_id) != movie.get('电影名称'):
+                    new_names[movie_id] = movie.get('电影名称')
+        if not batch['ts']:
+            return 0
+
+        with self._lock:
+            rows = self._rows()
+            for column, dtype in COLUMNS.items():
+                path = self._path(column)
+                expected = rows * np.dtype(dtype).itemsize
+                with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+                    # 丢弃上次中断留下的不完整行，保证各列按行对齐
+                    if f.seek(0, os.SEEK_END) > expected:
+                        f.truncate(expected)
+                        f.seek(expected)
+                    f.write(np.asarray(batch[column], dtype=dtype).tobytes())
+            if new_names:
+                self.names.update(new_names)
+                tmp_path = f"{self._names_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.names, f, ensure_ascii=False)
+                os.replace(tmp_path, self._names_path)
+        return len(batch['ts'])
+
+    def window(self, since=None, until=None):
+        """
+        时间范围 [since, until] 内的行，返回各列的切片（仍是 memmap 视图）
+        """
+        cols = self.columns()
+        ts = cols['ts']
+        start = 0 if since is None else int(np.searchsorted(ts, since, side='left'))
+        stop = len(ts) if until is None else int(np.searchsorted(ts, until, side='right'))
+        return {column: values[start:stop] for column, values in cols.items()}
+
+    def summary(self):
+        ts = self.columns()['ts']
+        return {
+            'rows': int(len(ts)),
+            'snapshots': int(len(np.unique(ts))) if len(ts) else 0,
+            'first': float(ts[0]) if len(ts) else None,
+            'last': float(ts[-1]) if len(ts) else None,
+            'movies': len(self.names),
+        }
+
+    def trajectory(self, movie_id, board=None, since=None, until=None):
+        """
+        一部电影在各榜单上的名次与评分随时间的变化，按榜单分组、列式返回
+        """
+        cols = self.window(since, until)
+        mask = cols['movie'] == movie_id
+        if board is not None:
+            mask &= cols['board'] == board
+        idx = np.flatnonzero(mask)
+        boards = cols['board'][idx]
+        result = {}
+        for board_id in np.unique(boards):
+            rows = idx[boards == board_id]
+            scores = cols['score'][rows]
+            result[int(board_id)] = {
+                'ts': cols['ts'][rows].tolist(),
+                'rank': cols['rank'][rows].tolist(),
+                'score': [None if np.isnan(s) else round(float(s), 1) for s in scores],
+            }
+        return {'movie_id': movie_id, 'name': self.names.get(movie_id), 'boards': result}
+
+    def movement(self, board, since=None, until=None, top=10):
+        """
+        榜单在时间范围内首尾两次快照之间的变化：上升、下降、新上榜与跌出榜单
+        """
+        cols = self.window(since, until)
+        in_board = np.flatnonzero(cols['board'] == board)
+        if not len(in_board):
+            return None
+        ts = cols['ts'][in_board]
+        first, last = in_board[ts == ts[0]], in_board[ts == ts[-1]]
+        first_movies, last_movies = cols['movie'][first], cols['movie'][last]
+
+        common, i_first, i_last = np.intersect1d(first_movies, last_movies, return_indices=True)
+        # 名次数字变小为上升
+        delta = cols['rank'][first][i_first].astype(np.int32) - cols['rank'][last][i_last].astype(np.int32)
+        order = np.argsort(-delta, kind='stable')
+
+        def describe(movie_ids, ranks_from=None, ranks_to=None, deltas=None):
+            items = []
+            for i, movie_id in enumerate(movie_ids):
+                item = {'movie_id': int(movie_id), 'name': self.names.get(int(movie_id))}
+                if ranks_from is not None:
+                    item['from'] = int(ranks_from[i])
+                if ranks_to is not None:
+                    item['to'] = int(ranks_to[i])
+                if deltas is not None:
+                    item['change'] = int(deltas[i])
+                items.append(item)
+            return items
+
+        risers = order[delta[order] > 0][:top]
+        fallers = order[::-1][delta[order[::-1]] < 0][:top]
+        rank_of_last = dict(zip(last_movies.tolist(), cols['rank'][last].tolist()))
+        rank_of_first = dict(zip(first_movies.tolist(), cols['rank'][first].tolist()))
+        entered = np.array(sorted(np.setdiff1d(last_movies, first_movies).tolist(), key=rank_of_last.get), dtype=np.int64)
+        dropped = np.array(sorted(np.setdiff1d(first_movies, last_movies).tolist(), key=rank_of_first.get), dtype=np.int64)
+        return {
+            'board': board,
+            'from': float(ts[0]),
+            'to': float(ts[-1]),
+            'snapshots': int(len(np.unique(ts))),
+            'risers': describe(common[risers], cols['rank'][first][i_first][risers],
+                               cols['rank'][last][i_last][risers], delta[risers]),
+            'fallers': describe(common[fallers], cols['rank'][first][i_first][fallers],
+                                cols['rank'][last][i_last][fallers], delta[fallers]),
+            'entered': describe(entered[:top], ranks_to=[rank_of_last[m] for m in entered[:top].tolist()]),
+            'dropped': describe(dropped[:top], ranks_from=[rank_of_first[m] for m in dropped[:top].tolist()]),
+        }
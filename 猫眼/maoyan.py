@@ -1,97 +1,143 @@
 from flask import Flask, render_template, jsonify, send_file, request, Response
 import re
-import requests
 import csv
-import json
+import logging
 import os
+import sys
+import time
 from datetime import datetime
 from io import StringIO, BytesIO
-import jieba
-from wordcloud import WordCloud
-import matplotlib
-matplotlib.use('Agg') # Use non-interactive backend
-import matplotlib.pyplot as plt
 import base64
 
+# 共享的爬虫基础设施位于仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import metrics
+from common.blob_cache import BlobCache
+from common.fetcher import AsyncFetcher
+from common.http_cache import HttpCache
+from common.render_cache import WordCloudCache
+from common.snapshot_cache import SnapshotCache
+from common.warmup import warm_jieba
+from boards import BOARDS, crawl_boards
+from details import DetailCache, apply_details, fetch_details
+from history import RankingHistory
+from stats import (DEFAULT_PERCENTILES, DEFAULT_SCORE_EDGES, board_columns, compute_stats,
+                   parse_edges, parse_percentiles, select_board)
+
 app = Flask(__name__)
+logger = logging.getLogger(__name__)
 app.config['JSON_AS_ASCII'] = False
+# 请求耗时统计、Server-Timing 响应头与 Prometheus 格式的 /metrics 端点
+metrics.instrument_app(app)
+
+# 缓存与历史数据目录，可用环境变量改到其他位置（如基准测试使用的临时目录）
+CACHE_DIR = os.environ.get('MAOYAN_CACHE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+
+# 榜单与详情页的 HTTP 响应磁盘缓存（压缩存储，过期后条件请求校验）；
+# HTTP_CACHE_OFFLINE=1 时只回放缓存的页面，不访问网络
+http_cache = HttpCache(os.path.join(CACHE_DIR, 'http.db'))
+
+# 进程内共享的异步 HTTP 客户端（带连接池，榜单与图片代理共用）
+fetcher = AsyncFetcher(pool_size=100, per_host=16, timeout=10, retries=2, cache=http_cache)
+
+# 榜单快照缓存：TTL 内直接复用，过期后在 stale 窗口内先返回旧数据、后台刷新。
+# 一次刷新并发抓取全部榜单，主页表格与词云展示 TOP100 榜
+ALL_BOARDS = 'all'
+BOARD_ID = 4
+BOARD_TTL = float(os.environ.get('MAOYAN_BOARD_TTL', 600))
+BOARD_STALE_TTL = float(os.environ.get('MAOYAN_BOARD_STALE_TTL', 3600))
+
+# 海报图片的磁盘缓存（按内容哈希寻址，超过容量后按最近最少使用淘汰）
+POSTER_CACHE_DIR = os.path.join(CACHE_DIR, 'posters')
+poster_cache = BlobCache(POSTER_CACHE_DIR, max_bytes=int(os.environ.get('MAOYAN_POSTER_CACHE_BYTES', 256 * 1024 * 1024)))
+
+# 影片详情（类型、片长、导演、主演、票房）按猫眼 ID 缓存，TTL 内不重复请求；并发数为 0 时跳过详情补全
+DETAIL_TTL = float(os.environ.get('MAOYAN_DETAIL_TTL', 24 * 3600))
+DETAIL_CONCURRENCY = int(os.environ.get('MAOYAN_DETAIL_CONCURRENCY', 8))
+detail_cache = DetailCache(ttl=DETAIL_TTL, path=os.path.join(CACHE_DIR, 'details.json'))
+
+# 榜单历史快照（列式存储，每次爬取追加一批行）
+HISTORY_DIR = os.path.join(CACHE_DIR, 'history')
+ranking_history = RankingHistory(HISTORY_DIR)
 
-# 存储爬取的电影数据
-movies_data = []
+# 词云渲染结果的磁盘缓存（按词频表与渲染参数的哈希寻址）
+WORDCLOUD_CACHE_DIR = os.path.join(CACHE_DIR, 'wordclouds')
+wordcloud_cache = WordCloudCache(WORDCLOUD_CACHE_DIR)
 
-def scrape_maoyan_movies():
+# jieba 与 wordcloud 在首次使用时才导入；词典在后台线程中从 CACHE_DIR 下的缓存预先加载
+warm_jieba(CACHE_DIR)
+
+def scrape_maoyan_movies(key=ALL_BOARDS):
+    """
+    爬取猫眼电影全部榜单数据 (使用移动端接口，各榜单并发请求)
+    返回完整的结果，失败时抛出 ScrapeError；不修改任何全局状态
+    """
+    # 加载在后台线程中进行，各阶段耗时单独收集并随结果保存
+    with metrics.collect() as timings:
+        result = load_boards()
+    result['timings'] = timings.to_dict()
+    return result
+
+def load_boards():
     """
-    爬取猫眼电影排行数据 (使用移动端接口)
+    并发抓取全部榜单并补全影片详情
     """
-    global movies_data
-    movies_data = []
+    previous = board_cache.peek(ALL_BOARDS)
+    result = crawl_boards(fetcher, previous=previous.value if previous else None)
+    timings = ", ".join(
+        f"{board['name']} {board['done_ms']}ms" + (" (失败)" if board['error'] else "")
+        for board in result['boards'].values()
+    )
+    logger.info("爬取 %d 个榜单用时 %sms: %s", len(result['boards']), result['elapsed_ms'], timings)
     
-    # 使用移动端地址，可以一次性获取100条数据且反爬较松
-    url = "https://m.maoyan.com/asgard/board/4"
+    # 详情补全：只请求缓存中没有或已过期的影片
+    if DETAIL_CONCURRENCY > 0:
+        details, stats = fetch_details(fetcher, [m['猫眼ID'] for m in result['movies']], detail_cache,
+                                       concurrency=DETAIL_CONCURRENCY)
+        logger.info("影片详情: 缓存 %d，新获取 %d，失败 %d，用时 %sms",
+                    stats['cached'], stats['fetched'], stats['failed'], stats['elapsed_ms'])
+        result['movies'] = apply_details(result['movies'], details)
+        for board in result['boards'].values():
+            board['movies'] = apply_details(board['movies'], details)
+        result['details'] = stats
     
-    # 模拟移动端 User-Agent
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-        'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-        'Referer': 'https://m.maoyan.com/asgard/board/4',
-        'Connection': 'keep-alive'
-    }
+    # 统计所需的数值与日期列在这里一次性解析
+    result['columns'] = board_columns(result['boards'])
+    return result
+
+def on_board_update(snapshot):
+    """
+    新快照发布后：追加到历史快照存储，并在后台预渲染词云
+    """
+    # 沿用上次数据的榜单（本次抓取失败）不重复记录
+    fresh = {board_id: board['movies'] for board_id, board in snapshot.value['boards'].items()
+             if not board['stale'] and board['movies']}
+    ranking_history.append(snapshot.fetched_at, fresh)
     
-    try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.encoding = 'utf-8'
-        
-        if response.status_code == 200:
-            html_content = response.text
-            
-            # 提取嵌入在页面中的 JSON 数据
-            # 查找 var AppData = {...}; 模式
-            json_match = re.search(r'var AppData = ({.*?});', html_content, re.DOTALL)
-            
-            if json_match:
-                json_str = json_match.group(1)
-                try:
-                    data = json.loads(json_str)
-                    # 提取电影列表
-                    movies_list = data.get('data', {}).get('movies', [])
-                    
-                    for idx, movie in enumerate(movies_list, 1):
-                        # 提取字段
-                        rank = str(idx)
-                        name = movie.get('nm', '未知')
-                        score = str(movie.get('sc', '暂无评分'))
-                        release_date = movie.get('rt', '未知')
-                        movie_id = movie.get('id')
-                        # 构建链接
-                        movie_link = f"https://maoyan.com/films/{movie_id}" if movie_id else "#"
-                        # 图片链接
-                        image_url = movie.get('img', '')
-                        # 替换图片尺寸，获取更高清的图 (可选)
-                        if image_url:
-                            image_url = image_url.replace('w.h', '128.180') # 尝试调整尺寸，或者直接用原图
-                        
-                        movie_info = {
-                            '排名': rank,
-                            '电影名称': name,
-                            '评分': score,
-                            '上映时间': release_date,
-                            '链接': movie_link,
-                            '图片': image_url
-                        }
-                        movies_data.append(movie_info)
-                        
-                    return True, f"成功爬取 {len(movies_data)} 部电影"
-                    
-                except json.JSONDecodeError as e:
-                    return False, f"JSON解析失败: {e}"
-            else:
-                return False, "未找到电影数据 (AppData)"
-        else:
-            return False, f"请求失败，状态码: {response.status_code}"
-            
-    except Exception as e:
-        return False, f"爬取过程中出错: {e}"
+    movies = snapshot.value['boards'][BOARD_ID]['movies']
+    wordcloud_cache.prerender(wordcloud_frequencies(movies), wordcloud_options())
+
+# 同一时刻的多个爬取请求只会触发一次上游抓取；读者拿到的总是完整快照
+board_cache = SnapshotCache(scrape_maoyan_movies, ttl=BOARD_TTL, stale_ttl=BOARD_STALE_TTL,
+                            on_update=on_board_update, name='maoyan_boards')
+
+def board_summary(result):
+    """
+    各榜单的数量、耗时与错误信息（不含电影列表）
+    """
+    return {
+        board_id: {k: v for k, v in board.items() if k != 'movies'} | {'count': len(board['movies'])}
+        for board_id, board in result['boards'].items()
+    }
+
+def current_board():
+    """
+    当前展示榜单的快照 (movies, version)，不触发抓取；没有数据时返回 ((), 0)
+    """
+    snapshot = board_cache.peek(ALL_BOARDS)
+    if snapshot is None:
+        return (), 0
+    return snapshot.value['boards'][BOARD_ID]['movies'], snapshot.version
 
 @app.route('/')
 def index():
@@ -101,14 +147,75 @@ def index():
 def api_scrape():
     """
     API端点：执行爬虫
+    缓存未过期时直接返回缓存快照；请求体 {"force": true} 时强制刷新（并发请求仍合并为一次抓取）
     """
-    success, message = scrape_maoyan_movies()
+    force = bool((request.get_json(silent=True) or {}).get('force'))
+    _, previous_version = current_board()
+    try:
+        snapshot = board_cache.get(ALL_BOARDS, force=force)
+    except Exception as e:
+        # 刷新失败时仍返回已有数据
+        movies, version = current_board()
+        return jsonify({
+            'success': False,
+            'message': str(e),
+            'data': movies,
+            'count': len(movies),
+            'version': version
+        })
     
+    result = snapshot.value
+    movies = result['boards'][BOARD_ID]['movies']
+    if snapshot.version != previous_version:
+        # 本次请求等到了新的抓取结果：Server-Timing 中附上抓取各阶段的耗时
+        metrics.current_timings().merge(result['timings'])
+        message = f"成功爬取 {len(result['boards'])} 个榜单，共 {len(result['movies'])} 部电影"
+    else:
+        age = int(time.time() - snapshot.fetched_at)
+        message = f"使用 {age} 秒前的缓存数据，共 {len(result['movies'])} 部电影"
     return jsonify({
-        'success': success,
+        'success': True,
         'message': message,
-        'data': movies_data,
-        'count': len(movies_data)
+        'data': movies,
+        'count': len(movies),
+        'version': snapshot.version,
+        'fetched_at': snapshot.fetched_at,
+        'boards': board_summary(result),
+        'total_movies': len(result['movies']),
+        'elapsed_ms': result['elapsed_ms'],
+        'details': result.get('details')
+    })
+
+@app.route('/api/boards', methods=['GET'])
+def api_boards():
+    """
+    API端点：各榜单的电影列表与抓取耗时（只读取缓存快照）
+    """
+    snapshot = board_cache.peek(ALL_BOARDS)
+    if snapshot is None:
+        return jsonify({'success': False, 'message': '没有数据'}), 400
+    summary = board_summary(snapshot.value)
+    boards = []
+    for board_id, board in snapshot.value['boards'].items():
+        boards.append(dict(summary[board_id], movies=board['movies']))
+    return jsonify({
+        'success': True,
+        'version': snapshot.version,
+        'elapsed_ms': snapshot.value['elapsed_ms'],
+        'boards': boards
+    })
+
+@app.route('/api/movies', methods=['GET'])
+def api_movies():
+    """
+    API端点：全部榜单合并去重后的电影（"榜单" 字段记录所在榜单及名次）
+    """
+    snapshot = board_cache.peek(ALL_BOARDS)
+    movies = snapshot.value['movies'] if snapshot else ()
+    return jsonify({
+        'data': movies,
+        'count': len(movies),
+        'version': snapshot.version if snapshot else 0
     })
 
 @app.route('/api/data', methods=['GET'])
@@ -116,30 +223,82 @@ def api_get_data():
     """
     API端点：获取当前爬取的数据
     """
+    movies, version = current_board()
     return jsonify({
-        'data': movies_data,
-        'count': len(movies_data)
+        'data': movies,
+        'count': len(movies),
+        'version': version
     })
 
+def parse_time_arg(name):
+    """
+    时间参数：Unix 秒或 ISO 日期（如 2024-01-31 / 2024-01-31T08:00），未提供时为 None
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route('/api/history', methods=['GET'])
+def api_history():
+    """
+    API端点：历史快照概况（行数、快照次数、时间范围）
+    """
+    return jsonify({'success': True, **ranking_history.summary()})
+
+@app.route('/api/history/trajectory', methods=['GET'])
+def api_history_trajectory():
+    """
+    API端点：一部电影的名次与评分轨迹 ?movie_id=&board=&since=&until=
+    """
+    try:
+        movie_id = int(request.args['movie_id'])
+        board = int(request.args['board']) if request.args.get('board') else None
+        since, until = parse_time_arg('since'), parse_time_arg('until')
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'message': '参数错误'}), 400
+    return jsonify({'success': True, **ranking_history.trajectory(movie_id, board, since, until)})
+
+@app.route('/api/history/movement', methods=['GET'])
+def api_history_movement():
+    """
+    API端点：榜单在时间范围内的名次变化 ?board=&since=&until=&top=
+    """
+    try:
+        board = int(request.args.get('board', BOARD_ID))
+        top = max(1, min(int(request.args.get('top', 10)), 100))
+        since, until = parse_time_arg('since'), parse_time_arg('until')
+    except ValueError:
+        return jsonify({'success': False, 'message': '参数错误'}), 400
+    movement = ranking_history.movement(board, since, until, top)
+    if movement is None:
+        return jsonify({'success': False, 'message': '没有历史数据'}), 404
+    return jsonify({'success': True, **movement})
+
 @app.route('/api/export/csv', methods=['POST'])
 def export_csv():
     """
     导出为CSV文件
     """
+    movies_data, _ = current_board()
     try:
         if not movies_data:
             return jsonify({'success': False, 'message': '没有数据可导出'}), 400
         
-        # 创建CSV内容
-        output = StringIO()
-        writer = csv.DictWriter(output, fieldnames=['排名', '电影名称', '评分', '上映时间'])
-        writer.writeheader()
-        writer.writerows(movies_data)
-        
-        # 转换为字节流
-        bytes_output = BytesIO()
-        bytes_output.write(output.getvalue().encode('utf-8-sig'))
-        bytes_output.seek(0)
+        with metrics.timed('export'):
+            # 创建CSV内容
+            output = StringIO()
+            writer = csv.DictWriter(output, fieldnames=['排名', '电影名称', '评分', '上映时间'], extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(movies_data)
+            
+            # 转换为字节流
+            bytes_output = BytesIO()
+            bytes_output.write(output.getvalue().encode('utf-8-sig'))
+            bytes_output.seek(0)
         
         return send_file(
             bytes_output,
@@ -155,28 +314,30 @@ def export_txt():
     """
     导出为TXT文件
     """
+    movies_data, _ = current_board()
     try:
         if not movies_data:
             return jsonify({'success': False, 'message': '没有数据可导出'}), 400
         
-        # 创建TXT内容
-        output = StringIO()
-        output.write("猫眼电影排行榜\n")
-        output.write("=" * 60 + "\n")
-        output.write(f"爬取时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        output.write("=" * 60 + "\n\n")
-        
-        for movie in movies_data:
-            output.write(f"排名: {movie['排名']}\n")
-            output.write(f"电影名称: {movie['电影名称']}\n")
-            output.write(f"评分: {movie['评分']}\n")
-            output.write(f"上映时间: {movie['上映时间']}\n")
-            output.write("-" * 60 + "\n")
-        
-        # 转换为字节流
-        bytes_output = BytesIO()
-        bytes_output.write(output.getvalue().encode('utf-8'))
-        bytes_output.seek(0)
+        with metrics.timed('export'):
+            # 创建TXT内容
+            output = StringIO()
+            output.write("猫眼电影排行榜\n")
+            output.write("=" * 60 + "\n")
+            output.write(f"爬取时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            output.write("=" * 60 + "\n\n")
+            
+            for movie in movies_data:
+                output.write(f"排名: {movie['排名']}\n")
+                output.write(f"电影名称: {movie['电影名称']}\n")
+                output.write(f"评分: {movie['评分']}\n")
+                output.write(f"上映时间: {movie['上映时间']}\n")
+                output.write("-" * 60 + "\n")
+            
+            # 转换为字节流
+            bytes_output = BytesIO()
+            bytes_output.write(output.getvalue().encode('utf-8'))
+            bytes_output.seek(0)
         
         return send_file(
             bytes_output,
@@ -190,132 +351,247 @@ def export_txt():
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """
-    获取统计数据
+    获取统计数据（基于爬取时解析好的类型化列，NumPy 向量化计算）
+    参数：board=榜单ID|all（默认 TOP100）、score_edges=8,8.5,9,9.5、percentiles=10,50,90、
+    scope=history 时统计 since/until 范围内的全部历史快照
     """
-    if not movies_data:
+    try:
+        board = request.args.get('board', str(BOARD_ID))
+        board = None if board == 'all' else int(board)
+        edges = parse_edges(request.args['score_edges']) if request.args.get('score_edges') else DEFAULT_SCORE_EDGES
+        percentiles = (parse_percentiles(request.args['percentiles'])
+                       if request.args.get('percentiles') else DEFAULT_PERCENTILES)
+        since, until = parse_time_arg('since'), parse_time_arg('until')
+    except ValueError:
+        return jsonify({'success': False, 'message': '参数错误'}), 400
+    
+    if request.args.get('scope') == 'history':
+        columns = ranking_history.window(since, until)
+    else:
+        snapshot = board_cache.peek(ALL_BOARDS)
+        if snapshot is None:
+            return jsonify({'success': False, 'message': '没有数据'}), 400
+        columns = snapshot.value['columns']
+    columns = select_board(columns, board)
+    if not len(columns['score']):
         return jsonify({'success': False, 'message': '没有数据'}), 400
     
-    # 评分分布
-    scores = []
-    for m in movies_data:
-        try:
-            scores.append(float(m['评分']))
-        except:
-            pass
-            
-    score_dist = {'9.5-10.0': 0, '9.0-9.5': 0, '8.5-9.0': 0, '8.0-8.5': 0, '<8.0': 0}
-    for s in scores:
-        if s >= 9.5: score_dist['9.5-10.0'] += 1
-        elif s >= 9.0: score_dist['9.0-9.5'] += 1
-        elif s >= 8.5: score_dist['8.5-9.0'] += 1
-        elif s >= 8.0: score_dist['8.0-8.5'] += 1
-        else: score_dist['<8.0'] += 1
-        
-    # 年份分布
-    years = {}
-    for m in movies_data:
-        date_str = m['上映时间']
-        # 尝试提取年份 (假设格式包含 YYYY)
-        match = re.search(r'\d{4}', date_str)
-        if match:
-            year = match.group(0)
-            years[year] = years.get(year, 0) + 1
-            
-    # 排序年份
-    sorted_years = dict(sorted(years.items()))
+    return jsonify({'success': True, **compute_stats(columns, edges, percentiles, BOARDS)})
+
+def wordcloud_frequencies(movies):
+    """
+    统计电影名称分词后的词频（词云的输入）
+    """
+    text = " ".join([m['电影名称'] for m in movies])
     
-    return jsonify({
-        'success': True,
-        'score_distribution': score_dist,
-        'year_distribution': sorted_years
-    })
+    # 使用jieba分词，只保留 WordCloud 会采用的词（至少两个字符）
+    import jieba
+    with metrics.timed('tokenize'):
+        words = [w for w in jieba.cut(text) if re.match(r"^\w[\w']+$", w)]
+    frequencies = {}
+    for w in words:
+        frequencies[w] = frequencies.get(w, 0) + 1
+    return frequencies
+
+def wordcloud_options():
+    """
+    词云渲染参数
+    """
+    # 设置字体路径 (Windows常见字体)
+    font_path = "C:/Windows/Fonts/msyh.ttc" # 微软雅黑
+    if not os.path.exists(font_path):
+        font_path = "C:/Windows/Fonts/simhei.ttf" # 黑体
+    
+    return {
+        'font_path': font_path,
+        'background_color': 'white',
+        'width': 800,
+        'height': 600,
+        'max_words': 100
+    }
 
 @app.route('/api/wordcloud', methods=['GET'])
 def get_wordcloud():
     """
-    生成词云图
+    生成词云图（相同词频与参数只渲染一次，命中磁盘缓存后直接返回）
     """
+    movies_data, _ = current_board()
     if not movies_data:
         return jsonify({'success': False, 'message': '没有数据'}), 400
         
-    text = " ".join([m['电影名称'] for m in movies_data])
-    
-    # 使用jieba分词
-    words = jieba.cut(text)
-    processed_text = " ".join(words)
-    
-    # 设置字体路径 (Windows常见字体)
-    font_path = "C:/Windows/Fonts/msyh.ttc" # 微软雅黑
-    if not os.path.exists(font_path):
-        font_path = "C:/Windows/Fonts/simhei.ttf" # 黑体
+    frequencies = wordcloud_frequencies(movies_data)
+    if not frequencies:
+        return jsonify({'success': False, 'message': '没有可用的关键词'}), 400
         
     try:
-        wc = WordCloud(
-            font_path=font_path,
-            background_color='white',
-            width=800,
-            height=600,
-            max_words=100
-        ).generate(processed_text)
-        
-        # 保存到内存
-        img_io = BytesIO()
-        wc.to_image().save(img_io, 'PNG')
-        img_io.seek(0)
+        key, png = wordcloud_cache.get_or_render(frequencies, wordcloud_options())
         
-        return send_file(img_io, mimetype='image/png')
+        response = Response(png, mimetype='image/png')
+        # 以缓存键作为 ETag，浏览器每次用 If-None-Match 廉价地重新验证
+        response.set_etag(key)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({'success': False, 'message': f'生成词云失败: {str(e)}'}), 500
 
+# 图片变体参数的取值范围
+POSTER_MAX_SIZE = 1024
+POSTER_FORMATS = {'webp': 'image/webp', 'jpeg': 'image/jpeg', 'png': 'image/png'}
+# 同一 URL 的海报内容不会变化，浏览器可以长期缓存
+POSTER_MAX_AGE = 7 * 24 * 3600
+
+def poster_variant(args):
+    """
+    解析 w / h / format 参数，返回 (宽, 高, 格式)；未指定时为 None，参数非法时抛出 ValueError
+    """
+    def size(name):
+        value = args.get(name)
+        if not value:
+            return None
+        value = int(value)
+        if not 0 < value <= POSTER_MAX_SIZE:
+            raise ValueError(name)
+        return value
+
+    fmt = args.get('format') or None
+    if fmt is not None and fmt not in POSTER_FORMATS:
+        raise ValueError('format')
+    return size('w'), size('h'), fmt
+
+def render_poster_variant(data, width, height, fmt):
+    """
+    使用 Pillow 缩放并重新编码海报，返回 (bytes, content_type)；未安装 Pillow 时返回 None
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    img = Image.open(BytesIO(data))
+    fmt = fmt or ('png' if img.format == 'PNG' else 'jpeg')
+    if width or height:
+        # 等比缩放到目标框内，只缩小不放大
+        img.thumbnail((width or img.width, height or img.height), Image.LANCZOS)
+    if fmt == 'jpeg' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    output = BytesIO()
+    img.save(output, fmt.upper(), quality=80)
+    return output.getvalue(), POSTER_FORMATS[fmt]
+
+def send_cached_poster(digest, content_type, path):
+    """
+    从磁盘缓存返回海报，带 ETag 与长期缓存头，支持 304
+    """
+    response = send_file(path, mimetype=content_type, etag=digest, max_age=POSTER_MAX_AGE, conditional=True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
 @app.route('/api/image_proxy')
 def image_proxy():
     """
     代理图片请求，解决跨域问题
+    海报按内容哈希缓存在磁盘上；可选参数 w / h / format（webp、jpeg、png）由服务端缩放并重新编码
     """
     img_url = request.args.get('url')
     if not img_url:
         return "No URL provided", 400
+    if not img_url.startswith(('http://', 'https://')):
+        return "Invalid URL", 400
+    try:
+        width, height, fmt = poster_variant(request.args)
+    except ValueError:
+        return "Invalid image parameters", 400
     
+    variant_key = f"{img_url}|w={width}|h={height}|format={fmt}" if (width or height or fmt) else None
+
+    # 1. 命中缓存：不访问网络
+    cached = poster_cache.lookup(variant_key or img_url)
+    metrics.cache_result('posters', 'hit' if cached else 'miss')
+    if cached:
+        return send_cached_poster(*cached)
+    
+    # 伪装 Header
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+        'Referer': 'https://maoyan.com/'
+    }
+    
+    # 2. 需要变体：基于原图（缓存或整体下载）渲染后存入缓存
+    if variant_key:
+        try:
+            original = poster_cache.read(img_url)
+            if original is None:
+                # 原图已存入海报缓存，不再经过 HTTP 缓存
+                resp = fetcher.get(img_url, headers=headers, timeout=5, use_cache=False)
+                if resp.status_code != 200:
+                    return f"Image Proxy Error: upstream status {resp.status_code}", 502
+                content_type = resp.headers.get('Content-Type', 'application/octet-stream')
+                poster_cache.put(img_url, resp.content, content_type)
+                original = (None, content_type, resp.content)
+            rendered = render_poster_variant(original[2], width, height, fmt)
+        except Exception as e:
+            return f"Image Proxy Error: {e}", 500
+        if rendered is None:
+            # 没有 Pillow：退回原图
+            return send_cached_poster(*poster_cache.lookup(img_url))
+        poster_cache.put(variant_key, *rendered)
+        return send_cached_poster(*poster_cache.lookup(variant_key))
+    
+    # 3. 原图未命中：边从上游读取边转发给客户端，同时写入缓存
     try:
-        # 伪装 Header
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Referer': 'https://maoyan.com/'
-        }
-        resp = requests.get(img_url, headers=headers, stream=True, timeout=5)
-        
-        excluded_headers = ['content-encoding', 'content-length', 'transfer-encoding', 'connection']
-        headers = [(name, value) for (name, value) in resp.raw.headers.items()
-                   if name.lower() not in excluded_headers]
-                   
-        return Response(resp.content, resp.status_code, headers)
+        resp = fetcher.stream(img_url, headers=headers, timeout=5)
     except Exception as e:
         return f"Image Proxy Error: {e}", 500
+    
+    excluded_headers = ['content-encoding', 'content-length', 'transfer-encoding', 'connection']
+    headers = [(name, value) for (name, value) in resp.headers.items()
+               if name.lower() not in excluded_headers]
+    if resp.status_code != 200:
+        return Response(resp.iter_content(), resp.status_code, headers)
+    
+    def generate():
+        writer = poster_cache.writer(img_url, resp.headers.get('Content-Type', 'application/octet-stream'))
+        complete = False
+        try:
+            for chunk in resp.iter_content():
+                writer.write(chunk)
+                yield chunk
+            complete = True
+        finally:
+            # 客户端中途断开或上游出错时不缓存残缺的图片
+            if complete:
+                writer.commit()
+            else:
+                writer.abort()
+                resp.close()
+    
+    response = Response(generate(), 200, headers)
+    response.headers['Cache-Control'] = f"public, max-age={POSTER_MAX_AGE}"
+    return response
 
 @app.route('/gallery')
 def gallery():
     """
     3D 影廊页面，展示前10名电影
     """
-    global movies_data
     top_10 = []
 
-    # 1. 尝试使用已有数据
-    if movies_data:
-        top_10 = movies_data[:10]
-        print(f"Gallery使用现有数据: {len(top_10)}条")
+    # 1. 使用缓存快照：未过期直接返回，过期不久则先返回旧数据并在后台刷新，
+    #    没有数据时才同步爬取（与并发的其他爬取请求合并为一次）
+    try:
+        top_10 = list(board_cache.get(ALL_BOARDS).value['boards'][BOARD_ID]['movies'][:10])
+        logger.info("Gallery使用榜单数据: %d条", len(top_10))
+    except Exception as e:
+        logger.warning("Gallery爬取失败: %s", e)
 
-    # 2. 如果没有数据，尝试爬取
+    # 2. 爬取失败时退回到已有的旧快照
     if not top_10:
-        print("Gallery数据为空，尝试重新爬取...")
-        scrape_maoyan_movies()
-        if movies_data:
-            top_10 = movies_data[:10]
-            print(f"Gallery重新爬取成功: {len(top_10)}条")
+        top_10 = list(current_board()[0][:10])
     
     # 3. 如果还是没有数据（爬取失败），使用保底数据
     if not top_10:
-        print("Gallery爬取失败，使用模拟数据")
+        logger.warning("Gallery爬取失败，使用模拟数据")
         top_10 = [
             {'电影名称': "数据加载失败", '评分': "0.0", '图片': ''},
             {'电影名称': "请检查网络", '评分': "0.0", '图片': ''},
@@ -353,4 +629,5 @@ def gallery():
     return render_template('gallery.html', movies=formatted_movies)
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
     app.run(debug=True, host='127.0.0.1', port=5000)
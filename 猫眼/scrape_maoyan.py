@@ -1,103 +1,52 @@
-import re
-import requests
+import argparse
 import csv
+import os
+import sys
 from datetime import datetime
 
-def scrape_maoyan_movies():
+# 共享的爬虫基础设施位于仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.fetcher import AsyncFetcher
+from common.http_cache import HttpCache
+from boards import BOARDS, ScrapeError, crawl_boards
+
+# 与网页应用共用的 HTTP 响应缓存
+HTTP_CACHE_PATH = os.path.join(
+    os.environ.get('MAOYAN_CACHE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache'),
+    'http.db')
+
+def scrape_maoyan_movies(offline=False):
     """
-    爬取猫眼电影排行数据
+    爬取猫眼电影全部榜单数据（热映口碑、最受期待、国内/北美票房、TOP100）
+    各榜单通过共享连接池并发请求，返回合并去重后的电影列表
+    offline 为 True 时只解析 HTTP 缓存中的页面，不访问网络
     """
-    # 猫眼电影排行榜URL
-    url = "https://maoyan.com/board"
-    
-    # 设置请求头，模拟浏览器访问
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Referer': 'https://maoyan.com/'
-    }
-    
-    movies = []
+    cache = HttpCache(HTTP_CACHE_PATH, offline=offline or None)
+    fetcher = AsyncFetcher(pool_size=len(BOARDS), per_host=len(BOARDS), timeout=10, retries=2, cache=cache)
     
     try:
-        # 发送GET请求
-        print("正在请求猫眼电影数据...")
-        response = requests.get(url, headers=headers, timeout=10)
-        response.encoding = 'utf-8'
-        
-        if response.status_code == 200:
-            html_content = response.text
-            
-            # 使用正则表达式提取电影信息
-            # 匹配模式：电影排名、名称、上映时间等信息
-            
-            # 电影排名和名称的正则表达式
-            rank_pattern = r'<p class="p-rank">\n\s+<i class="board-index board-index-\d+">\n\s+(\d+)\n\s+</i>'
-            name_pattern = r'<p class="p-name"><a href="[^"]*" title="([^"]*)"'
-            
-            # 获取所有电影名称
-            names = re.findall(name_pattern, html_content)
-            
-            # 获取所有排名
-            ranks = re.findall(rank_pattern, html_content)
-            
-            # 提取更详细的信息（使用多个正则表达式组合）
-            # 电影块的正则表达式
-            movie_pattern = r'<p class="p-rank">.*?<i class="board-index board-index-\d+">.*?(\d+).*?</i>.*?<p class="p-name"><a href="[^"]*" title="([^"]*)".*?<p class="p-score">.*?<i class="score">([^<]*)</i>.*?</p>'
-            
-            # 更精确的匹配方式 - 获取整个电影div块
-            movie_blocks = re.findall(
-                r'<div class="board-item-content">(.*?)</div>\s*</div>\s*</li>',
-                html_content,
-                re.DOTALL
-            )
-            
-            print(f"找到 {len(movie_blocks)} 部电影")
-            
-            for idx, block in enumerate(movie_blocks[:10], 1):  # 获取前10部
-                # 从块中提取排名
-                rank_match = re.search(r'<i class="board-index board-index-\d+">.*?(\d+)', block, re.DOTALL)
-                rank = rank_match.group(1) if rank_match else str(idx)
-                
-                # 从块中提取电影名称
-                name_match = re.search(r'<p class="p-name"><a[^>]*title="([^"]*)"', block)
-                name = name_match.group(1) if name_match else "未知"
-                
-                # 从块中提取评分
-                score_match = re.search(r'<i class="score">([^<]*)</i>', block)
-                score = score_match.group(1) if score_match else "N/A"
-                
-                # 从块中提取上映时间
-                release_match = re.search(r'<p class="p-release">(\d{4}-\d{2}-\d{2})</p>', block)
-                release_date = release_match.group(1) if release_match else "未知"
-                
-                movie_info = {
-                    '排名': rank,
-                    '电影名称': name,
-                    '评分': score,
-                    '上映时间': release_date
-                }
-                
-                movies.append(movie_info)
-                print(f"排名 {rank}: {name} - 评分: {score}")
-            
-            # 保存为CSV文件
-            if movies:
-                filename = 'maoyan_movies.csv'
-                save_to_csv(movies, filename)
-                print(f"\n数据已保存到 {filename}")
-            
-            return movies
-        
+        print(f"正在并发请求 {len(BOARDS)} 个猫眼榜单...")
+        result = crawl_boards(fetcher)
+    except ScrapeError as e:
+        print(f"爬取失败: {e}")
+        return []
+    finally:
+        fetcher.close()
+    
+    for board in result['boards'].values():
+        if board['error']:
+            print(f"{board['name']}: 失败 ({board['error']})")
         else:
-            print(f"请求失败，状态码: {response.status_code}")
-            return []
+            print(f"{board['name']}: {len(board['movies'])} 部电影，"
+                  f"请求 {board['fetch_ms']}ms，解析 {board['parse_ms']}ms")
+    print(f"总耗时 {result['elapsed_ms']}ms，去重后共 {len(result['movies'])} 部电影")
     
-    except requests.exceptions.RequestException as e:
-        print(f"请求出错: {e}")
-        return []
-    except Exception as e:
-        print(f"发生错误: {e}")
-        return []
+    movies = []
+    for movie in result['movies']:
+        # 文件中以文本记录所在榜单及名次
+        boards = " / ".join(f"{name}#{rank}" for name, rank in movie['榜单'].items())
+        movies.append(dict(movie, 榜单=boards))
+    return movies
 
 def save_to_csv(movies, filename):
     """
@@ -106,7 +55,9 @@ def save_to_csv(movies, filename):
     try:
         with open(filename, 'w', encoding='utf-8-sig', newline='') as f:
             if movies:
-                writer = csv.DictWriter(f, fieldnames=movies[0].keys())
+                # 各榜单字段不完全相同，取所有字段的并集
+                fieldnames = list(dict.fromkeys(key for movie in movies for key in movie))
+                writer = csv.DictWriter(f, fieldnames=fieldnames)
                 writer.writeheader()
                 writer.writerows(movies)
         print(f"成功保存 {len(movies)} 部电影数据")
@@ -125,7 +76,7 @@ def save_to_txt(movies, filename):
             f.write("=" * 60 + "\n\n")
             
             for movie in movies:
-                f.write(f"排名: {movie['排名']}\n")
+                f.write(f"榜单: {movie['榜单']}\n")
                 f.write(f"电影名称: {movie['电影名称']}\n")
                 f.write(f"评分: {movie['评分']}\n")
                 f.write(f"上映时间: {movie['上映时间']}\n")
@@ -136,8 +87,12 @@ def save_to_txt(movies, filename):
         print(f"保存文本文件出错: {e}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="爬取猫眼电影榜单")
+    parser.add_argument('--offline', action='store_true', help="只回放 HTTP 缓存中的页面，不访问网络")
+    args = parser.parse_args()
+    
     # 爬取数据
-    movies = scrape_maoyan_movies()
+    movies = scrape_maoyan_movies(offline=args.offline)
     
     # 同时保存为TXT和CSV格式
     if movies:
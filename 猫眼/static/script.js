@@ -52,7 +52,7 @@ async function startScrape() {
             updateCards(moviesData.slice(0, 3)); // 更新前3名卡片
             updateJsonDisplay(moviesData);
             updateCountBadge(result.count);
-            updateVisualization(); // 更新可视化
+            updateVisualization(result.version); // 更新可视化
             showStatus(`✅ 成功爬取 ${result.count} 部电影！`, 'success');
         } else {
             showStatus(`❌ ${result.message}`, 'error');
@@ -314,7 +314,7 @@ document.addEventListener('keydown', (e) => {
 /**
  * 更新可视化图表
  */
-async function updateVisualization() {
+async function updateVisualization(version) {
     const vizSection = document.getElementById('vizSection');
     vizSection.style.display = 'block';
 
@@ -334,8 +334,8 @@ async function updateVisualization() {
         loadingText.style.display = 'block';
         wordCloudImg.style.display = 'none';
 
-        // 加载词云图片
-        wordCloudImg.src = `/api/wordcloud?t=${new Date().getTime()}`;
+        // 加载词云图片：URL 只随数据版本变化，其余由 ETag 重新验证
+        wordCloudImg.src = `/api/wordcloud?v=${version}`;
         wordCloudImg.onload = () => {
             loadingText.style.display = 'none';
             wordCloudImg.style.display = 'block';
@@ -0,0 +1,135 @@
+import numpy as np
+
+from history import parse_score, parse_year
+
+# 默认评分分段与原 /api/stats 一致：<8.0, 8.0-8.5, 8.5-9.0, 9.0-9.5, 9.5-10.0
+DEFAULT_SCORE_EDGES = (8.0, 8.5, 9.0, 9.5)
+SCORE_MAX = 10.0
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def board_columns(boards):
+    """
+    爬取时一次性把各榜单转换为带类型的列（评分、年份等），统计时不再逐行解析字符串
+    boards 为 {榜单ID: {'movies': [...]}}；与历史快照一致，没有猫眼 ID 的电影不计入
+    """
+    rows = [(board_id, movie) for board_id, board in boards.items() for movie in board['movies']
+            if movie.get('猫眼ID') is not None]
+    return {
+        'board': np.array([board_id for board_id, _ in rows], dtype=np.int16),
+        'movie': np.array([movie['猫眼ID'] for _, movie in rows], dtype=np.int64),
+        'rank': np.array([int(movie['排名']) for _, movie in rows], dtype=np.int16),
+        'score': np.array([parse_score(movie.get('评分')) for _, movie in rows], dtype=np.float32),
+        'year': np.array([parse_year(movie.get('上映时间')) for _, movie in rows], dtype=np.int16),
+    }
+
+
+def select_board(columns, board_id):
+    """
+    只保留一个榜单的行；board_id 为 None 时返回全部
+    """
+    if board_id is None:
+        return columns
+    mask = columns['board'] == board_id
+    return {name: values[mask] for name, values in columns.items()}
+
+
+def parse_edges(text):
+    """
+    解析 "8,8.5,9,9.5" 形式的分段边界，要求严格递增、位于 (0, 10]，
+    且精确到 0.1（猫眼评分只有一位小数，分段标签也按一位小数显示）
+    """
+    edges = tuple(float(x) for x in text.split(',') if x.strip())
+    if not edges or len(edges) > 20:
+        raise ValueError(text)
+    if any(b <= a for a, b in zip(edges, edges[1:])) or edges[0] <= 0 or edges[-1] > SCORE_MAX:
+        raise ValueError(text)
+    if any(abs(edge * 10 - round(edge * 10)) > 1e-6 for edge in edges):
+        raise ValueError(text)
+    return edges
+
+
+def parse_percentiles(text):
+    values = tuple(float(x) for x in text.split(',') if x.strip())
+    if not values or len(values) > 20 or any(not 0 <= q <= 100 for q in values):
+        raise ValueError(text)
+    return values
+
+
+def score_distribution(scores, edges=DEFAULT_SCORE_EDGES):
+    """
+    评分分段计数，按分数从高到低排列；没有评分的影片不计入
+    """
+    valid = scores[~np.isnan(scores)]
+    counts = np.bincount(np.searchsorted(np.asarray(edges, dtype=np.float32), valid, side='right'),
+                         minlength=len(edges) + 1)
+    labels = [f"<{edges[0]:.1f}"]
+    labels += [f"{lo:.1f}-{hi:.1f}" for lo, hi in zip(edges, edges[1:] + (SCORE_MAX,))]
+    return {label: int(count) for label, count in reversed(list(zip(labels, counts)))}
+
+
+def year_distribution(years):
+    values, counts = np.unique(years[years > 0], return_counts=True)
+    return {str(year): int(count) for year, count in zip(values, counts)}
+
+
+def decade_distribution(years):
+    values, counts = np.unique(years[years > 0] // 10 * 10, return_counts=True)
+    return {f"{decade}s": int(count) for decade, count in zip(values, counts)}
+
+
+def score_percentiles(scores, qs=DEFAULT_PERCENTILES):
+    valid = scores[~np.isnan(scores)]
+    if not len(valid):
+        return {}
+    values = np.percentile(valid.astype(np.float64), qs)
+    return {f"p{q:g}": round(float(v), 2) for q, v in zip(qs, values)}
+
+
+def board_aggregates(columns, names=None):
+    """
+    各榜单的数量、评分均值/中位数/极值、平均上映年份，以及同时出现在多个榜单的电影数
+    """
+    result = {}
+    for board_id in np.unique(columns['board']):
+        mask = columns['board'] == board_id
+        scores = columns['score'][mask]
+        scores = scores[~np.isnan(scores)].astype(np.float64)
+        years = columns['year'][mask]
+        years = years[years > 0]
+        result[int(board_id)] = {
+            'name': (names or {}).get(int(board_id), str(board_id)),
+            'rows': int(mask.sum()),
+            'scored': int(len(scores)),
+            'mean_score': round(float(scores.mean()), 2) if len(scores) else None,
+            'median_score': round(float(np.median(scores)), 2) if len(scores) else None,
+            'min_score': round(float(scores.min()), 1) if len(scores) else None,
+            'max_score': round(float(scores.max()), 1) if len(scores) else None,
+            'mean_year': round(float(years.mean()), 1) if len(years) else None,
+        }
+
+    if not len(columns['movie']):
+        return {'boards': result, 'movies': 0, 'on_multiple_boards': 0}
+    # 按 (榜单, 电影) 去重后统计每部电影出现在几个榜单
+    # （拼成一个 int64 键排序，比按二维数组的列去重快一个数量级）
+    pairs = np.unique(columns['movie'].astype(np.int64) << 16 | columns['board'].astype(np.uint16))
+    _, boards_per_movie = np.unique(pairs >> 16, return_counts=True)
+    return {
+        'boards': result,
+        'movies': int(len(boards_per_movie)),
+        'on_multiple_boards': int((boards_per_movie > 1).sum()),
+    }
+
+
+def compute_stats(columns, edges=DEFAULT_SCORE_EDGES, percentiles=DEFAULT_PERCENTILES, names=None):
+    """
+    对一组列计算全部统计量（列可以来自当前榜单，也可以来自历史快照）
+    """
+    return {
+        'count': int(len(columns['score'])),
+        'score_distribution': score_distribution(columns['score'], edges),
+        'year_distribution': year_distribution(columns['year']),
+        'decade_distribution': decade_distribution(columns['year']),
+        'percentiles': score_percentiles(columns['score'], percentiles),
+        'boards': board_aggregates(columns, names),
+    }
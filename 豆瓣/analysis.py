@@ -1,80 +1,194 @@
-from collections import Counter
+from collections import Counter, OrderedDict
 import re
-import jieba
-from wordcloud import WordCloud
+import threading
 import base64
-from io import BytesIO
 import os
+from tokenizer import Tokenizer, tokenize
+from common import metrics
+from common.render_cache import WordCloudCache
+
+WORDCLOUD_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'wordclouds')
+
+# Simple stop words list
+STOP_WORDS = {'的', '了', '是', '我', '在', '也', '都', '就', '有', '和', '人', '看', '不', '去', '一个', '很', '这一', '这', '那', '你', '吗', '啊', '吧', '呢', '电影', '片子'}
+
+CHINESE_WORD = re.compile(r'^[\u4e00-\u9fa5]+$')
+# Same token rule WordCloud applies to free text: word characters, at least two
+CLOUD_WORD = re.compile(r"^\w[\w']+$")
+
+
+def frequency_words(tokens):
+    """Tokens counted by the keyword statistics."""
+    return [w for w in tokens if len(w) > 1 and CHINESE_WORD.match(w) and w not in STOP_WORDS]
+
+
+def cloud_words(tokens):
+    """Tokens shown in the word cloud."""
+    return [w for w in tokens if CLOUD_WORD.match(w)]
+
+
+class MovieAnalysis:
+    """Running rating and word counters of one movie, updated as its comments change."""
+
+    def __init__(self):
+        self.version = None
+        self.seq = 0
+        self.ratings = Counter()
+        self.words = Counter()
+        self.cloud_words = Counter()
+        # comment id -> (star, frequency words, cloud words) currently counted
+        self.contributions = {}
+        self.lock = threading.Lock()
+
+    def apply(self, comment_id, star, tokens):
+        """Count a comment, replacing whatever it contributed before."""
+        old = self.contributions.get(comment_id)
+        if old:
+            self.ratings[old[0]] -= 1
+            self.words.subtract(old[1])
+            self.cloud_words.subtract(old[2])
+        new = (star, frequency_words(tokens), cloud_words(tokens))
+        self.ratings[new[0]] += 1
+        self.words.update(new[1])
+        self.cloud_words.update(new[2])
+        self.contributions[comment_id] = new
+
 
 class DoubanAnalysis:
-    def __init__(self, storage):
+    """
+    Comment statistics backed by a per-movie cache.
+
+    Each comment is tokenized once (tokens are stored alongside it) and the
+    counters of a cached movie are only updated with comments that changed
+    since the data version it was built from. Crawls only ever add or change
+    comments, so catching up on the version replaces explicit invalidation;
+    a movie that is no longer stored is dropped on its next lookup.
+    """
+
+    def __init__(self, storage, cache_size=32, tokenizer=None, wordcloud_cache=None):
         self.storage = storage
+        self.tokenizer = tokenizer or Tokenizer()
+        self.wordcloud_cache = wordcloud_cache or WordCloudCache(WORDCLOUD_CACHE_DIR)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _tokenize(self, rows):
+        """Tokenize comments that have no stored tokens yet and persist the result."""
+        pending = [row for row in rows if row['tokens'] is None]
+        for row in rows:
+            if row['tokens'] is not None:
+                row['tokens'] = row['tokens'].split(' ') if row['tokens'] else []
+
+        # Large backlogs (first analysis of a big corpus) go to the process pool
+        tokenized = {}
+        if pending:
+            with metrics.timed('tokenize'):
+                for row, tokens in zip(pending, self.tokenizer.iter_tokenized(row['content'] for row in pending)):
+                    row['tokens'] = tokenized[row['id']] = tokens
+        if tokenized:
+            self.storage.save_tokens(tokenized)
+
+    def get_movie_analysis(self, subject_id=None):
+        """Bring the cached counters of a movie up to date and return them (None if unknown)."""
+        subject_id = subject_id or self.storage.get_info().get('subject_id')
+        version = self.storage.get_version(subject_id) if subject_id else None
+        with self._lock:
+            if version is None:
+                self.cache.pop(subject_id, None)
+                return None
 
-    def get_rating_statistics(self):
+            entry = self.cache.get(subject_id)
+            if entry is None:
+                entry = self.cache[subject_id] = MovieAnalysis()
+            self.cache.move_to_end(subject_id)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        # Only one thread catches up a given movie, others wait for its result
+        with entry.lock:
+            metrics.cache_result('douban_analysis', 'hit' if entry.version == version else 'miss')
+            if entry.version != version:
+                rows = self.storage.get_changed_comments(subject_id, entry.seq)
+                self._tokenize(rows)
+                for row in rows:
+                    entry.apply(row['id'], row['star'], row['tokens'])
+                    entry.seq = max(entry.seq, row['seq'])
+                entry.version = version
+            return entry
+
+    def get_rating_statistics(self, subject_id=None):
         """Calculate rating distribution statistics."""
-        comments = self.storage.get_comments()
-        if not comments:
+        entry = self.get_movie_analysis(subject_id)
+        if not entry or not entry.contributions:
             return {}
 
-        ratings = [c['star'] for c in comments]
-        rating_counts = Counter(ratings)
-        
+        with entry.lock:
+            rating_counts = +entry.ratings
+
         # Defined order for display
         rating_order = ["力荐", "推荐", "还行", "较差", "很差", "未评分"]
         sorted_ratings = {k: rating_counts.get(k, 0) for k in rating_order if k in rating_counts or rating_counts.get(k, 0) > 0}
-        
+
         # Add any others that might exist
         for k, v in rating_counts.items():
             if k not in sorted_ratings:
                 sorted_ratings[k] = v
-                
+
         return sorted_ratings
 
-    def get_word_frequency(self, top_n=10):
+    def get_word_frequency(self, top_n=10, subject_id=None):
         """Calculate word frequency statistics."""
-        comments = self.storage.get_comments()
-        if not comments:
+        entry = self.get_movie_analysis(subject_id)
+        if not entry or not entry.contributions:
             return []
 
-        text = "".join([c['content'] for c in comments])
-        # Remove non-Chinese characters for cleaner stats
-        text = re.sub(r'[^\u4e00-\u9fa5]', '', text)
-        
-        words = jieba.cut(text)
-        # Simple stop words list
-        stop_words = {'的', '了', '是', '我', '在', '也', '都', '就', '有', '和', '人', '看', '不', '去', '一个', '很', '这一', '这', '那', '你', '吗', '啊', '吧', '呢', '电影', '片子'}
-        filtered_words = [w for w in words if len(w) > 1 and w not in stop_words]
-        
-        word_counts = Counter(filtered_words)
-        return word_counts.most_common(top_n)
-
-    def generate_wordcloud_base64(self):
-        """Generate wordcloud image as base64 string."""
-        comments = self.storage.get_comments()
-        if not comments:
-            return ""
-        
-        text = " ".join([c['content'] for c in comments])
+        with entry.lock:
+            return (+entry.words).most_common(top_n)
+
+    def get_wordcloud_frequencies(self, subject_id=None):
+        """Word counts the cloud is drawn from, comments plus the movie intro."""
+        entry = self.get_movie_analysis(subject_id)
+        if not entry or not entry.contributions:
+            return {}
+
+        with entry.lock:
+            frequencies = +entry.cloud_words
         # Add intro text as well for better cloud
-        text += " " + self.storage.get_info().get('intro', '')
-        
-        words = jieba.cut(text)
-        processed_text = " ".join(words)
-        
+        intro = self.storage.get_info(subject_id).get('intro') or ''
+        frequencies.update(cloud_words(tokenize(intro)))
+        return dict(frequencies)
+
+    def get_wordcloud_options(self):
         font_path = "C:/Windows/Fonts/msyh.ttc"
         if not os.path.exists(font_path):
             font_path = "C:/Windows/Fonts/simhei.ttf"
-            
-        wc = WordCloud(
-            font_path=font_path,
-            background_color='black',
-            colormap='Pastel1', # Bright colors for dark background
-            width=800,
-            height=400,
-            max_words=150
-        ).generate(processed_text)
-        
-        img_io = BytesIO()
-        wc.to_image().save(img_io, 'PNG')
-        img_io.seek(0)
-        return base64.b64encode(img_io.getvalue()).decode('utf-8')
+
+        return {
+            'font_path': font_path,
+            'background_color': 'black',
+            'colormap': 'Pastel1', # Bright colors for dark background
+            'width': 800,
+            'height': 400,
+            'max_words': 150
+        }
+
+    def get_wordcloud_png(self, subject_id=None):
+        """Word cloud PNG as (etag, bytes), rendered once per frequency table; (None, None) without data."""
+        frequencies = self.get_wordcloud_frequencies(subject_id)
+        if not frequencies:
+            return None, None
+        return self.wordcloud_cache.get_or_render(frequencies, self.get_wordcloud_options())
+
+    def prerender_wordcloud(self, subject_id=None):
+        """Render the word cloud in the background right after data changed."""
+        return self.wordcloud_cache.prerender(
+            self.get_wordcloud_frequencies(subject_id), self.get_wordcloud_options()
+        )
+
+    def generate_wordcloud_base64(self, subject_id=None):
+        """Generate wordcloud image as base64 string."""
+        _, png = self.get_wordcloud_png(subject_id)
+        if not png:
+            return ""
+        return base64.b64encode(png).decode('utf-8')
@@ -0,0 +1,93 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from common import metrics
+from common.fetcher import RequestBudget
+
+SUBJECT_URL = 'https://movie.douban.com/subject/{subject_id}/'
+
+
+def normalize_targets(items):
+    """
+    Movie URLs for a list of Douban subject URLs or bare subject ids, in
+    order and without duplicates. Raises ValueError for anything else.
+    """
+    urls = {}
+    for item in items:
+        item = str(item).strip()
+        if not item:
+            continue
+        if item.isdigit():
+            url = SUBJECT_URL.format(subject_id=item)
+        elif re.match(r'https?://', item):
+            url = item
+        else:
+            raise ValueError(f"不是豆瓣电影链接或 ID: {item}")
+        match = re.search(r'/subject/(\d+)', url)
+        urls.setdefault(match.group(1) if match else url, url)
+    return list(urls.values())
+
+
+class BatchCrawler:
+    """
+    Crawls a list of movies at once.
+
+    Up to `movies` movies are crawled in parallel, and every request they
+    make draws from one RequestBudget, so the batch as a whole stays within
+    `concurrency` requests in flight and `rate` requests per second however
+    many movies it holds. crawl(url, budget) crawls and stores one movie and
+    returns (success, message); summarize(url), if given, adds the stored
+    details of a crawled movie to its summary.
+    """
+
+    def __init__(self, crawl, summarize=None, movies=4, concurrency=16, rate=None):
+        self.crawl = crawl
+        self.summarize = summarize
+        self.movies = movies
+        self.concurrency = concurrency
+        self.rate = rate
+
+    def _crawl_one(self, url, budget, timings):
+        started = time.perf_counter()
+        # Movie threads report their stages into the caller's timings
+        with metrics.collect(timings):
+            try:
+                success, message = self.crawl(url, budget)
+            except Exception as e:
+                success, message = False, f"爬取错误: {str(e)}"
+        summary = {
+            'url': url,
+            'success': success,
+            'message': message,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        }
+        if success and self.summarize:
+            summary.update(self.summarize(url))
+        return summary
+
+    def run(self, urls, progress=None):
+        """
+        Crawl every URL and return the per-movie summaries in input order
+        with totals. progress, if given, is called as
+        progress(done_movies, total_movies, summary) as movies finish.
+        """
+        started = time.perf_counter()
+        budget = RequestBudget(self.concurrency, self.rate)
+        timings = metrics.current_timings() or metrics.Timings()
+        summaries = [None] * len(urls)
+        with ThreadPoolExecutor(max_workers=max(1, min(self.movies, len(urls))),
+                                thread_name_prefix='batch-crawl') as pool:
+            futures = {pool.submit(self._crawl_one, url, budget, timings): i for i, url in enumerate(urls)}
+            for done, future in enumerate(as_completed(futures), 1):
+                summary = summaries[futures[future]] = future.result()
+                if progress:
+                    progress(done, len(urls), summary)
+
+        succeeded = sum(1 for summary in summaries if summary['success'])
+        return {
+            'movies': summaries,
+            'succeeded': succeeded,
+            'failed': len(summaries) - succeeded,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        }
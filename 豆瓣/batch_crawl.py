@@ -0,0 +1,77 @@
+"""
+Crawl many Douban movies at once into douban.db.
+
+    python batch_crawl.py 1292052 1291546 https://movie.douban.com/subject/1295644/
+    python batch_crawl.py --file ids.txt --target 200 --rate 5 --json summary.json
+
+Movies are given as subject URLs or ids, on the command line or one per
+line in --file ('-' for stdin). All movies share one request budget; see
+--movies, --concurrency and --rate. --offline crawls the pages stored in
+the HTTP cache again without going to the network, e.g. to re-run parsing
+and analysis after changing them. Exits with status 1 if any movie failed.
+"""
+import argparse
+import json
+import sys
+
+import douban
+
+
+def read_targets(args):
+    items = list(args.movies_or_urls)
+    if args.file:
+        f = sys.stdin if args.file == '-' else open(args.file, encoding='utf-8')
+        with f:
+            items += [line.split('#')[0] for line in f]
+    return douban.normalize_targets(items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('movies_or_urls', nargs='*', metavar='MOVIE', help='subject URL or id')
+    parser.add_argument('--file', help="file with one subject URL or id per line, '-' for stdin")
+    parser.add_argument('--target', type=int, default=douban.DEFAULT_TARGET_COMMENTS, help='comments per movie')
+    parser.add_argument('--incremental', action='store_true', help='only fetch what is new for stored movies')
+    parser.add_argument('--movies', type=int, default=douban.BATCH_MOVIES, help='movies crawled in parallel')
+    parser.add_argument('--concurrency', type=int, default=douban.BATCH_CONCURRENCY,
+                        help='requests in flight across all movies')
+    parser.add_argument('--rate', type=float, default=douban.BATCH_RATE,
+                        help='requests per second across all movies, 0 for no cap')
+    parser.add_argument('--offline', action='store_true', help='replay cached pages only, no network')
+    parser.add_argument('--json', help='write the summary to this file')
+    args = parser.parse_args()
+    if args.offline:
+        douban.http_cache.offline = True
+
+    try:
+        urls = read_targets(args)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if not urls:
+        parser.error('no movies given')
+
+    def progress(done, total, summary):
+        status = 'ok' if summary['success'] else 'FAILED'
+        print(f"[{done}/{total}] {status} {summary['url']} {summary['message']}", flush=True)
+
+    result = douban.crawl_batch(urls, target_count=max(1, args.target), incremental=args.incremental,
+                                movies=max(1, args.movies), concurrency=max(1, args.concurrency),
+                                rate=args.rate or None, progress=progress)
+
+    print(f"\n{'subject':<12}{'comments':>10}{'ms':>10}  title")
+    for summary in result['movies']:
+        if summary['success']:
+            print(f"{summary['subject_id']:<12}{summary['comments_count']:>10}{summary['elapsed_ms']:>10.0f}  "
+                  f"{summary['title']}")
+        else:
+            print(f"{'-':<12}{'-':>10}{summary['elapsed_ms']:>10.0f}  {summary['url']}: {summary['message']}")
+    print(f"\n{result['succeeded']} succeeded, {result['failed']} failed in {result['elapsed_ms'] / 1000:.1f}s")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    sys.exit(1 if result['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
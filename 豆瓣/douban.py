@@ -1,163 +1,273 @@
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, session
-import requests
-from bs4 import BeautifulSoup
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, Response, stream_with_context
 import csv
 import os
+import sys
 from io import StringIO, BytesIO
-import jieba
-from wordcloud import WordCloud
 import base64
-import random
 import time
+import json
+import math
+import multiprocessing
+from datetime import datetime
+from urllib.parse import urlencode
 
 app = Flask(__name__)
 app.secret_key = 'douban_secret_key'  # Required for session
 
 from collections import Counter
 import re
-from storage import DoubanStorage
+
+# The shared crawler infrastructure lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import metrics
+from common.fetcher import AsyncFetcher
+from common.http_cache import HttpCache
+from common.politeness import HostLimits, IdentityPool, Politeness
+from common.warmup import warm_jieba
+
+from storage import DoubanStorage, COMMENT_SORTS, decode_cursor, gzip_chunks
 from analysis import DoubanAnalysis
+from search import CommentSearch
+from jobs import JobManager
+from batch import BatchCrawler, normalize_targets
+import pages
+
+# Tokenizer workers are spawned and re-import the script that started them
+# (douban.py, batch_crawl.py) before running; they need none of these services
+if multiprocessing.current_process().name == 'MainProcess':
+    # Initialize storage manager
+    storage = DoubanStorage()
+    # Initialize analysis manager
+    analyzer = DoubanAnalysis(storage)
+    # Load jieba's dictionary in the background, so the first crawl or search does not pay for it
+    warm_jieba(analyzer.tokenizer.cache_dir)
+    # Full-text comment search
+    searcher = CommentSearch(storage)
+    # Background crawl jobs, so /crawl does not block a request worker
+    job_manager = JobManager(max_workers=4)
+    # Requests per second to Douban, shared by every thread and process using the
+    # same politeness database (0 disables the limit). Blocks slow it down further.
+    DOUBAN_HOST = 'movie.douban.com'
+    DOUBAN_RATE = float(os.environ.get('DOUBAN_RATE', 4))
+    POLITENESS_DB_PATH = os.environ.get('DOUBAN_POLITENESS_DB') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'cache', 'politeness.db')
+    politeness = Politeness(
+        HostLimits(POLITENESS_DB_PATH, {DOUBAN_HOST: DOUBAN_RATE} if DOUBAN_RATE else {}, burst=8),
+        IdentityPool(),
+        block_markers=pages.BLOCK_MARKERS,
+        block_hosts=pages.BLOCK_HOSTS
+    )
+    # Fetched pages on disk, revalidated once stale; HTTP_CACHE_OFFLINE=1 replays
+    # them without touching the network (misses answer 504)
+    HTTP_CACHE_PATH = os.environ.get('DOUBAN_HTTP_CACHE') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'cache', 'http.db')
+    http_cache = HttpCache(HTTP_CACHE_PATH)
+    # Pooled async HTTP client shared by every crawl in this process
+    fetcher = AsyncFetcher(pool_size=100, per_host=16, timeout=10, retries=2, politeness=politeness,
+                           cache=http_cache)
+    # Request timings, Server-Timing headers and the Prometheus /metrics endpoint
+    metrics.instrument_app(app)
 
-# Initialize storage manager
-storage = DoubanStorage()
-# Initialize analysis manager
-analyzer = DoubanAnalysis(storage)
+CRAWL_STAGES = ['crawl', 'wordcloud', 'rating_stats', 'word_stats']
 
 def get_headers():
-    user_agents = [
-        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15',
-    ]
+    """Per-request headers; User-Agent, Accept and cookies come from the fetcher's identity."""
     return {
-        'User-Agent': random.choice(user_agents),
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
         'Referer': 'https://movie.douban.com/'
     }
 
-import concurrent.futures
+from pagination import PaginationCrawler, AdaptiveLimiter
+
+# Default number of comments per crawl, and the upper bound a client may ask for
+DEFAULT_TARGET_COMMENTS = 100
+MAX_TARGET_COMMENTS = 5000
+
+# Batch crawls: movies per batch, movies crawled in parallel, and the request
+# budget (requests in flight, requests per second) all of them share
+MAX_BATCH_MOVIES = 100
+BATCH_MOVIES = 4
+BATCH_CONCURRENCY = 16
+BATCH_RATE = 10.0
+MAX_BATCH_RATE = 100.0
 
-def fetch_comment_page(base_url, start, session):
+def extract_subject_id(url):
+    """Douban subject id of a movie URL, falling back to the URL itself."""
+    match = re.search(r'/subject/(\d+)', url)
+    return match.group(1) if match else url.split('?')[0].rstrip('/')
+
+def comments_base_url(url):
+    """Movie URL without query string and with a trailing slash."""
+    base_url = url.split('?')[0]
+    if not base_url.endswith('/'):
+        base_url += '/'
+    return base_url
+
+def fetch_comment_page(base_url, start, delay=0, sort=None, budget=None):
     """
-    Helper function to fetch a single page of comments.
+    Schedule the fetch of a single page of comments on the shared fetcher.
+    sort='time' lists newest comments first instead of the default hot order.
+    Returns a concurrent.futures.Future resolving to the response.
     """
-    try:
-        comments_url = f"{base_url}comments?status=P&start={start}"
-        response = session.get(comments_url, headers=get_headers(), timeout=10)
-        
-        if response.status_code != 200:
-            return []
-            
-        soup = BeautifulSoup(response.text, 'html.parser')
-        comment_items = soup.select('.comment-item')
-        
-        page_comments = []
-        for item in comment_items:
-            # User info
-            user_tag = item.select_one('.comment-info a')
-            user = user_tag.text.strip() if user_tag else "未知用户"
-            user_link = user_tag.get('href') if user_tag else "#"
-            
-            # Content
-            content_tag = item.select_one('.short')
-            content = content_tag.text.strip() if content_tag else ""
-            
-            # Date
-            date_tag = item.select_one('.comment-time')
-            date = date_tag.get('title') if date_tag else (date_tag.text.strip() if date_tag else "未知日期")
-            
-            # Rating
-            star_span = item.select_one('.rating')
-            star = star_span.get('title') if star_span else "未评分"
-            
-            if content:
-                page_comments.append({
-                    'user': user,
-                    'content': content,
-                    'date': date,
-                    'star': star,
-                    'link': user_link
-                })
-        return page_comments
-    except Exception as e:
-        print(f"Error fetching page {start}: {e}")
-        return []
+    comments_url = f"{base_url}comments?status=P&start={start}"
+    if sort:
+        comments_url += f"&sort={sort}"
+    # One movie's pages go out under one identity, like a single visitor paging through
+    return fetcher.submit(comments_url, headers=get_headers(), timeout=10, delay=delay, budget=budget,
+                          identity_key=base_url)
+
+def parse_comment_page(response, start):
+    """
+    Helper function to parse a single page of comments.
+    Returns (comments, total); total is only read from the first page.
+    """
+    return pages.parse_comment_page(response.text, start)
+
+def crawl_douban_incremental(url, subject_id, checkpoint, progress=None, target_count=DEFAULT_TARGET_COMMENTS,
+                             budget=None):
+    """
+    Re-crawl a stored movie from its checkpoint: walk the newest-first listing
+    only until the previous high-water mark, then backfill older comments
+    from the last offset reached if fewer than target_count are stored.
+    """
+    base_url = comments_base_url(url)
+    newest = checkpoint['newest_date'] or ''
+
+    def is_new(comment):
+        # Undated comments cannot be placed, and comments from the second of the
+        # high-water mark may be new too; the upsert deduplicates them
+        return not comment['date'][:1].isdigit() or comment['date'] >= newest
+
+    def reached_checkpoint(comments):
+        return any(not is_new(c) for c in comments)
+
+    # New comments usually fit in a page or two, so start with little concurrency
+    crawler = PaginationCrawler(
+        lambda offset, delay: fetch_comment_page(base_url, offset, delay, sort='time', budget=budget),
+        parse_comment_page,
+        page_size=20,
+        limiter=AdaptiveLimiter(initial=1, maximum=16),
+        is_last=reached_checkpoint,
+        name='incremental'
+    )
+    fresh, stats = crawler.crawl(target_count, progress=progress)
+    before = storage.get_info(subject_id)['comments_count']
+    storage.save_data(storage.get_info(subject_id), [c for c in fresh if is_new(c)], subject_id)
+    stored = storage.get_info(subject_id)['comments_count']
+    added = stored - before
 
-def crawl_douban(url):
+    # Everything walked before moved down the listing by the number of new comments;
+    # the pages just fetched are not fetched again either
+    last_offset = stats['reached']
+    if checkpoint['last_offset'] is not None:
+        last_offset = max(last_offset, checkpoint['last_offset'] + added)
+    backfilled = 0
+    if stored < target_count:
+        start = last_offset - last_offset % 20
+        crawler = PaginationCrawler(
+            lambda offset, delay: fetch_comment_page(base_url, offset, delay, sort='time', budget=budget),
+            parse_comment_page,
+            page_size=20,
+            limiter=AdaptiveLimiter(initial=4, maximum=16),
+            name='backfill'
+        )
+        # Pages start at multiples of 20, the comments above last_offset are stored already
+        skip = last_offset - start
+        older, stats = crawler.crawl(target_count - stored + skip, start_offset=start)
+        older = older[skip:]
+        storage.upsert_comments(subject_id, older)
+        backfilled = len(older)
+        last_offset = max(last_offset, stats['reached'])
+
+    storage.save_checkpoint(subject_id, last_offset)
+    return True, f"增量爬取成功! 新增 {added} 条评论, 补充 {backfilled} 条历史评论"
+
+def crawl_douban(url, progress=None, target_count=DEFAULT_TARGET_COMMENTS, incremental=False, budget=None):
+    """
+    Crawl movie info and up to target_count comments into storage,
+    merged with whatever was stored for the same subject before.
+    With incremental=True, movies crawled before only fetch what is new.
+    progress, if given, is called as progress(done_pages, planned_pages).
+    budget, a RequestBudget, caps the requests shared with other crawls.
+    """
     try:
+        subject_id = extract_subject_id(url)
+        if incremental:
+            checkpoint = storage.get_checkpoint(subject_id)
+            if checkpoint and storage.get_info(subject_id):
+                return crawl_douban_incremental(url, subject_id, checkpoint, progress, target_count, budget)
+
         # 1. Fetch Main Page Info
-        session = requests.Session()
-        response = session.get(url, headers=get_headers(), timeout=15)
+        response = fetcher.get(url, headers=get_headers(), timeout=15, budget=budget,
+                               identity_key=comments_base_url(url))
         
+        if response.blocked:
+            return False, "请求被豆瓣拦截，已自动降低请求频率，请稍后重试"
         if response.status_code != 200:
             return False, f"请求失败，状态码: {response.status_code}"
         
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
         # Extract Info
-        title_tag = soup.select_one('h1 span[property="v:itemreviewed"]')
-        title = title_tag.text.strip() if title_tag else "未知电影"
+        movie, page = pages.parse_movie_page(response.text)
         
-        rating_tag = soup.select_one('strong.ll.rating_num')
-        rating = rating_tag.text.strip() if rating_tag else "暂无评分"
-        
-        intro_tag = soup.select_one('span[property="v:summary"]')
-        intro = intro_tag.text.strip().replace('\n', '').replace(' ', '') if intro_tag else "暂无简介"
-        
-        # 2. Multi-threaded Comment Crawling
+        # 2. Paginated Comment Crawling with adaptive concurrency
         # Determine base URL for comments
-        if '?' in url:
-            base_url = url.split('?')[0]
-        else:
-            base_url = url
-        
-        if not base_url.endswith('/'):
-            base_url += '/'
-            
-        # We will fetch 5 pages (0, 20, 40, 60, 80) -> ~100 comments
-        offsets = [0, 20, 40, 60, 80]
-        
-        all_comments = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            future_to_offset = {executor.submit(fetch_comment_page, base_url, offset, session): offset for offset in offsets}
-            for future in concurrent.futures.as_completed(future_to_offset):
-                try:
-                    data = future.result()
-                    all_comments.extend(data)
-                except Exception as exc:
-                    print(f"Generated an exception: {exc}")
+        base_url = comments_base_url(url)
+
+        # Pages are scheduled up to the announced total; the limiter backs off
+        # on errors or slow pages and the crawl stops at the first empty page
+        crawler = PaginationCrawler(
+            lambda offset, delay: fetch_comment_page(base_url, offset, delay, budget=budget),
+            parse_comment_page,
+            page_size=20,
+            limiter=AdaptiveLimiter(initial=4, maximum=16)
+        )
+        all_comments, _ = crawler.crawl(target_count, progress=progress)
 
         # If strict crawling failed or returned nothing (e.g. login block), try fallback to main page hot comments if needed
         # But we will trust the threaded result first. 
         if not all_comments:
              # Fallback: scrape from the main response we already have
-            comment_items = soup.select('#hot-comments .comment-item')
-            for item in comment_items:
-                user_tag = item.select_one('.comment-info a')
-                user = user_tag.text.strip() if user_tag else "未知用户"
-                content_tag = item.select_one('.short')
-                content = content_tag.text.strip() if content_tag else ""
-                date_tag = item.select_one('.comment-time')
-                date = date_tag.get('title') if date_tag else "未知日期"
-                star_span = item.select_one('.rating')
-                star = star_span.get('title') if star_span else "未评分"
-                if content:
-                    all_comments.append({'user': user, 'content': content, 'date': date, 'star': star, 'link': '#'})
+            all_comments = pages.parse_hot_comments(page)
 
         # Update storage
         info = {
-            'title': title,
-            'rating': rating,
-            'intro': intro,
-            'comments_count': len(all_comments)
+            'subject_id': subject_id,
+            'url': base_url,
+            **movie
         }
         storage.save_data(info, all_comments)
+        storage.save_checkpoint(subject_id)
         
         return True, f"爬取成功! 共获取 {len(all_comments)} 条评论"
         
     except Exception as e:
         return False, f"爬取错误: {str(e)}"
 
+def crawl_batch(urls, target_count=DEFAULT_TARGET_COMMENTS, incremental=False, movies=BATCH_MOVIES,
+                concurrency=BATCH_CONCURRENCY, rate=BATCH_RATE, progress=None):
+    """
+    Crawl many movies concurrently within one shared request budget.
+    Each movie is stored as soon as it is crawled; returns per-movie
+    summaries and totals (see BatchCrawler.run).
+    """
+    def crawl(url, budget):
+        return crawl_douban(url, target_count=target_count, incremental=incremental, budget=budget)
+
+    def summarize(url):
+        subject_id = extract_subject_id(url)
+        # Warm the word cloud cache so the dashboard opens fast for every movie
+        analyzer.prerender_wordcloud(subject_id)
+        info = storage.get_info(subject_id)
+        return {
+            'subject_id': subject_id,
+            'title': info.get('title'),
+            'rating': info.get('rating'),
+            'comments_count': info.get('comments_count', 0),
+            'comments_url': f"/api/comments?{urlencode({'subject_id': subject_id})}",
+        }
+
+    crawler = BatchCrawler(crawl, summarize, movies=movies, concurrency=concurrency, rate=rate)
+    return crawler.run(urls, progress=progress)
+
 # Analysis functions moved to analysis.py
 
 @app.route('/')
@@ -170,7 +280,8 @@ def crawler_page():
 
 @app.route('/stream')
 def stream_page():
-    return render_template('comments_stream.html', data=storage.get_data())
+    # Comments are paged in by the browser from /api/comments
+    return render_template('comments_stream.html', info=storage.get_info(request.args.get('subject_id')))
 
 @app.route('/about')
 def about_page():
@@ -190,6 +301,52 @@ def dashboard():
         return redirect(url_for('index'))
     return render_template('dashboard.html')
 
+def run_crawl_job(job, target_count=DEFAULT_TARGET_COMMENTS, incremental=False):
+    """Crawl and analysis pipeline executed on the job worker pool."""
+    job.start_stage('crawl')
+    success, msg = crawl_douban(
+        job.url,
+        progress=lambda done, total: job.set_progress('crawl', done / total),
+        target_count=target_count,
+        incremental=incremental
+    )
+    if not success:
+        job.finish(False, msg)
+        return
+    job.finish_stage('crawl')
+    # Other jobs may store movies meanwhile, so always address this one explicitly
+    subject_id = extract_subject_id(job.url)
+
+    # Render into the word cloud cache; the client fetches the image by URL.
+    # The comments are stored already, so a failed render only loses the image
+    job.start_stage('wordcloud')
+    try:
+        wc_etag, _ = analyzer.get_wordcloud_png(subject_id)
+        job.finish_stage('wordcloud')
+    except Exception as e:
+        wc_etag = None
+        msg += f" (词云生成失败: {str(e)})"
+        job.fail_stage('wordcloud')
+
+    job.start_stage('rating_stats')
+    rating_stats = analyzer.get_rating_statistics(subject_id)
+    job.finish_stage('rating_stats')
+
+    job.start_stage('word_stats')
+    word_stats = analyzer.get_word_frequency(subject_id=subject_id)
+    job.finish_stage('word_stats')
+
+    # Only references to the heavy parts, so the payload size does not grow with the crawl
+    query = urlencode({'subject_id': subject_id})
+    job.finish(True, msg, {
+        'success': True,
+        'data': storage.get_info(subject_id),
+        'comments_url': f"/api/comments?{query}",
+        'wordcloud_url': f"/wordcloud.png?{query}&v={wc_etag[:16]}" if wc_etag else None,
+        'rating_stats': rating_stats,
+        'word_stats': word_stats
+    })
+
 @app.route('/crawl', methods=['POST'])
 def crawl():
     # Login check removed for universal crawler access
@@ -201,39 +358,227 @@ def crawl():
     
     if not url:
         return jsonify({'success': False, 'message': 'URL不能为空'})
-        
-    success, msg = crawl_douban(url)
-    
-    if success:
-        wc_base64 = analyzer.generate_wordcloud_base64()
-        rating_stats = analyzer.get_rating_statistics()
-        word_stats = analyzer.get_word_frequency()
-        
-        return jsonify({
-            'success': True,
-            'data': storage.get_info(),
-            'comments': storage.get_comments(), # Return comments for frontend
-            'wordcloud': wc_base64,
-            'rating_stats': rating_stats,
-            'word_stats': word_stats
-        })
+
+    try:
+        target_count = int(data.get('target', DEFAULT_TARGET_COMMENTS))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'target必须是整数'})
+    target_count = max(1, min(target_count, MAX_TARGET_COMMENTS))
+    incremental = bool(data.get('incremental', False))
+
+    # Crawling takes seconds, so hand it to the worker pool and let the client poll
+    job = job_manager.submit(url, CRAWL_STAGES, lambda job: run_crawl_job(job, target_count, incremental))
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status_url': url_for('crawl_status', job_id=job.id),
+        'events_url': url_for('crawl_events', job_id=job.id)
+    }), 202
+
+def run_batch_job(job, urls, **options):
+    """Batch crawl executed on the job worker pool, one stage for all movies."""
+    job.start_stage('crawl')
+    result = crawl_batch(urls, progress=lambda done, total, _: job.set_progress('crawl', done / total), **options)
+    job.finish_stage('crawl')
+    job.finish(result['succeeded'] > 0,
+               f"批量爬取完成: 成功 {result['succeeded']} 部, 失败 {result['failed']} 部",
+               dict(result, success=True))
+
+@app.route('/crawl/batch', methods=['POST'])
+def crawl_batch_endpoint():
+    """
+    Crawl a list of movies (`urls`, subject URLs or ids) in one background
+    job. Optional: target, incremental, and the shared budget as movies
+    (in parallel), concurrency (requests in flight) and rate (requests/s).
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('urls')
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'message': 'urls必须是非空列表'}), 400
+    try:
+        urls = normalize_targets(items)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    if len(urls) > MAX_BATCH_MOVIES:
+        return jsonify({'success': False, 'message': f'一次最多爬取 {MAX_BATCH_MOVIES} 部电影'}), 400
+
+    try:
+        target_count = max(1, min(int(data.get('target', DEFAULT_TARGET_COMMENTS)), MAX_TARGET_COMMENTS))
+        movies = max(1, min(int(data.get('movies', BATCH_MOVIES)), 16))
+        concurrency = max(1, min(int(data.get('concurrency', BATCH_CONCURRENCY)), 64))
+        rate = data.get('rate')
+        # Clients cannot lift the cap: anything but a missing rate is clamped
+        rate = BATCH_RATE if rate is None else float(rate)
+        if isinstance(data.get('rate'), bool) or not math.isfinite(rate):
+            raise ValueError(rate)
+        rate = max(0.1, min(rate, MAX_BATCH_RATE))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': '参数错误'}), 400
+
+    job = job_manager.submit(f"{len(urls)} movies", ['crawl'], lambda job: run_batch_job(
+        job, urls, target_count=target_count, incremental=bool(data.get('incremental', False)),
+        movies=movies, concurrency=concurrency, rate=rate))
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'movies': len(urls),
+        'status_url': url_for('crawl_status', job_id=job.id),
+        'events_url': url_for('crawl_events', job_id=job.id)
+    }), 202
+
+@app.route('/crawl/<job_id>')
+def crawl_status(job_id):
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': '任务不存在'}), 404
+    # Server-Timing then shows where the crawl spent its time
+    metrics.current_timings().merge(job.timings)
+    return jsonify(dict(job.to_dict(), success=True))
+
+@app.route('/crawl/<job_id>/events')
+def crawl_events(job_id):
+    """Server-Sent Events stream of job progress, closed once the job finishes."""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': '任务不存在'}), 404
+
+    def generate():
+        version = None
+        while True:
+            if version == job.version and not job.finished:
+                # Keep the connection alive while nothing changed
+                yield ": keep-alive\n\n"
+            else:
+                version = job.version
+                yield f"data: {json.dumps(job.to_dict(), ensure_ascii=False)}\n\n"
+                if job.finished:
+                    break
+            job_manager.wait_for_update(job, version)
+
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/wordcloud.png')
+def wordcloud_image():
+    """Word cloud PNG of a movie, served from the render cache."""
+    try:
+        etag, png = analyzer.get_wordcloud_png(request.args.get('subject_id'))
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'生成词云失败: {str(e)}'}), 500
+    if not png:
+        return "无数据", 404
+
+    response = Response(png, mimetype='image/png')
+    response.set_etag(etag)
+    if request.args.get('v') == etag[:16]:
+        # Versioned URL: its content can never change
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
     else:
-        return jsonify({'success': False, 'message': msg})
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def parse_comment_filters(args):
+    """Filters of the comments API from query arguments; raises ValueError when malformed."""
+    filters = {
+        'stars': [s for s in args.get('star', '').split(',') if s],
+        'date_from': args.get('from', '').strip(),
+        'date_to': args.get('to', '').strip(),
+        'keyword': args.get('q', '').strip()
+    }
+    for key in ('date_from', 'date_to'):
+        if filters[key]:
+            datetime.strptime(filters[key], '%Y-%m-%d')
+    return filters
+
+@app.route('/api/comments')
+def api_comments():
+    """
+    One page of stored comments; pass next_cursor back as ?cursor= for the next page.
+    Filters: star=力荐,推荐  from=/to=YYYY-MM-DD  q=keyword; sort=default|newest|oldest|rating_desc|rating_asc.
+    """
+    sort = request.args.get('sort', 'default')
+    cursor = request.args.get('cursor') or None
+    try:
+        limit = max(1, min(int(request.args.get('limit', 50)), 200))
+        filters = parse_comment_filters(request.args)
+        if sort not in COMMENT_SORTS:
+            raise ValueError(sort)
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError:
+        return jsonify({'success': False, 'message': '参数错误'}), 400
+
+    info = storage.get_info(request.args.get('subject_id'))
+    if not info:
+        return jsonify({'success': False, 'message': '无数据'}), 404
+
+    comments, next_cursor = storage.query_comments(info['subject_id'], limit, cursor, sort, **filters)
+    result = {
+        'success': True,
+        'subject_id': info['subject_id'],
+        'total': info['comments_count'],
+        'comments': comments,
+        'next_cursor': next_cursor
+    }
+    # Counting is a scan of the filtered set, do it once per query rather than per page
+    if not cursor:
+        result['matched'] = storage.count_comments(info['subject_id'], **filters)
+    return jsonify(result)
+
+@app.route('/api/search')
+def api_search():
+    """
+    Ranked keyword search over stored comments, across all movies unless
+    subject_id is given. Each hit carries an HTML `highlight` of its content.
+    """
+    text = request.args.get('q', '').strip()
+    subject_id = request.args.get('subject_id') or None
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 100))
+        offset = max(0, min(int(request.args.get('offset', 0)), 1000))
+    except ValueError:
+        return jsonify({'success': False, 'message': '参数错误'}), 400
+    if not text:
+        return jsonify({'success': False, 'message': '请输入关键词'}), 400
+
+    if subject_id:
+        # Comments are indexed once tokenized; make sure this movie's are
+        analyzer.get_movie_analysis(subject_id)
+    result = searcher.search(text, subject_id, limit, offset)
+    result['success'] = True
+    return jsonify(result)
+
+@app.route('/api/movies')
+def list_movies():
+    return jsonify({'success': True, 'movies': storage.list_movies()})
 
 @app.route('/download/csv')
 def download_csv():
+    """Stream the export as CSV (default) or NDJSON via ?format=ndjson, gzip with ?gzip=1."""
     if not session.get('logged_in'):
         return "未登录", 400
-        
-    bytes_output = storage.generate_csv_stream()
-    if not bytes_output:
+
+    info = storage.get_info(request.args.get('subject_id'))
+    if not info.get('comments_count'):
         return "无数据", 400
-    
-    return send_file(
-        bytes_output,
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name='douban_data.csv'
+
+    export_format = request.args.get('format', 'csv')
+    if export_format == 'csv':
+        chunks, mimetype = storage.iter_csv(info['subject_id']), 'text/csv'
+    elif export_format == 'ndjson':
+        chunks, mimetype = storage.iter_ndjson(info['subject_id']), 'application/x-ndjson'
+    else:
+        return "不支持的导出格式", 400
+
+    filename = f'douban_data.{export_format}'
+    if request.args.get('gzip') in ('1', 'true'):
+        chunks, mimetype = gzip_chunks(chunks), 'application/gzip'
+        filename += '.gz'
+
+    # Rows are encoded batch by batch, so memory stays flat and the download starts at once
+    return Response(
+        stream_with_context(metrics.timed_iter('export', chunks)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
 
 if __name__ == '__main__':
@@ -0,0 +1,143 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from common import metrics
+
+
+class CrawlJob:
+    """State of a single background crawl job."""
+
+    def __init__(self, url, stages, changed):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.status = 'pending'  # pending -> running -> done / failed
+        self.message = ''
+        self.stages = OrderedDict(
+            (name, {'status': 'pending', 'progress': 0.0}) for name in stages
+        )
+        self.result = None
+        # Per-stage durations (fetch, parse, tokenize...) collected while the job runs
+        self.timings = metrics.Timings()
+        self.created_at = time.time()
+        self.finished_at = None
+        # Bumped on every change so that watchers can wait for updates
+        self.version = 0
+        self._changed = changed
+
+    def _touch(self):
+        self.version += 1
+        self._changed.notify_all()
+
+    def start_stage(self, name):
+        """Mark a stage as running."""
+        with self._changed:
+            self.stages[name]['status'] = 'running'
+            self._touch()
+
+    def set_progress(self, name, progress):
+        """Update the progress (0.0 - 1.0) of a running stage."""
+        with self._changed:
+            self.stages[name]['progress'] = round(min(max(progress, 0.0), 1.0), 3)
+            self._touch()
+
+    def finish_stage(self, name):
+        """Mark a stage as done."""
+        with self._changed:
+            self.stages[name]['status'] = 'done'
+            self.stages[name]['progress'] = 1.0
+            self._touch()
+
+    def fail_stage(self, name):
+        """Mark a stage as failed without failing the job."""
+        with self._changed:
+            self.stages[name]['status'] = 'failed'
+            self._touch()
+
+    def finish(self, success, message='', result=None):
+        """Record the final outcome of the job."""
+        with self._changed:
+            self.status = 'done' if success else 'failed'
+            self.message = message
+            self.result = result
+            self.finished_at = time.time()
+            for stage in self.stages.values():
+                if stage['status'] == 'running':
+                    stage['status'] = 'done' if success else 'failed'
+            self._touch()
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def to_dict(self):
+        """Serialize the job for the status endpoint."""
+        with self._changed:
+            data = {
+                'job_id': self.id,
+                'url': self.url,
+                'status': self.status,
+                'message': self.message,
+                'stages': [dict(stage, name=name) for name, stage in self.stages.items()],
+                'created_at': self.created_at,
+                'finished_at': self.finished_at,
+                'version': self.version,
+                'timings': self.timings.to_dict()
+            }
+            if self.finished:
+                data['result'] = self.result
+            return data
+
+
+class JobManager:
+    """Runs crawl jobs on a worker pool and keeps their status for polling."""
+
+    def __init__(self, max_workers=4, max_finished=200):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='crawl-job')
+        self.max_finished = max_finished
+        self.jobs = OrderedDict()
+        self.changed = threading.Condition()
+
+    def submit(self, url, stages, target):
+        """
+        Create a job and schedule target(job) on the worker pool.
+        target is expected to drive the stages and call job.finish().
+        """
+        job = CrawlJob(url, stages, self.changed)
+        with self.changed:
+            self.jobs[job.id] = job
+            self._evict()
+        self.executor.submit(self._run, job, target)
+        return job
+
+    def _run(self, job, target):
+        with self.changed:
+            job.status = 'running'
+            job._touch()
+        try:
+            with metrics.collect(job.timings):
+                target(job)
+        except Exception as e:
+            job.finish(False, f"任务执行错误: {str(e)}")
+        else:
+            if not job.finished:
+                job.finish(True)
+
+    def _evict(self):
+        """Drop the oldest finished jobs once the history grows too large."""
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id):
+        """Look up a job by id."""
+        with self.changed:
+            return self.jobs.get(job_id)
+
+    def wait_for_update(self, job, version, timeout=15):
+        """Block until the job changes past version (or timeout), return the new version."""
+        with self.changed:
+            self.changed.wait_for(lambda: job.version != version or job.finished, timeout=timeout)
+            return job.version
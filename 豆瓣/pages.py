@@ -0,0 +1,92 @@
+import re
+
+from common import metrics
+from common.extract import Field, Page, Selector, has_class
+
+# Selectors are compiled once at import and shared by every crawl thread
+COMMENT_ITEM = Selector('.comment-item', f".//*[{has_class('comment-item')}]")
+HOT_COMMENT_ITEM = Selector('#hot-comments .comment-item',
+                            f".//*[@id='hot-comments']//*[{has_class('comment-item')}]")
+
+_user_link = Selector('.comment-info a', f".//*[{has_class('comment-info')}]//a")
+COMMENT_FIELDS = {
+    'user': Field(_user_link),
+    'link': Field(_user_link, 'href'),
+    'content': Field(Selector('.short', f".//*[{has_class('short')}]")),
+    'date': Field(Selector('.comment-time', f".//*[{has_class('comment-time')}]"), 'title'),
+    'star': Field(Selector('.rating', f".//*[{has_class('rating')}]"), 'title'),
+}
+
+MOVIE_FIELDS = {
+    'title': Field(Selector('h1 span[property="v:itemreviewed"]', ".//h1//span[@property='v:itemreviewed']")),
+    'rating': Field(Selector('strong.ll.rating_num', f".//strong[{has_class('ll')} and {has_class('rating_num')}]")),
+    'intro': Field(Selector('span[property="v:summary"]', ".//span[@property='v:summary']")),
+}
+
+# Douban's "unusual traffic" page, served with status 200 or after a redirect to sec.douban.com
+BLOCK_MARKERS = ('检测到有异常请求'.encode('utf-8'), b'sec.douban.com/a')
+BLOCK_HOSTS = ('sec.douban.com',)
+
+# The comment total is shown on the active tab, or in the heading on older layouts
+TOTAL_SELECTORS = (
+    Selector('.is-active span', f".//*[{has_class('is-active')}]//span"),
+    Selector('#content h1', ".//*[@id='content']//h1"),
+)
+
+
+def parse_comments(page, item=COMMENT_ITEM):
+    """Comments of a parsed page, skipping items without text."""
+    comments = []
+    for record in page.records(item, COMMENT_FIELDS):
+        if not record['content']:
+            continue
+        comments.append({
+            'user': record['user'] or "未知用户",
+            'content': record['content'],
+            'date': record['date'] or "未知日期",
+            'star': record['star'] or "未评分",
+            'link': record['link'] or "#",
+        })
+    return comments
+
+
+def parse_hot_comments(page):
+    """Hot comments embedded in a movie page, used when the comment pages are blocked."""
+    comments = parse_comments(page, HOT_COMMENT_ITEM)
+    for comment in comments:
+        comment['link'] = '#'
+    return comments
+
+
+def parse_total_comments(page):
+    """Read the announced comment total, e.g. '看过(12345)', from a comments page."""
+    for selector in TOTAL_SELECTORS:
+        text = page.text(selector)
+        if text is not None:
+            match = re.search(r'\((\d+)\)', text)
+            return int(match.group(1)) if match else None
+    return None
+
+
+def parse_comment_page(html, start):
+    """
+    Parse a single page of comments.
+    Returns (comments, total); total is only read from the first page.
+    """
+    with metrics.timed('parse'):
+        page = Page(html)
+        comments = parse_comments(page)
+        total = parse_total_comments(page) if start == 0 else None
+    return comments, total
+
+
+def parse_movie_page(html):
+    """(info, page) of a movie page; page is kept for the hot comment fallback."""
+    with metrics.timed('parse'):
+        page = Page(html)
+        info = page.fields(MOVIE_FIELDS)
+    return {
+        'title': info['title'] or "未知电影",
+        'rating': info['rating'] or "暂无评分",
+        'intro': info['intro'].replace('\n', '').replace(' ', '') if info['intro'] else "暂无简介",
+    }, page
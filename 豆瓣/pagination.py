@@ -0,0 +1,170 @@
+import logging
+import math
+import threading
+import concurrent.futures
+from collections import deque, defaultdict
+
+from common import metrics
+
+logger = logging.getLogger(__name__)
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for page fetches.
+    Grows by one after a window of healthy pages, halves on errors or slow pages.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=16, slow_seconds=3.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = max(minimum, min(initial, maximum))
+        self.slow_seconds = slow_seconds
+        self.backoffs = 0
+        self._healthy = 0
+        self._lock = threading.Lock()
+
+    def record(self, ok, elapsed):
+        """Feed back the outcome of one request."""
+        with self._lock:
+            if not ok or elapsed > self.slow_seconds:
+                self.limit = max(self.minimum, self.limit // 2)
+                self.backoffs += 1
+                self._healthy = 0
+                return
+            self._healthy += 1
+            if self._healthy >= self.limit:
+                self.limit = min(self.maximum, self.limit + 1)
+                self._healthy = 0
+
+
+class PaginationCrawler:
+    """
+    Fetches offset-paginated comment pages until a target count is reached.
+
+    submit(offset, delay) must schedule the page request and return a
+    concurrent.futures.Future resolving to a response with status_code and
+    elapsed (seconds). parse(response, offset) returns (items, total) where
+    total is the overall item count announced by the site, or None.
+    is_last(items), if given, marks a page as the last one worth fetching.
+    Page counts and backoffs are recorded in the metrics under `name`.
+    """
+
+    def __init__(self, submit, parse, page_size=20, limiter=None, max_retries=2, retry_delay=1.0, is_last=None,
+                 name='full'):
+        self.name = name
+        self.submit = submit
+        self.parse = parse
+        self.is_last = is_last
+        self.page_size = page_size
+        self.limiter = limiter or AdaptiveLimiter()
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    def _resolve(self, offset, future):
+        """Turn a finished request into (status_code, items, total, elapsed)."""
+        try:
+            response = future.result()
+            if getattr(response, 'blocked', False):
+                # A block page may well be a 200, it must not read as the empty last page
+                return None, [], None, response.elapsed
+            if response.status_code != 200:
+                return response.status_code, [], None, response.elapsed
+            items, total = self.parse(response, offset)
+            return response.status_code, items, total, response.elapsed
+        except Exception as e:
+            logger.warning("Error fetching page %s: %s", offset, e)
+            return None, [], None, 0.0
+
+    def _last_offset(self, target_count, total):
+        pages = math.ceil(target_count / self.page_size)
+        if total is not None:
+            pages = min(pages, math.ceil(total / self.page_size))
+        return max(pages - 1, 0) * self.page_size
+
+    def _record(self, stats):
+        metrics.PAGES_FETCHED.inc(stats['pages'], crawl=self.name)
+        metrics.PAGE_BACKOFFS.inc(self.limiter.backoffs, crawl=self.name)
+        stats['concurrency'] = self.limiter.limit
+        stats['backoffs'] = self.limiter.backoffs
+
+    def crawl(self, target_count, progress=None, start_offset=0):
+        """
+        Crawl pages from start_offset and return (items, stats).
+        progress, if given, is called as progress(done_pages, planned_pages).
+        """
+        # The first page tells us the announced total, i.e. where the last page is;
+        # it is retried like any other page before the crawl gives up
+        stats = {'total': None, 'pages': 0, 'retries': 0, 'stopped_at': None, 'reached': start_offset}
+        for attempt in range(self.max_retries + 1):
+            status, items, total, elapsed = self._resolve(
+                start_offset, self.submit(start_offset, self.retry_delay * attempt))
+            self.limiter.record(status == 200, elapsed)
+            stats['pages'] += 1
+            if status == 200 or attempt == self.max_retries:
+                break
+            stats['retries'] += 1
+            metrics.PAGE_RETRIES.inc()
+        stats['total'] = total
+        if status != 200 or not items:
+            stats['stopped_at'] = start_offset
+            self._record(stats)
+            return items, stats
+        if self.is_last and self.is_last(items):
+            stats['stopped_at'] = stats['reached'] = start_offset + self.page_size
+            self._record(stats)
+            return items[:target_count], stats
+
+        results = {start_offset: items}
+        last_offset = start_offset + self._last_offset(target_count, total - start_offset if total else None)
+        pending = deque(range(start_offset + self.page_size, last_offset + 1, self.page_size))
+        planned = len(pending) + 1
+        if progress:
+            progress(1, planned)
+
+        # Requests run on the fetcher's event loop; this thread only schedules
+        # them and parses pages as they complete
+        retries = defaultdict(int)
+        stop_at = None
+        in_flight = {}
+        while pending or in_flight:
+            while pending and len(in_flight) < self.limiter.limit:
+                offset = pending.popleft()
+                # Nothing lies beyond the first empty page
+                if stop_at is not None and offset >= stop_at:
+                    continue
+                delay = self.retry_delay * retries[offset]
+                in_flight[self.submit(offset, delay)] = offset
+
+            if not in_flight:
+                break
+            done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                offset = in_flight.pop(future)
+                status, items, _, elapsed = self._resolve(offset, future)
+                self.limiter.record(status == 200, elapsed)
+                stats['pages'] += 1
+
+                if status != 200:
+                    if retries[offset] < self.max_retries:
+                        retries[offset] += 1
+                        stats['retries'] += 1
+                        metrics.PAGE_RETRIES.inc()
+                        pending.appendleft(offset)
+                    continue
+                if not items:
+                    stop_at = offset if stop_at is None else min(stop_at, offset)
+                    continue
+                if self.is_last and self.is_last(items):
+                    stop_at = offset + self.page_size if stop_at is None else min(stop_at, offset + self.page_size)
+
+                results[offset] = items
+                if progress:
+                    progress(len(results), planned)
+
+        stats['stopped_at'] = stop_at
+        self._record(stats)
+        kept = [offset for offset in sorted(results) if stop_at is None or offset < stop_at]
+        # Offset the next crawl of the same listing should resume from
+        stats['reached'] = kept[-1] + self.page_size
+        collected = [item for offset in kept for item in results[offset]]
+        return collected[:target_count], stats
@@ -0,0 +1,62 @@
+import html
+import re
+import time
+from analysis import STOP_WORDS
+from tokenizer import tokenize
+
+# Query words the index can match: runs of word characters, like the FTS tokenizer keeps
+SEARCH_WORD = re.compile(r'\w+')
+
+
+def query_terms(text):
+    """Index terms of a search query, segmented the same way as the comments."""
+    terms = []
+    for token in tokenize(text):
+        for word in SEARCH_WORD.findall(token):
+            if word not in terms:
+                terms.append(word)
+    # Stop words would only narrow an all-terms match, unless nothing else is left
+    return [term for term in terms if term not in STOP_WORDS] or terms
+
+
+def match_expression(terms):
+    """FTS5 query requiring every term; terms are quoted so no syntax leaks through."""
+    return ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+def highlight(text, terms, tag='mark'):
+    """HTML-escape text and wrap every occurrence of the terms in <tag>."""
+    escaped = html.escape(text or '')
+    if not terms:
+        return escaped
+    # Longest first, so a term is never split by a shorter one it contains
+    pattern = '|'.join(re.escape(html.escape(term)) for term in sorted(terms, key=len, reverse=True))
+    return re.sub(pattern, lambda m: f'<{tag}>{m.group(0)}</{tag}>', escaped, flags=re.IGNORECASE)
+
+
+class CommentSearch:
+    """
+    Keyword search over stored comments.
+
+    Matching and bm25 ranking run inside SQLite's FTS5 index of the jieba
+    tokens, which storage keeps in sync as comments are saved and analysed.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def search(self, text, subject_id=None, limit=20, offset=0):
+        started = time.perf_counter()
+        terms = query_terms(text)
+        if not terms:
+            return {'terms': [], 'matched': 0, 'results': [], 'took_ms': 0.0}
+
+        comments, matched = self.storage.search_comments(match_expression(terms), subject_id, limit, offset)
+        for comment in comments:
+            comment['highlight'] = highlight(comment['content'], terms)
+        return {
+            'terms': terms,
+            'matched': matched,
+            'results': comments,
+            'took_ms': round((time.perf_counter() - started) * 1000, 2)
+        }
@@ -1,75 +1,513 @@
+import base64
 import csv
 import json
 import os
-from io import StringIO, BytesIO
+import sqlite3
+import threading
+import time
+import zlib
+from io import StringIO
+
+# DOUBAN_DB_PATH points the app at another database, e.g. a scratch one for benchmarks
+DEFAULT_DB_PATH = os.environ.get('DOUBAN_DB_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'douban.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS movies (
+    subject_id TEXT PRIMARY KEY,
+    url TEXT,
+    title TEXT,
+    rating TEXT,
+    intro TEXT,
+    comments_count INTEGER NOT NULL DEFAULT 0,
+    crawled_at REAL NOT NULL,
+    -- Bumped on every write, lets caches tell whether the data changed
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY,
+    subject_id TEXT NOT NULL REFERENCES movies(subject_id) ON DELETE CASCADE,
+    user_key TEXT NOT NULL,
+    user TEXT,
+    link TEXT,
+    content TEXT,
+    star TEXT,
+    date TEXT,
+    crawled_at REAL NOT NULL,
+    -- Movie version in which the comment last changed
+    seq INTEGER NOT NULL DEFAULT 0,
+    -- Space-separated jieba tokens, NULL until analysed
+    tokens TEXT,
+    UNIQUE (subject_id, user_key)
+);
+
+-- High-water marks for incremental re-crawls (time-ordered comment listing)
+CREATE TABLE IF NOT EXISTS crawl_checkpoints (
+    subject_id TEXT PRIMARY KEY REFERENCES movies(subject_id) ON DELETE CASCADE,
+    newest_date TEXT,
+    newest_user_key TEXT,
+    -- Offset reached in the time-ordered listing, NULL until it was walked
+    last_offset INTEGER,
+    updated_at REAL NOT NULL
+);
+
+-- Full-text index over the jieba tokens of each comment. The tokens column
+-- holds space-separated words, so the FTS tokenizer sees jieba's segmentation.
+CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(
+    tokens, content='comments', content_rowid='id', tokenize='unicode61'
+);
+
+CREATE TRIGGER IF NOT EXISTS comments_fts_insert AFTER INSERT ON comments BEGIN
+    INSERT INTO comments_fts (rowid, tokens) VALUES (new.id, new.tokens);
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_fts_delete AFTER DELETE ON comments BEGIN
+    INSERT INTO comments_fts (comments_fts, rowid, tokens) VALUES ('delete', old.id, old.tokens);
+END;
+
+CREATE TRIGGER IF NOT EXISTS comments_fts_update AFTER UPDATE OF tokens ON comments BEGIN
+    INSERT INTO comments_fts (comments_fts, rowid, tokens) VALUES ('delete', old.id, old.tokens);
+    INSERT INTO comments_fts (rowid, tokens) VALUES (new.id, new.tokens);
+END;
+
+CREATE INDEX IF NOT EXISTS idx_movies_crawled_at ON movies(crawled_at);
+CREATE INDEX IF NOT EXISTS idx_comments_subject_date ON comments(subject_id, date);
+CREATE INDEX IF NOT EXISTS idx_comments_subject_star ON comments(subject_id, star);
+CREATE INDEX IF NOT EXISTS idx_comments_subject_seq ON comments(subject_id, seq);
+"""
+
+# Columns added after the first release of the schema: (table, column, definition)
+MIGRATIONS = [
+    ('movies', 'version', 'INTEGER NOT NULL DEFAULT 0'),
+    ('comments', 'seq', 'INTEGER NOT NULL DEFAULT 0'),
+    ('comments', 'tokens', 'TEXT'),
+]
+
+COMMENT_COLUMNS = 'user, content, date, star, link'
+
+# Comment list orders: name -> (SQL sort expression, direction)
+STAR_RANK = "CASE star WHEN '力荐' THEN 5 WHEN '推荐' THEN 4 WHEN '还行' THEN 3 WHEN '较差' THEN 2 WHEN '很差' THEN 1 ELSE 0 END"
+COMMENT_SORTS = {
+    'default': ('id', 'ASC'),
+    'newest': ('date', 'DESC'),
+    'oldest': ('date', 'ASC'),
+    'rating_desc': (STAR_RANK, 'DESC'),
+    'rating_asc': (STAR_RANK, 'ASC'),
+}
+
+# Comments fetched from SQLite and encoded per export chunk
+EXPORT_BATCH_SIZE = 1000
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of byte chunks into gzip format on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def encode_cursor(sort_value, comment_id):
+    """Opaque pagination cursor pointing just past a comment."""
+    raw = json.dumps([sort_value, comment_id], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on malformed input."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_value, comment_id = json.loads(raw)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"invalid cursor: {cursor!r}") from e
+    if not isinstance(comment_id, int):
+        raise ValueError(f"invalid cursor: {cursor!r}")
+    return sort_value, comment_id
+
+
+def comment_user_key(comment):
+    """Identify the author of a comment; one comment per user and movie is kept."""
+    link = comment.get('link')
+    if link and link != '#':
+        return link
+    return 'name:' + comment.get('user', '')
+
 
 class DoubanStorage:
-    def __init__(self):
-        # Initialize in-memory storage
-        self.data = {
-            'info': {},
-            'comments': []
-        }
+    """
+    SQLite-backed storage for crawled movies and their comments.
+
+    Movies are keyed by Douban subject id. Methods taking subject_id=None
+    act on the most recently crawled movie.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        # sqlite3 connections must not be shared between threads
+        self._local = threading.local()
+        with self._connect() as conn:
+            self._migrate(conn)
+            has_index = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'comments_fts'").fetchone()
+            conn.executescript(SCHEMA)
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'crawl_checkpoints_old'").fetchone():
+                conn.execute(
+                    'INSERT INTO crawl_checkpoints (subject_id, newest_date, newest_user_key, last_offset, updated_at) '
+                    'SELECT subject_id, newest_date, newest_user_key, last_offset, updated_at '
+                    'FROM crawl_checkpoints_old'
+                )
+                conn.execute('DROP TABLE crawl_checkpoints_old')
+            if not has_index:
+                # Index comments stored before the search index existed
+                conn.execute("INSERT INTO comments_fts (comments_fts) VALUES ('rebuild')")
+
+    def _migrate(self, conn):
+        """Add columns missing from databases created by older versions."""
+        for table, column, definition in MIGRATIONS:
+            columns = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+            if columns and column not in columns:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        # last_offset used to be NOT NULL; the old table is copied into the current one after SCHEMA ran
+        last_offset = [row for row in conn.execute('PRAGMA table_info(crawl_checkpoints)') if row['name'] == 'last_offset']
+        if last_offset and last_offset[0]['notnull']:
+            conn.execute('ALTER TABLE crawl_checkpoints RENAME TO crawl_checkpoints_old')
 
-    def save_data(self, info, comments):
-        """Update the in-memory data storage."""
-        self.data['info'] = info
-        self.data['comments'] = comments
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            # WAL lets readers in other workers proceed while a crawl writes
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
 
-    def get_data(self):
-        """Retrieve all stored data."""
-        return self.data
-    
-    def get_comments(self):
+    def _resolve(self, subject_id):
+        if subject_id is not None:
+            return subject_id
+        row = self._connect().execute(
+            'SELECT subject_id FROM movies ORDER BY crawled_at DESC LIMIT 1'
+        ).fetchone()
+        return row['subject_id'] if row else None
+
+    def save_data(self, info, comments, subject_id=None):
+        """Upsert a movie and merge its crawled comments into the store."""
+        subject_id = subject_id or info.get('subject_id')
+        if not subject_id:
+            raise ValueError('subject_id is required')
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO movies (subject_id, url, title, rating, intro, crawled_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(subject_id) DO UPDATE SET
+                    url = COALESCE(excluded.url, url),
+                    title = excluded.title,
+                    rating = excluded.rating,
+                    intro = excluded.intro,
+                    crawled_at = excluded.crawled_at
+                """,
+                (subject_id, info.get('url'), info.get('title'), info.get('rating'), info.get('intro'), now)
+            )
+            self._upsert_comments(conn, subject_id, comments, now)
+
+    def upsert_comments(self, subject_id, comments):
+        """Bulk-merge comments into an already stored movie."""
+        conn = self._connect()
+        with conn:
+            self._upsert_comments(conn, subject_id, comments, time.time())
+
+    def _upsert_comments(self, conn, subject_id, comments, now):
+        # Versions follow the clock, so a movie deleted and crawled again never reuses one
+        conn.execute(
+            'UPDATE movies SET version = MAX(version + 1, ?) WHERE subject_id = ?',
+            (int(now * 1000000), subject_id)
+        )
+        version = conn.execute('SELECT version FROM movies WHERE subject_id = ?', (subject_id,)).fetchone()[0]
+        # SET expressions see the old row, so unchanged comments keep their seq and tokens
+        conn.executemany(
+            """
+            INSERT INTO comments (subject_id, user_key, user, link, content, star, date, crawled_at, seq)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(subject_id, user_key) DO UPDATE SET
+                user = excluded.user,
+                seq = CASE WHEN content = excluded.content AND star = excluded.star
+                           THEN seq ELSE excluded.seq END,
+                tokens = CASE WHEN content = excluded.content THEN tokens ELSE NULL END,
+                content = excluded.content,
+                star = excluded.star,
+                date = excluded.date,
+                crawled_at = excluded.crawled_at
+            """,
+            [
+                (subject_id, comment_user_key(c), c.get('user', ''), c.get('link', '#'),
+                 c.get('content', ''), c.get('star', ''), c.get('date', ''), now, version)
+                for c in comments
+            ]
+        )
+        conn.execute(
+            'UPDATE movies SET comments_count = (SELECT COUNT(*) FROM comments WHERE subject_id = ?) '
+            'WHERE subject_id = ?',
+            (subject_id, subject_id)
+        )
+
+    def get_version(self, subject_id):
+        """Current data version of a movie, None if it is not stored."""
+        row = self._connect().execute(
+            'SELECT version FROM movies WHERE subject_id = ?', (subject_id,)
+        ).fetchone()
+        return row['version'] if row else None
+
+    def get_changed_comments(self, subject_id, since_seq=0):
+        """Comments (with id, seq and stored tokens) that changed after since_seq."""
+        rows = self._connect().execute(
+            'SELECT id, seq, star, content, tokens FROM comments WHERE subject_id = ? AND seq > ? ORDER BY id',
+            (subject_id, since_seq)
+        )
+        return [dict(row) for row in rows]
+
+    def save_tokens(self, tokens_by_id):
+        """Store the tokenization of comments, given as {comment_id: [tokens]}."""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'UPDATE comments SET tokens = ? WHERE id = ?',
+                [(' '.join(tokens), comment_id) for comment_id, tokens in tokens_by_id.items()]
+            )
+
+    def get_checkpoint(self, subject_id):
+        """High-water mark of the last crawl of a movie, or None."""
+        row = self._connect().execute(
+            'SELECT * FROM crawl_checkpoints WHERE subject_id = ?', (subject_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def save_checkpoint(self, subject_id, last_offset=None):
+        """
+        Record the newest stored comment of a movie as its high-water mark.
+        last_offset is the offset reached in the time-ordered listing; it is
+        kept unchanged when None, as after a crawl of the hot listing.
+        """
+        conn = self._connect()
+        with conn:
+            newest = conn.execute(
+                "SELECT date, user_key FROM comments WHERE subject_id = ? AND date GLOB '[0-9]*' "
+                'ORDER BY date DESC LIMIT 1',
+                (subject_id,)
+            ).fetchone()
+            conn.execute(
+                """
+                INSERT INTO crawl_checkpoints (subject_id, newest_date, newest_user_key, last_offset, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(subject_id) DO UPDATE SET
+                    newest_date = excluded.newest_date,
+                    newest_user_key = excluded.newest_user_key,
+                    last_offset = COALESCE(excluded.last_offset, last_offset),
+                    updated_at = excluded.updated_at
+                """,
+                (subject_id, newest['date'] if newest else None, newest['user_key'] if newest else None,
+                 last_offset, time.time())
+            )
+
+    def get_data(self, subject_id=None):
+        """Retrieve the info and comments of one movie."""
+        subject_id = self._resolve(subject_id)
+        return {
+            'info': self.get_info(subject_id),
+            'comments': self.get_comments(subject_id)
+        }
+
+    def get_comments(self, subject_id=None):
         """Retrieve only the comments list."""
-        return self.data.get('comments', [])
-    
-    def get_info(self):
+        subject_id = self._resolve(subject_id)
+        if subject_id is None:
+            return []
+        rows = self._connect().execute(
+            f'SELECT {COMMENT_COLUMNS} FROM comments WHERE subject_id = ? ORDER BY id',
+            (subject_id,)
+        )
+        return [dict(row) for row in rows]
+
+    def _comment_filters(self, subject_id, stars=None, date_from=None, date_to=None, keyword=None):
+        """WHERE clause and parameters shared by comment queries."""
+        clauses = ['subject_id = ?']
+        params = [subject_id]
+        if stars:
+            clauses.append(f"star IN ({', '.join('?' * len(stars))})")
+            params.extend(stars)
+        if date_from:
+            # Placeholders such as '未知日期' sort after every date, keep them out
+            clauses.append("date >= ? AND date GLOB '[0-9]*'")
+            params.append(date_from)
+        if date_to:
+            # Dates carry a time of day, compare the day part only
+            clauses.append('substr(date, 1, 10) <= ?')
+            params.append(date_to)
+        if keyword:
+            escaped = keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            clauses.append("content LIKE ? ESCAPE '\\'")
+            params.append(f'%{escaped}%')
+        return ' AND '.join(clauses), params
+
+    def count_comments(self, subject_id, **filters):
+        """Number of comments matching the filters of query_comments."""
+        where, params = self._comment_filters(subject_id, **filters)
+        return self._connect().execute(f'SELECT COUNT(*) FROM comments WHERE {where}', params).fetchone()[0]
+
+    def query_comments(self, subject_id, limit=50, cursor=None, sort='default', **filters):
+        """
+        One page of comments matching the filters, using keyset pagination.
+        Returns (comments, next_cursor); next_cursor is None on the last page.
+        Cursors are opaque strings and only valid for the same sort.
+        """
+        expression, direction = COMMENT_SORTS[sort]
+        where, params = self._comment_filters(subject_id, **filters)
+        if cursor:
+            after_value, after_id = decode_cursor(cursor)
+            # Row values keep the order total when the sort key repeats
+            where += f" AND ({expression}, id) {'<' if direction == 'DESC' else '>'} (?, ?)"
+            params += [after_value, after_id]
+
+        rows = self._connect().execute(
+            f'SELECT id, {COMMENT_COLUMNS}, {expression} AS sort_key FROM comments WHERE {where} '
+            f'ORDER BY {expression} {direction}, id {direction} LIMIT ?',
+            params + [limit + 1]
+        ).fetchall()
+        comments = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = encode_cursor(comments[-1]['sort_key'], comments[-1]['id'])
+        for comment in comments:
+            del comment['sort_key']
+        return comments, next_cursor
+
+    def search_comments(self, match, subject_id=None, limit=20, offset=0):
+        """
+        Comments matching an FTS5 query over their tokens, best bm25 rank first.
+        Returns (comments, matched) where matched counts all hits.
+        """
+        where = 'comments_fts MATCH ?'
+        params = [match]
+        if subject_id is not None:
+            where += ' AND c.subject_id = ?'
+            params.append(subject_id)
+        conn = self._connect()
+        matched = conn.execute(
+            f'SELECT COUNT(*) FROM comments_fts JOIN comments c ON c.id = comments_fts.rowid WHERE {where}',
+            params
+        ).fetchone()[0]
+        rows = conn.execute(
+            f"""
+            SELECT c.id, c.subject_id, c.user, c.content, c.date, c.star, c.link,
+                   bm25(comments_fts) AS score
+            FROM comments_fts JOIN comments c ON c.id = comments_fts.rowid
+            WHERE {where}
+            ORDER BY score, c.id
+            LIMIT ? OFFSET ?
+            """,
+            params + [limit, offset]
+        ).fetchall()
+        return [dict(row) for row in rows], matched
+
+    def get_info(self, subject_id=None):
         """Retrieve only the movie info."""
-        return self.data.get('info', {})
+        subject_id = self._resolve(subject_id)
+        if subject_id is None:
+            return {}
+        row = self._connect().execute(
+            'SELECT * FROM movies WHERE subject_id = ?', (subject_id,)
+        ).fetchone()
+        return dict(row) if row else {}
 
-    def clear_data(self):
-        """Reset the storage."""
-        self.data = {
-            'info': {},
-            'comments': []
-        }
+    def list_movies(self):
+        """List stored movies, most recently crawled first."""
+        rows = self._connect().execute('SELECT * FROM movies ORDER BY crawled_at DESC')
+        return [dict(row) for row in rows]
+
+    def clear_data(self, subject_id=None):
+        """Delete one movie, or everything when subject_id is None."""
+        conn = self._connect()
+        with conn:
+            if subject_id is None:
+                conn.execute('DELETE FROM crawl_checkpoints')
+                conn.execute('DELETE FROM comments')
+                conn.execute('DELETE FROM movies')
+            else:
+                conn.execute('DELETE FROM crawl_checkpoints WHERE subject_id = ?', (subject_id,))
+                conn.execute('DELETE FROM comments WHERE subject_id = ?', (subject_id,))
+                conn.execute('DELETE FROM movies WHERE subject_id = ?', (subject_id,))
 
-    def generate_csv_stream(self):
-        """Generate a CSV file stream from the stored data."""
-        if not self.data['comments']:
-            return None
-            
+    def iter_comments(self, subject_id=None, batch_size=EXPORT_BATCH_SIZE):
+        """Yield stored comments one by one, fetching them from SQLite in batches."""
+        subject_id = self._resolve(subject_id)
+        if subject_id is None:
+            return
+        cursor = self._connect().execute(
+            f'SELECT {COMMENT_COLUMNS} FROM comments WHERE subject_id = ? ORDER BY id',
+            (subject_id,)
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+
+    def iter_csv(self, subject_id=None, batch_size=EXPORT_BATCH_SIZE):
+        """Generate a CSV export as utf-8-sig encoded chunks, one per batch of comments."""
+        info = self.get_info(subject_id)
         output = StringIO()
         writer = csv.writer(output)
-        
+
         # Write Info
-        writer.writerow(['电影名称', self.data['info'].get('title', '')])
-        writer.writerow(['评分', self.data['info'].get('rating', '')])
-        writer.writerow(['简介', self.data['info'].get('intro', '')])
+        writer.writerow(['电影名称', info.get('title', '')])
+        writer.writerow(['评分', info.get('rating', '')])
+        writer.writerow(['简介', info.get('intro', '')])
         writer.writerow([])
-        
+
         # Write Comments
         writer.writerow(['评论用户', '评论内容', '评分', '评论时间'])
-        for c in self.data['comments']:
+        # The BOM lets Excel detect the encoding
+        yield output.getvalue().encode('utf-8-sig')
+        output.seek(0)
+        output.truncate()
+
+        for index, c in enumerate(self.iter_comments(info.get('subject_id'), batch_size), 1):
             writer.writerow([
-                c.get('user', ''), 
-                c.get('content', ''), 
-                c.get('star', ''), 
+                c.get('user', ''),
+                c.get('content', ''),
+                c.get('star', ''),
                 c.get('date', '')
             ])
-            
-        bytes_output = BytesIO()
-        bytes_output.write(output.getvalue().encode('utf-8-sig'))
-        bytes_output.seek(0)
-        
-        return bytes_output
-
-    def save_to_json_file(self, filename='douban_data.json'):
-        """Save current data to a local JSON file."""
+            if index % batch_size == 0:
+                yield output.getvalue().encode('utf-8')
+                output.seek(0)
+                output.truncate()
+        if output.tell():
+            yield output.getvalue().encode('utf-8')
+
+    def iter_ndjson(self, subject_id=None, batch_size=EXPORT_BATCH_SIZE):
+        """Generate an NDJSON export (one comment object per line) in chunks."""
+        subject_id = self._resolve(subject_id)
+        lines = []
+        for c in self.iter_comments(subject_id, batch_size):
+            lines.append(json.dumps(dict(c, subject_id=subject_id), ensure_ascii=False))
+            if len(lines) >= batch_size:
+                yield ('\n'.join(lines) + '\n').encode('utf-8')
+                lines = []
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+    def save_to_json_file(self, filename='douban_data.json', subject_id=None):
+        """Save one movie's data to a local JSON file."""
         try:
             with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, ensure_ascii=False, indent=4)
+                json.dump(self.get_data(subject_id), f, ensure_ascii=False, indent=4)
             return True
         except Exception as e:
             print(f"Error saving to JSON: {e}")
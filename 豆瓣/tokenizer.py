@@ -0,0 +1,95 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from common.warmup import load_jieba
+
+# Below this many texts, shipping them to worker processes costs more than it saves
+PARALLEL_THRESHOLD = 2000
+CHUNK_SIZE = 500
+JIEBA_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+
+
+def _init_worker(cache_dir):
+    """Load jieba's prefix dictionary once when a worker process starts."""
+    load_jieba(cache_dir)
+
+
+def tokenize(text):
+    """Split one text into jieba tokens, dropping whitespace."""
+    # Imported on first use, jieba is slow to import and most requests never tokenize
+    import jieba
+
+    return [w for w in jieba.cut(text) if w.strip()]
+
+
+def _tokenize_chunk(texts):
+    return [tokenize(text) for text in texts]
+
+
+def _chunks(texts, size):
+    iterator = iter(texts)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Tokenizer:
+    """
+    jieba tokenization for large corpora.
+
+    Texts are split into chunks that are tokenized on a process pool, whose
+    workers load the dictionary once at startup, from the pickled copy in
+    cache_dir. Small inputs stay in-process. Word frequencies are counted by
+    streaming over iter_tokenized rather than merged from per-chunk counts, so
+    the token lists can also be stored.
+
+    Workers are spawned rather than forked: the parent runs other threads (the
+    fetcher loop, the jieba warm-up) whose locks a forked child could inherit
+    held. A spawned worker re-imports the script that started the pool as
+    __mp_main__, so that script and what it imports must not build services
+    outside the main process (douban.py checks the process name).
+    """
+
+    def __init__(self, workers=None, chunk_size=CHUNK_SIZE, parallel_threshold=PARALLEL_THRESHOLD,
+                 cache_dir=JIEBA_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.parallel_threshold = parallel_threshold
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_init_worker, initargs=(self.cache_dir,))
+                atexit.register(self.close)
+            return self._pool
+
+    def _parallel(self, texts):
+        return self.workers > 1 and len(texts) >= self.parallel_threshold
+
+    def iter_tokenized(self, texts):
+        """Yield the token list of each text, in order."""
+        texts = list(texts)
+        if not self._parallel(texts):
+            for text in texts:
+                yield tokenize(text)
+            return
+        for chunk_tokens in self._executor().map(_tokenize_chunk, _chunks(texts, self.chunk_size)):
+            yield from chunk_tokens
+
+    def close(self):
+        """Shut the worker processes down."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None